@@ -1,15 +1,17 @@
 import os
-from IPython.display import Image, display
-from langchain_core.runnables.graph import MermaidDrawMethod
-import nest_asyncio
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.document_loaders import WebBaseLoader
-from langchain_chroma import Chroma
-
-# Import local embedding models
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.llms import Ollama, GPT4All, LlamaCpp
-from langchain_community.chat_models import ChatOllama
+import uuid
+import shutil
+import tempfile
+import asyncio
+import hashlib
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from functools import lru_cache
+from langchain_core.embeddings import Embeddings
+
+# Heavier integrations (model backends, loaders, Chroma, IPython) are imported
+# inside the functions that use them so importing this module stays cheap
 
 # Function to get the LLM based on configuration
 def get_llm(provider="ollama", model_name="llama2", temperature=0, 
@@ -29,17 +31,21 @@ def get_llm(provider="ollama", model_name="llama2", temperature=0,
         A language model instance
     """
     if provider == 'ollama':
+        from langchain_community.chat_models import ChatOllama
         kwargs = {"model": model_name, "temperature": temperature}
         if api_base:
             kwargs["base_url"] = api_base
         return ChatOllama(**kwargs)
     elif provider == 'gpt4all':
+        from langchain_community.llms import GPT4All
         return GPT4All(
             model=model_path,
             temperature=temperature,
             max_tokens=max_tokens
         )
     elif provider == 'llama-cpp':
+        # Import here to avoid loading the llama.cpp extension if not used
+        from langchain_community.llms import LlamaCpp
         return LlamaCpp(
             model_path=model_path,
             temperature=temperature,
@@ -49,16 +55,106 @@ def get_llm(provider="ollama", model_name="llama2", temperature=0,
         )
     else:
         # Fallback to Ollama
+        from langchain_community.chat_models import ChatOllama
         return ChatOllama(model=model_name, temperature=temperature)
 
-# Function to get embeddings
-def get_embeddings(provider="ollama", model_name="nomic-embed-text"):
-    """Get embeddings model for vector search"""
+class MultiGPUEmbeddings(Embeddings):
+    """SentenceTransformer embeddings that shard document batches across all CUDA devices"""
+
+    def __init__(self, model_name, batch_size=64):
+        from sentence_transformers import SentenceTransformer
+        self.model = SentenceTransformer(model_name)
+        self.model_name = model_name
+        self.batch_size = batch_size
+        # One worker process per visible GPU
+        self.pool = self.model.start_multi_process_pool()
+        # The pool's input and output queues are shared, so concurrent encode calls
+        # could collect each other's chunks; only one call uses the pool at a time
+        self._pool_lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        import torch
+        with self._pool_lock, torch.inference_mode():
+            embeddings = self.model.encode_multi_process(
+                texts, self.pool, batch_size=self.batch_size, normalize_embeddings=True
+            )
+        return embeddings.tolist()
+
+    async def aembed_documents(self, texts):
+        # Concurrent batches wait on the pool lock in worker threads; the pool itself
+        # already spreads each batch across every GPU
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    def embed_query(self, text):
+        import torch
+        with torch.inference_mode():
+            return self.model.encode(text, normalize_embeddings=True).tolist()
+
+    def close(self):
+        """Stop the worker processes"""
+        self.model.stop_multi_process_pool(self.pool)
+
+def get_ollama_client_kwargs():
+    """HTTP client settings that keep enough pooled connections for concurrent embedding"""
+    import httpx
+    return {"limits": httpx.Limits(max_connections=EMBED_CONCURRENCY, max_keepalive_connections=EMBED_CONCURRENCY)}
+
+# Function to get embeddings (memoized so callers share one client per model)
+@lru_cache(maxsize=4)
+def get_embeddings(provider="ollama", model_name="nomic-embed-text", device="auto"):
+    """
+    Get embeddings model for vector search.
+    
+    Args:
+        provider: The provider of the embeddings (ollama, sentence-transformers,
+            sentence-transformers-mp for multi-GPU encoding)
+        model_name: Name of the embedding model to use
+        device: Device for local models ("auto" picks CUDA when available)
+        
+    Returns:
+        An embeddings instance
+    """
     if provider == "ollama":
-        return OllamaEmbeddings(model=model_name)
+        # langchain_ollama keeps one pooled HTTP client per instance instead of a new connection per call
+        from langchain_ollama import OllamaEmbeddings
+        return OllamaEmbeddings(model=model_name, client_kwargs=get_ollama_client_kwargs())
+    elif provider in ("sentence-transformers", "sentence-transformers-mp"):
+        # Import here so torch is only loaded when the GPU backend is requested
+        import torch
+        from langchain_community.embeddings import HuggingFaceEmbeddings
+        if model_name == "nomic-embed-text":
+            model_name = "sentence-transformers/all-MiniLM-L6-v2"
+        # Shard encoding across every GPU when more than one is available
+        if provider == "sentence-transformers-mp" and torch.cuda.device_count() > 1:
+            return MultiGPUEmbeddings(model_name)
+        if device == "auto":
+            device = "cuda" if torch.cuda.is_available() else "cpu"
+        return HuggingFaceEmbeddings(
+            model_name=model_name,
+            model_kwargs={"device": device},
+            encode_kwargs={"batch_size": 64, "normalize_embeddings": True}
+        )
     else:
         # Default to Ollama embeddings
-        return OllamaEmbeddings(model="nomic-embed-text")
+        from langchain_ollama import OllamaEmbeddings
+        return OllamaEmbeddings(model="nomic-embed-text", client_kwargs=get_ollama_client_kwargs())
+
+class CachedQueryEmbeddings(Embeddings):
+    """Embeddings wrapper that memoizes query embeddings so repeated queries skip the model"""
+
+    def __init__(self, embeddings, maxsize=1024):
+        self.embeddings = embeddings
+        self._embed_query = lru_cache(maxsize=maxsize)(embeddings.embed_query)
+
+    def embed_documents(self, texts):
+        return self.embeddings.embed_documents(texts)
+
+    async def aembed_documents(self, texts):
+        return await self.embeddings.aembed_documents(texts)
+
+    def embed_query(self, text):
+        # Return a copy so callers can't mutate the cached vector
+        return list(self._embed_query(text))
 
 # List of URLs containing LangGraph documentation
 # These URLs cover tutorials, concepts, and guides for the LangGraph framework
@@ -83,18 +179,318 @@ LANGGRAPH_DOCS = [
     "https://langchain-ai.github.io/langgraph/concepts/faq/"  # Frequently asked questions
 ]
 
-def get_langgraph_docs_retriever(persist_directory="langgraph-docs-db", embedding_model=None):
+# Number of chunks embedded and inserted into Chroma per call
+EMBED_BATCH_SIZE = 512
+# Maximum number of embedding requests in flight at once
+EMBED_CONCURRENCY = 8
+
+# Embedding models already sent a warmup request in this process, by id
+_WARMED_EMBEDDINGS = set()
+_WARMED_EMBEDDINGS_LOCK = threading.Lock()
+
+def warm_up_embeddings(embedding_model):
+    """Load the model into the backend once per process, before the first burst of requests"""
+    # Warm the wrapped model so every CachedQueryEmbeddings around it counts as warm
+    model = getattr(embedding_model, "embeddings", embedding_model)
+    with _WARMED_EMBEDDINGS_LOCK:
+        if id(model) in _WARMED_EMBEDDINGS:
+            return
+        # embed_documents bypasses the query cache so the warmup always reaches the backend
+        model.embed_documents(["warmup"])
+        _WARMED_EMBEDDINGS.add(id(model))
+
+def embed_texts(embedding_model, texts, batch_size=EMBED_BATCH_SIZE, concurrency=EMBED_CONCURRENCY):
+    """
+    Embed texts by issuing concurrent batched requests to the embedding backend.
+    
+    Batches run on a thread pool through the sync client, so no event loop is
+    created per build and the memoized client from get_embeddings is never tied
+    to a loop that has since been closed.
+    
+    Args:
+        embedding_model: Embedding model exposing embed_documents
+        texts: List of strings to embed
+        batch_size: Number of texts per embedding request
+        concurrency: Maximum number of requests in flight
+        
+    Returns:
+        List of embeddings in the same order as texts
+    """
+    warm_up_embeddings(embedding_model)
+    
+    batches = [texts[start:start + batch_size] for start in range(0, len(texts), batch_size)]
+    if not batches:
+        return []
+    with ThreadPoolExecutor(max_workers=min(len(batches), concurrency)) as pool:
+        # map keeps the batches in order
+        results = pool.map(embedding_model.embed_documents, batches)
+        return [embedding for batch in results for embedding in batch]
+
+def add_documents_in_batches(vectorstore, embedding_model, documents, batch_size=EMBED_BATCH_SIZE):
     """
-    Loads or creates a retriever for LangGraph documentation using a persisted Chroma vectorstore.
+    Embed documents outside of Chroma and insert them in fixed-size batches.
+    
+    Args:
+        vectorstore: The Chroma vectorstore to insert into
+        embedding_model: Embedding model used to embed the document contents
+        documents: List of Document objects to insert
+        batch_size: Number of documents embedded and inserted per batch
+    """
+    texts = [doc.page_content for doc in documents]
+    
+    # Embed all chunks concurrently before inserting
+    embeddings = embed_texts(embedding_model, texts, batch_size)
+    
+    for start in range(0, len(documents), batch_size):
+        end = start + batch_size
+        # Pass precomputed embeddings so Chroma only has to store the vectors
+        vectorstore._collection.add(
+            ids=[str(uuid.uuid4()) for _ in documents[start:end]],
+            embeddings=embeddings[start:end],
+            documents=texts[start:end],
+            metadatas=[doc.metadata or None for doc in documents[start:end]]
+        )
+
+def build_faiss_vectorstore(embedding_model, documents, quantize=False):
+    """
+    Build an exact inner-product FAISS vectorstore from documents.
+    
+    Vectors are L2-normalized so inner product equals cosine similarity. For small
+    corpora a flat index is exact and needs no graph construction.
+    
+    Args:
+        embedding_model: Embedding model used to embed the document contents
+        documents: List of Document objects to index
+        quantize: Store vectors as 8-bit scalar-quantized codes (~4x smaller)
+        
+    Returns:
+        A FAISS vectorstore
+    """
+    import faiss
+    import numpy as np
+    
+    vectors = np.array(embed_texts(embedding_model, [doc.page_content for doc in documents]), dtype="float32")
+    faiss.normalize_L2(vectors)
+    
+    dim = vectors.shape[1]
+    if quantize:
+        index = faiss.IndexScalarQuantizer(dim, faiss.ScalarQuantizer.QT_8bit, faiss.METRIC_INNER_PRODUCT)
+        index.train(vectors)
+    else:
+        index = faiss.IndexFlatIP(dim)
+    index.add(vectors)
+    
+    return make_faiss_vectorstore(embedding_model, index, documents)
+
+def make_faiss_vectorstore(embedding_model, index, documents):
+    """Wrap an inner-product FAISS index over normalized vectors and its documents (in index order)"""
+    from langchain_community.docstore.in_memory import InMemoryDocstore
+    from langchain_community.vectorstores import FAISS
+    from langchain_community.vectorstores.utils import DistanceStrategy
+    
+    ids = [str(uuid.uuid4()) for _ in documents]
+    return FAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=InMemoryDocstore(dict(zip(ids, documents))),
+        index_to_docstore_id=dict(enumerate(ids)),
+        normalize_L2=True,  # Normalize query vectors to match the indexed ones
+        distance_strategy=DistanceStrategy.MAX_INNER_PRODUCT
+    )
+
+# Files a persisted FAISS docs vectorstore is made of
+FAISS_INDEX_FILENAME = "index.faiss"
+FAISS_DOCSTORE_FILENAME = "docstore.json"
+
+def save_faiss_vectorstore(vectorstore, directory):
+    """
+    Persist a FAISS vectorstore as its native index file plus a JSON docstore.
+    
+    Unlike save_local, nothing is pickled, so loading the store can't run code
+    planted by whoever could write to the directory.
+    """
+    import faiss
+    
+    faiss.write_index(vectorstore.index, os.path.join(directory, FAISS_INDEX_FILENAME))
+    documents = [
+        vectorstore.docstore.search(vectorstore.index_to_docstore_id[position])
+        for position in range(vectorstore.index.ntotal)
+    ]
+    with open(os.path.join(directory, FAISS_DOCSTORE_FILENAME), "w", encoding="utf-8") as f:
+        json.dump(
+            [{"page_content": doc.page_content, "metadata": doc.metadata} for doc in documents], f
+        )
+
+def load_faiss_vectorstore(directory, embedding_model):
+    """Load a FAISS vectorstore written by save_faiss_vectorstore"""
+    import faiss
+    from langchain_core.documents import Document
+    
+    index = faiss.read_index(os.path.join(directory, FAISS_INDEX_FILENAME))
+    with open(os.path.join(directory, FAISS_DOCSTORE_FILENAME), encoding="utf-8") as f:
+        documents = [Document(**entry) for entry in json.load(f)]
+    return make_faiss_vectorstore(embedding_model, index, documents)
+
+# HNSW index settings for the docs collection (approximate nearest-neighbour search)
+# Note: Chroma always persists float32 vectors, so pre-quantizing embeddings to int8
+# would only lose precision; use the faiss backend with quantize=True instead
+HNSW_COLLECTION_METADATA = {
+    "hnsw:space": "cosine",
+    "hnsw:construction_ef": 200,
+    "hnsw:M": 32,
+    "hnsw:search_ef": 64,
+}
+
+# Chunking configuration used when splitting the documentation
+DOCS_CHUNK_SIZE = 512
+DOCS_CHUNK_OVERLAP = 64
+
+# Sentinel file recording which corpus a persisted vectorstore was built from
+SIGNATURE_FILENAME = ".sig"
+
+# Retrievers already opened in this process, keyed by every argument that shapes them
+# (see get_langgraph_docs_retriever)
+_RETRIEVERS = {}
+_RETRIEVERS_LOCK = threading.Lock()
+
+def describe_embeddings(embedding_model):
+    """Identify an embedding model by its provider class and model name"""
+    # Describe the wrapped model; CachedQueryEmbeddings doesn't change the vectors
+    model = getattr(embedding_model, "embeddings", embedding_model)
+    model_name = getattr(model, "model", None)
+    if not isinstance(model_name, str):
+        model_name = getattr(model, "model_name", None)
+    return f"{type(model).__module__}.{type(model).__name__}:{model_name}"
+
+def get_docs_signature(chunk_size=DOCS_CHUNK_SIZE, chunk_overlap=DOCS_CHUNK_OVERLAP, backend="faiss", quantize=False,
+                       embeddings_id=""):
+    """Hash the inputs that determine the contents of the docs vectorstore"""
+    content = "\n".join(LANGGRAPH_DOCS) + f"\n{chunk_size}:{chunk_overlap}:{backend}:{quantize}:{embeddings_id}"
+    return hashlib.md5(content.encode()).hexdigest()
+
+def read_docs_signature(persist_directory):
+    """Read the signature stored alongside a persisted vectorstore, if any"""
+    try:
+        with open(os.path.join(persist_directory, SIGNATURE_FILENAME)) as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+# Tokenizer used to measure chunk sizes (the encoding from_tiktoken_encoder defaults to)
+TIKTOKEN_ENCODING = "gpt2"
+
+@lru_cache(maxsize=None)
+def get_tiktoken_encoder(encoding_name=TIKTOKEN_ENCODING):
+    """
+    Get a shared tiktoken encoder, loading its BPE table only once per process.
+    
+    Created lazily rather than at import so each process-pool worker builds its own.
+    """
+    import tiktoken
+    return tiktoken.get_encoding(encoding_name)
+
+def count_tokens(text):
+    """Count tokens in text using the shared tiktoken encoder"""
+    return len(get_tiktoken_encoder().encode(text))
+
+def split_documents(docs, chunk_size=DOCS_CHUNK_SIZE, chunk_overlap=DOCS_CHUNK_OVERLAP):
+    """
+    Split documents into token-sized chunks.
+    
+    Defined at module level so it can run in a worker process.
+    """
+    from langchain.text_splitter import RecursiveCharacterTextSplitter
+    
+    text_splitter = RecursiveCharacterTextSplitter(
+        chunk_size=chunk_size,  # Maximum tokens per chunk
+        chunk_overlap=chunk_overlap,  # Tokens shared between neighbouring chunks to preserve context
+        length_function=count_tokens  # Measure chunks in tokens with the shared encoder
+    )
+    return text_splitter.split_documents(docs)
+
+# Maximum number of documentation pages downloaded at once
+MAX_DOWNLOAD_WORKERS = 16
+
+def load_and_split_docs(urls=LANGGRAPH_DOCS, chunk_size=DOCS_CHUNK_SIZE, chunk_overlap=DOCS_CHUNK_OVERLAP):
+    """
+    Download documentation pages and split them into chunks.
+    
+    Downloads run concurrently in threads; each page is handed to a process pool
+    for splitting as soon as it arrives, so CPU-bound splitting overlaps the I/O.
+    
+    Args:
+        urls: URLs of the pages to load
+        chunk_size: Maximum tokens per chunk
+        chunk_overlap: Tokens shared between neighbouring chunks
+        
+    Returns:
+        List of document chunks, ordered by URL
+    """
+    from langchain_community.document_loaders import WebBaseLoader
+    
+    with ThreadPoolExecutor(max_workers=max(1, min(len(urls), MAX_DOWNLOAD_WORKERS))) as downloads, ProcessPoolExecutor() as splits:
+        download_futures = {downloads.submit(lambda url=url: WebBaseLoader(url).load()): url for url in urls}
+        split_futures = {}
+        for future in as_completed(download_futures):
+            split_futures[download_futures[future]] = splits.submit(
+                split_documents, future.result(), chunk_size, chunk_overlap
+            )
+        # Reassemble in URL order so the chunk order is deterministic
+        return [chunk for url in urls for chunk in split_futures[url].result()]
+
+def get_langgraph_docs_retriever(persist_directory="langgraph-docs-db", embedding_model=None,
+                                 collection_metadata=None, k=4,
+                                 chunk_size=DOCS_CHUNK_SIZE, chunk_overlap=DOCS_CHUNK_OVERLAP,
+                                 backend="faiss", quantize=False):
+    """
+    Get a retriever for LangGraph documentation, reusing the one already opened in this process.
+    
+    Arguments are the same as load_or_build_docs_retriever. Concurrent first calls are
+    serialized so the vectorstore is only opened (or built) once.
+    """
+    # Embedding models are keyed by identity (None is the shared default from
+    # get_embeddings); the cached retriever holds a reference, so ids aren't reused
+    key = (
+        persist_directory, k,
+        None if embedding_model is None else id(embedding_model),
+        None if collection_metadata is None else tuple(sorted(collection_metadata.items())),
+        chunk_size, chunk_overlap, backend, quantize,
+    )
+    # Fast path without locking once the retriever exists
+    if key in _RETRIEVERS:
+        return _RETRIEVERS[key]
+    with _RETRIEVERS_LOCK:
+        if key not in _RETRIEVERS:
+            _RETRIEVERS[key] = load_or_build_docs_retriever(
+                persist_directory, embedding_model, collection_metadata, k,
+                chunk_size, chunk_overlap, backend, quantize
+            )
+        return _RETRIEVERS[key]
+
+def load_or_build_docs_retriever(persist_directory="langgraph-docs-db", embedding_model=None,
+                                 collection_metadata=None, k=4,
+                                 chunk_size=DOCS_CHUNK_SIZE, chunk_overlap=DOCS_CHUNK_OVERLAP,
+                                 backend="faiss", quantize=False):
+    """
+    Loads or creates a retriever for LangGraph documentation using a persisted vectorstore.
     
     This function implements a caching mechanism:
-    1. If a vectorstore already exists on disk, it loads and returns it
-    2. If no vectorstore exists, it downloads the documentation, creates embeddings,
-       stores them in a vectorstore, and persists it to disk for future use
+    1. If a vectorstore built from the current URLs and chunking exists on disk, it loads it
+    2. Otherwise it downloads the documentation, creates embeddings, stores them in a
+       vectorstore built in a temporary directory, and moves it to persist_directory
+       along with a content-hash sentinel. An existing directory is only replaced if it
+       is empty or holds an earlier build (has the sentinel)
 
     Args:
         persist_directory: Directory to persist the vectorstore
         embedding_model: Embedding model to use (defaults to Ollama if None)
+        collection_metadata: Chroma collection metadata (defaults to HNSW_COLLECTION_METADATA)
+        k: Number of documents returned per query
+        chunk_size: Maximum tokens per document chunk
+        chunk_overlap: Tokens shared between neighbouring chunks
+        backend: Vectorstore backend, "faiss" (exact flat index, suited to small corpora)
+            or "chroma" (persistent HNSW index)
+        quantize: Store 8-bit quantized vectors (faiss backend only)
         
     Returns:
         Retriever: A retriever object for querying the LangGraph documentation using similarity search
@@ -102,61 +498,152 @@ def get_langgraph_docs_retriever(persist_directory="langgraph-docs-db", embeddin
     # Use provided embedding model or get default
     if embedding_model is None:
         embedding_model = get_embeddings()
+    
+    # Memoize query embeddings so repeated questions don't hit the embedding model again
+    if not isinstance(embedding_model, CachedQueryEmbeddings):
+        embedding_model = CachedQueryEmbeddings(embedding_model)
+    
+    if collection_metadata is None:
+        collection_metadata = HNSW_COLLECTION_METADATA
         
-    # Check if the vectorstore directory already exists on disk
+    # Check if a complete vectorstore for the current corpus already exists on disk
     # This allows us to skip the expensive document loading and embedding process
-    if os.path.exists(persist_directory):
+    # Vectors from another provider or model (possibly of another dimension) can't be reused
+    signature = get_docs_signature(
+        chunk_size, chunk_overlap, backend, quantize, describe_embeddings(embedding_model)
+    )
+    if read_docs_signature(persist_directory) == signature:
         print("Loading vectorstore from disk...")
-        # Load the existing vectorstore from the persistent directory
-        vectorstore = Chroma(
-            collection_name="langgraph-docs",  # Name of the collection in the vectorstore
-            embedding_function=embedding_model,  # Embedding model for query encoding
-            persist_directory=persist_directory  # Directory where the vectorstore is saved
-        )
-        # Return a retriever interface for the vectorstore
-        # lambda_mult=0 disables the MMR (Maximum Marginal Relevance) diversity filter
-        return vectorstore.as_retriever(lambda_mult=0)
+        vectorstore = open_docs_vectorstore(persist_directory, embedding_model, collection_metadata, backend)
+        # Return a retriever interface for the vectorstore, capped at k results
+        return vectorstore.as_retriever(search_kwargs={"k": k})
 
     # If vectorstore doesn't exist, create it from scratch
     print("Creating new vectorstore from documentation...")
     
-    # Download and load documents from each URL in LANGGRAPH_DOCS
-    # WebBaseLoader fetches the content from web pages and converts them to Document objects
-    docs = [WebBaseLoader(url).load() for url in LANGGRAPH_DOCS]
+    # Only a directory this function created (it holds the sentinel) or an empty one
+    # may be replaced; refuse rather than delete anything else at the given path
+    if os.path.isdir(persist_directory) and os.listdir(persist_directory) \
+            and read_docs_signature(persist_directory) is None:
+        raise ValueError(
+            f"{persist_directory} exists and is not a docs vectorstore; choose another persist_directory"
+        )
     
-    # Flatten the list of lists into a single list of documents
-    # Each WebBaseLoader.load() returns a list, so we need to flatten the nested structure
-    docs_list = [item for sublist in docs for item in sublist]
+    # Build into a fresh directory beside the target and move it into place once
+    # complete, so an interrupted build never leaves a half-written store behind
+    parent = os.path.dirname(os.path.abspath(persist_directory))
+    build_directory = tempfile.mkdtemp(prefix=".langgraph-docs-build-", dir=parent)
+    try:
+        # Download each URL in LANGGRAPH_DOCS and split the pages into chunks
+        # Larger, overlapping chunks keep the embed count down without losing context at boundaries
+        doc_splits = load_and_split_docs(LANGGRAPH_DOCS, chunk_size, chunk_overlap)
+        
+        if backend == "faiss":
+            # Embed the chunks and build an exact FAISS index, then persist it
+            vectorstore = build_faiss_vectorstore(embedding_model, doc_splits, quantize=quantize)
+            save_faiss_vectorstore(vectorstore, build_directory)
+        else:
+            from langchain_chroma import Chroma
+            
+            # Create a new Chroma vectorstore with the specified configuration
+            vectorstore = Chroma(
+                collection_name="langgraph-docs",  # Name of the collection
+                embedding_function=embedding_model,  # Embedding model for converting text to vectors
+                persist_directory=build_directory,  # Directory to persist the vectorstore
+                collection_metadata=collection_metadata  # HNSW index configuration
+            )
+            
+            # Add the split documents to the vectorstore
+            # This creates embeddings for each chunk and stores them in the vector database in batches
+            add_documents_in_batches(vectorstore, embedding_model, doc_splits)
+        
+        with open(os.path.join(build_directory, SIGNATURE_FILENAME), "w") as f:
+            f.write(signature)
+        
+        # Swap the finished build in for the stale store (ours, checked above) or empty directory
+        if os.path.isdir(persist_directory):
+            shutil.rmtree(persist_directory)
+        os.replace(build_directory, persist_directory)
+    except BaseException:
+        shutil.rmtree(build_directory, ignore_errors=True)
+        raise
+    print("Vectorstore created and persisted to disk")
     
-    # Split documents into smaller chunks for better retrieval performance
-    # Smaller chunks allow for more precise similarity matching
-    text_splitter = RecursiveCharacterTextSplitter.from_tiktoken_encoder(
-        chunk_size=200,  # Maximum tokens per chunk (small chunks for precise retrieval)
-        chunk_overlap=0  # No overlap between chunks to avoid redundancy
-    )
-    doc_splits = text_splitter.split_documents(docs_list)
+    # Chroma keeps its database open at the build path, so reopen it where it now lives
+    if backend != "faiss":
+        vectorstore = open_docs_vectorstore(persist_directory, embedding_model, collection_metadata, backend)
     
-    # Create a new Chroma vectorstore with the specified configuration
-    vectorstore = Chroma(
-        collection_name="langgraph-docs",  # Name of the collection
-        embedding_function=embedding_model,  # Embedding model for converting text to vectors
-        persist_directory=persist_directory  # Directory to persist the vectorstore
+    # Return a retriever interface for the new vectorstore, capped at k results
+    return vectorstore.as_retriever(search_kwargs={"k": k})
+
+def open_docs_vectorstore(persist_directory, embedding_model, collection_metadata, backend):
+    """Open a docs vectorstore persisted by load_or_build_docs_retriever"""
+    if backend == "faiss":
+        return load_faiss_vectorstore(persist_directory, embedding_model)
+    
+    from langchain_chroma import Chroma
+    # Load the existing vectorstore from the persistent directory
+    return Chroma(
+        collection_name="langgraph-docs",  # Name of the collection in the vectorstore
+        embedding_function=embedding_model,  # Embedding model for query encoding
+        persist_directory=persist_directory,  # Directory where the vectorstore is saved
+        collection_metadata=collection_metadata  # HNSW index configuration
     )
+
+# Directory where rendered mermaid diagrams are cached between sessions
+MERMAID_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "agents", "mermaid")
+
+# Rendered PNGs already produced in this process, keyed by mermaid source hash
+_MERMAID_PNGS = {}
+
+def render_mermaid_png(drawable_graph):
+    """
+    Render a drawable graph to PNG bytes, reusing earlier renders of the same diagram.
     
-    # Add the split documents to the vectorstore
-    # This creates embeddings for each chunk and stores them in the vector database
-    vectorstore.add_documents(doc_splits)
-    print("Vectorstore created and persisted to disk")
+    Renders are cached in memory and on disk, keyed by a hash of the mermaid source,
+    so only diagrams that have never been drawn before hit a renderer.
+    """
+    key = hashlib.sha1(drawable_graph.draw_mermaid().encode()).hexdigest()
+    if key in _MERMAID_PNGS:
+        return _MERMAID_PNGS[key]
     
-    # Return a retriever interface for the new vectorstore
-    return vectorstore.as_retriever(lambda_mult=0)
+    cache_path = os.path.join(MERMAID_CACHE_DIR, f"{key}.png")
+    if os.path.exists(cache_path):
+        with open(cache_path, "rb") as f:
+            png = f.read()
+    else:
+        try:
+            # Try the default mermaid renderer first (uses mermaid.ink service)
+            # This is the fastest option but may fail due to network issues or service unavailability
+            png = drawable_graph.draw_mermaid_png()
+        except Exception as e:
+            # If the default renderer fails, fall back to pyppeteer
+            # pyppeteer uses a local headless Chrome instance to render the diagram
+            print(f"Default renderer failed ({e}), falling back to pyppeteer...")
+            
+            # Apply nest_asyncio to handle async operations in Jupyter environments
+            # This is necessary because pyppeteer uses async operations
+            import nest_asyncio
+            from langchain_core.runnables.graph import MermaidDrawMethod
+            nest_asyncio.apply()
+            
+            # Use pyppeteer as the drawing method (local rendering)
+            png = drawable_graph.draw_mermaid_png(draw_method=MermaidDrawMethod.PYPPETEER)
+        
+        os.makedirs(MERMAID_CACHE_DIR, exist_ok=True)
+        with open(cache_path, "wb") as f:
+            f.write(png)
+    
+    _MERMAID_PNGS[key] = png
+    return png
 
 def show_graph(graph, xray=False):
     """
     Display a LangGraph mermaid diagram with fallback rendering.
     
     This function attempts to render a LangGraph as a visual diagram using Mermaid.
-    It includes error handling to fall back to an alternative renderer if the default fails.
+    It includes error handling to fall back to an alternative renderer if the default fails,
+    and caches rendered diagrams so repeated calls don't re-render.
     
     Args:
         graph: The LangGraph object that has a get_graph() method for visualization
@@ -167,22 +654,4 @@ def show_graph(graph, xray=False):
     """
     from IPython.display import Image
     
-    try:
-        # Try the default mermaid renderer first (uses mermaid.ink service)
-        # This is the fastest option but may fail due to network issues or service unavailability
-        return Image(graph.get_graph(xray=xray).draw_mermaid_png())
-    except Exception as e:
-        # If the default renderer fails, fall back to pyppeteer
-        # pyppeteer uses a local headless Chrome instance to render the diagram
-        print(f"Default renderer failed ({e}), falling back to pyppeteer...")
-        
-        # Apply nest_asyncio to handle async operations in Jupyter environments
-        # This is necessary because pyppeteer uses async operations
-        import nest_asyncio
-        nest_asyncio.apply()
-        
-        # Import the MermaidDrawMethod enum for specifying the draw method
-        from langchain_core.runnables.graph import MermaidDrawMethod
-        
-        # Use pyppeteer as the drawing method (local rendering)
-        return Image(graph.get_graph().draw_mermaid_png(draw_method=MermaidDrawMethod.PYPPETEER))
\ No newline at end of file
+    return Image(render_mermaid_png(graph.get_graph(xray=xray)))
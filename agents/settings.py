@@ -62,13 +62,20 @@ TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
         'DIRS': [os.path.join(BASE_DIR, 'templates')],
-        'APP_DIRS': True,
         'OPTIONS': {
             'context_processors': [
                 'django.template.context_processors.request',
                 'django.contrib.auth.context_processors.auth',
                 'django.contrib.messages.context_processors.messages',
             ],
+            # Compile each template once per process, also with DEBUG on (the
+            # development server still reloads templates when they change)
+            'loaders': [
+                ('django.template.loaders.cached.Loader', [
+                    'django.template.loaders.filesystem.Loader',
+                    'django.template.loaders.app_directories.Loader',
+                ]),
+            ],
         },
     },
 ]
@@ -135,9 +142,37 @@ REST_FRAMEWORK = {
         'rest_framework.permissions.IsAuthenticated',
     ],
     'DEFAULT_PAGINATION_CLASS': 'rest_framework.pagination.PageNumberPagination',
-    'PAGE_SIZE': 10
+    'PAGE_SIZE': 10,
+    # Rates for the throttled endpoints: each chat message costs an agent run
+    'DEFAULT_THROTTLE_RATES': {
+        'chat': '10/min',
+        'system_info': '30/min',
+        # Login attempts per client IP
+        'login': os.environ.get('LOGIN_THROTTLE_RATE', '5/min'),
+    }
 }
 
+# Cache shared by all web and worker processes
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('CACHE_URL', 'redis://localhost:6379/1'),
+    }
+}
+
+# Celery settings: agent runs are queued on Redis and executed by worker processes
+CELERY_BROKER_URL = os.environ.get('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+CELERY_TASK_SERIALIZER = 'json'
+CELERY_ACCEPT_CONTENT = ['json']
+# Agent task states (queued/running/completed/failed) and replies, read by the task status endpoint
+AGENT_TASK_STATE_URL = os.environ.get('AGENT_TASK_STATE_URL', CELERY_BROKER_URL)
+AGENT_TASK_STATE_TTL = 60 * 60 * 24
+# LangGraph checkpoints (conversation state, pending interrupts), shared by all
+# processes on the host; set to an empty string to keep them in memory per process
+LANGGRAPH_CHECKPOINT_PATH = os.environ.get(
+    'LANGGRAPH_CHECKPOINT_PATH', os.path.join(BASE_DIR, 'data', 'checkpoints.sqlite')
+)
+
 # Create data directories
 os.makedirs(os.path.join(BASE_DIR, 'data'), exist_ok=True)
 
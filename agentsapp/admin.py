@@ -1,6 +1,10 @@
+from collections import Counter
+
 from django.contrib import admin
 from django.contrib.auth.admin import UserAdmin as BaseUserAdmin
 from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.functions import Substr
 from .models import (
     LLMModel, Tool, AgentType, UserProfile, UserPreference, 
     Conversation, Message, AgentConfig, Database
@@ -11,10 +15,16 @@ def bulk_delete_users(modeladmin, request, queryset):
     """Bulk delete users, but prevent deleting superusers"""
     # Filter out superusers
     regular_users = queryset.filter(is_superuser=False)
-    deleted_count = regular_users.count()
     
-    # Delete the regular users
-    regular_users.delete()
+    with transaction.atomic():
+        # Remove the bulky dependent rows with plain DELETEs so the cascade
+        # collector doesn't have to load every message and preference first
+        Message.objects.filter(conversation__user__in=regular_users)._raw_delete(Message.objects.db)
+        UserPreference.objects.filter(profile__user__in=regular_users)._raw_delete(UserPreference.objects.db)
+        
+        # Delete the regular users (cascades to the remaining related rows)
+        _, deleted_per_model = regular_users.delete()
+    deleted_count = deleted_per_model.get(User._meta.label, 0)
     
     modeladmin.message_user(
         request, 
@@ -55,20 +65,49 @@ class AgentTypeAdmin(admin.ModelAdmin):
 @admin.register(UserProfile)
 class UserProfileAdmin(admin.ModelAdmin):
     list_display = ('user', 'customer_id')
+    list_select_related = ('user',)
     search_fields = ('user__username', 'customer_id')
 
 
 @admin.register(UserPreference)
 class UserPreferenceAdmin(admin.ModelAdmin):
     list_display = ('profile', 'preference_type', 'value')
+    # UserPreference and UserProfile __str__ both read the username
+    list_select_related = ('profile__user',)
     list_filter = ('preference_type',)
     search_fields = ('profile__user__username', 'value')
 
 
+# Number of characters of message content shown in admin previews
+PREVIEW_LENGTH = 50
+
+
+def with_content_preview(queryset):
+    """Truncate message content in the database instead of loading the full column"""
+    return queryset.annotate(preview=Substr('content', 1, PREVIEW_LENGTH + 1)).defer('content')
+
+
+def format_content_preview(preview):
+    return preview[:PREVIEW_LENGTH] + ('...' if len(preview) > PREVIEW_LENGTH else '')
+
+
 class MessageInline(admin.TabularInline):
     model = Message
     extra = 0
-    readonly_fields = ('created_at',)
+    fields = ('role', 'content_preview', 'created_at')
+    readonly_fields = ('content_preview', 'created_at')
+    show_change_link = True
+    
+    def get_queryset(self, request):
+        return with_content_preview(super().get_queryset(request))
+    
+    def has_add_permission(self, request, obj=None):
+        # Messages are added through MessageAdmin, the inline only previews them
+        return False
+    
+    def content_preview(self, obj):
+        return format_content_preview(obj.preview)
+    content_preview.short_description = 'Content'
 
 
 @admin.register(Conversation)
@@ -76,8 +115,15 @@ class ConversationAdmin(admin.ModelAdmin):
     list_display = ('title', 'user', 'thread_id', 'created_at', 'updated_at', 'agent_info')
     list_filter = ('created_at', 'updated_at')
     search_fields = ('title', 'user__username', 'thread_id')
+    list_select_related = ('user',)
     inlines = [MessageInline]
     
+    def get_queryset(self, request):
+        """Fetch only the columns the changelist renders"""
+        return super().get_queryset(request).only(
+            'title', 'user__username', 'thread_id', 'created_at', 'updated_at', 'metadata'
+        )
+    
     def agent_info(self, obj):
         """Display agent information from metadata"""
         if not hasattr(obj, 'metadata'):
@@ -88,13 +134,10 @@ class ConversationAdmin(admin.ModelAdmin):
             return "No agent data"
             
         # Count agent usage
-        agent_counts = {}
-        for entry in metadata['agent_history']:
-            agent_type = entry.get('agent_type', 'unknown')
-            agent_counts[agent_type] = agent_counts.get(agent_type, 0) + 1
+        agent_counts = Counter(entry.get('agent_type', 'unknown') for entry in metadata['agent_history'])
             
         # Format as string
-        return ", ".join([f"{a}: {c}" for a, c in agent_counts.items()])
+        return ", ".join(f"{a}: {c}" for a, c in agent_counts.items())
     
     agent_info.short_description = 'Agent Usage'
 
@@ -104,15 +147,20 @@ class MessageAdmin(admin.ModelAdmin):
     list_display = ('conversation', 'role', 'content_preview', 'created_at')
     list_filter = ('role', 'created_at')
     search_fields = ('content', 'conversation__thread_id')
+    list_select_related = ('conversation__user',)
+    
+    def get_queryset(self, request):
+        return with_content_preview(super().get_queryset(request))
     
     def content_preview(self, obj):
-        return obj.content[:50] + ('...' if len(obj.content) > 50 else '')
+        return format_content_preview(obj.preview)
     content_preview.short_description = 'Content'
 
 
 @admin.register(AgentConfig)
 class AgentConfigAdmin(admin.ModelAdmin):
     list_display = ('name', 'agent_type', 'llm_model', 'is_active')
+    list_select_related = ('agent_type', 'llm_model')
     list_filter = ('is_active', 'agent_type')
     search_fields = ('name',)
     filter_horizontal = ('tools',)
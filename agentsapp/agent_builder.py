@@ -1,22 +1,130 @@
-import uuid
+import os
+import re
+import traceback
+import asyncio
+import threading
+from functools import lru_cache, wraps
+
+from cachetools.func import ttl_cache
+from tenacity import retry, stop_after_attempt
+
+try:
+    import ahocorasick
+except ImportError:  # pyahocorasick is optional; genre matching falls back to a regex
+    ahocorasick = None
 from typing import Optional, Dict, Any
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 
-from langchain_core.messages import SystemMessage, HumanMessage, AnyMessage, AIMessage
+from langchain_core.messages import SystemMessage, HumanMessage, AnyMessage, AIMessage, AIMessageChunk
 from langchain_core.runnables import RunnableConfig
-from langchain_core.tools import BaseTool
+from langchain_core.tools import BaseTool, Tool
 
 from langgraph.graph import StateGraph, START, END
 from langgraph.types import interrupt, Command
+from langgraph.errors import GraphBubbleUp
 
+from .models import uuid7
 from .utils import (
     State, get_llm, get_db_connection, get_checkpointer, get_memory_store,
-    load_user_memory, save_user_memory, get_customer_id_from_identifier,
+    load_user_memory, queue_user_memory, set_loaded_memory, get_loaded_memory, get_customer_id_from_identifier,
     get_albums_by_artist, get_tracks_by_artist, get_songs_by_genre, check_for_songs,
     get_invoices_by_customer_sorted_by_date, get_invoices_sorted_by_unit_price, 
-    get_employee_by_invoice_and_customer, create_supervisor
+    get_employee_by_invoice_and_customer, create_supervisor, select_agent_domains,
+    clear_client_caches
+)
+
+
+# Shared "no state change" node result
+_EMPTY = {}
+
+# Constant replies, built once. Nodes return copies because add_messages assigns an
+# id to each message it merges, and a shared instance would then replace itself
+# on later turns instead of being appended.
+_MUSIC_HELP_MSG = AIMessage(content="I can help you find information about music in our catalog. You can ask about artists, albums, songs, or genres.")
+_MUSIC_ERROR_MSG = AIMessage(content="I'm sorry, I'm having trouble processing your music-related request right now. Please try again later.")
+_INVOICE_ERROR_MSG = AIMessage(content="I'm sorry, I'm having trouble processing your invoice-related request right now. Please try again later.")
+_VERIFIED_MSG = SystemMessage(content="Thank you for contacting us! I'll help you with your request. Using account ID 1.")
+_VERIFY_ERROR_MSG = SystemMessage(content="I'm experiencing technical difficulties, but I'll help you with a test account.")
+_SUPERVISOR_ERROR_MSG = AIMessage(content="I'm sorry, I'm having trouble processing your request right now. Please try again later.")
+
+# Patterns and keyword sets for the keyword-based routing, compiled once at import
+_CAPWORD_RE = re.compile(r'\b[A-Z][a-z]*\b')
+_TOKEN_RE = re.compile(r'\w+')
+# Every routing keyword in one alternation, so intent detection is a single scan
+# (an optional plural "s" keeps "albums", "songs", ... matching as before)
+_INTENT_RE = re.compile(
+    r'\b(artist|album|genre|song|track|price|expensive|employee|support|invoice)s?\b',
+    re.IGNORECASE,
 )
 
+# Genres recognised when extracting music preferences, in reporting order
+GENRES = ("rock", "pop", "jazz", "classical", "hip hop", "rap", "country",
+          "blues", "electronic", "dance", "metal", "folk", "indie")
+# Multi-word genres such as "hip hop" can't come from a single token, so
+# match whole genre names in one regex pass instead of a frozenset lookup
+_GENRE_RE = re.compile(r'\b(?:' + '|'.join(sorted(map(re.escape, GENRES), key=len, reverse=True)) + r')\b')
+
+
+def _build_genre_automaton():
+    """Compile GENRES into an Aho-Corasick automaton, or return None without pyahocorasick."""
+    if ahocorasick is None:
+        return None
+    automaton = ahocorasick.Automaton()
+    for genre in GENRES:
+        automaton.add_word(genre, genre)
+    automaton.make_automaton()
+    return automaton
+
+
+_GENRE_AC = _build_genre_automaton()
+
+
+def _is_word_char(c):
+    return c.isalnum() or c == "_"
+
+
+def find_genres(text: str) -> set[str]:
+    """
+    Find the genres named in a lowercased text in a single pass.
+    
+    Args:
+        text: Lowercased text to scan
+        
+    Returns:
+        Set of genres that appear as whole words
+    """
+    if _GENRE_AC is None:
+        return set(_GENRE_RE.findall(text))
+    
+    # The automaton matches substrings, so keep only hits on word boundaries
+    # (e.g. not "rap" inside "grape")
+    found = set()
+    last = len(text) - 1
+    for end, genre in _GENRE_AC.iter(text):
+        start = end - len(genre) + 1
+        if start > 0 and _is_word_char(text[start - 1]):
+            continue
+        if end < last and _is_word_char(text[end + 1]):
+            continue
+        found.add(genre)
+    return found
+
+
+MUSIC_TOOLS_BY_NAME = {
+    tool.name: tool
+    for tool in (get_albums_by_artist, get_tracks_by_artist, get_songs_by_genre, check_for_songs)
+}
+INVOICE_TOOLS_BY_NAME = {
+    tool.name: tool
+    for tool in (get_invoices_by_customer_sorted_by_date, get_invoices_sorted_by_unit_price,
+                 get_employee_by_invoice_and_customer)
+}
+_TOOLS_BY_NAME = {**MUSIC_TOOLS_BY_NAME, **INVOICE_TOOLS_BY_NAME}
+
+# How long catalog tool results are reused; the music catalog is effectively read-only.
+# Invoice tools aren't cached, so a customer's new purchase shows up right away
+TOOL_CACHE_TTL = 300
+
 
 class UserInput(BaseModel):
     """Schema for parsing user-provided account information."""
@@ -29,11 +137,210 @@ class UserProfile(BaseModel):
     music_preferences: list[str] = Field(description="The music preferences of the customer")
 
 
-def build_music_catalog_agent():
-    """Build and return the music catalog agent."""
-    # Get the LLM
-    llm = get_llm()
+def safe_node(fallback=None):
+    """
+    Decorate a graph node so an unexpected error is logged and a fallback update returned.
+    
+    Args:
+        fallback: Callable returning the state update to use on error (no update if None)
+        
+    Returns:
+        Decorator for sync or async node functions
+    """
+    def make_fallback(node, error):
+        print(f"Error in {node.__name__}: {str(error)}")
+        return fallback() if fallback else _EMPTY
+    
+    def decorator(node):
+        # Interrupts and other control-flow signals must reach LangGraph untouched
+        if asyncio.iscoroutinefunction(node):
+            @wraps(node)
+            async def wrapper(state, config):
+                try:
+                    return await node(state, config)
+                except GraphBubbleUp:
+                    raise
+                except Exception as e:
+                    return make_fallback(node, e)
+        else:
+            @wraps(node)
+            def wrapper(state, config):
+                try:
+                    return node(state, config)
+                except GraphBubbleUp:
+                    raise
+                except Exception as e:
+                    return make_fallback(node, e)
+        return wrapper
+    
+    return decorator
+
+
+class RunConfig(BaseModel):
+    """Schema for the per-run settings passed in config["configurable"]."""
+    model_config = ConfigDict(frozen=True, extra="ignore", coerce_numbers_to_str=True)
+    
+    user_id: str = Field(default="", description="The ID of the user the run is for")
+    thread_id: str = Field(default="", description="The conversation thread ID")
+
+
+def tokenize_input(text: str):
+    """
+    Tokenize a message once for keyword lookups.
+    
+    Args:
+        text: The message to tokenize
+        
+    Returns:
+        Tuple of (tokens, lowercased tokens, dict of lowercased token to first position)
+    """
+    toks = _TOKEN_RE.findall(text)
+    toks_lower = [t.lower() for t in toks]
+    pos = {}
+    for i, t in enumerate(toks_lower):
+        pos.setdefault(t, i)
+    return toks, toks_lower, pos
+
+
+def intent_hits(text: str) -> set[str]:
+    """Return the set of routing keywords present in text, lowercased."""
+    return {hit.lower() for hit in _INTENT_RE.findall(text)}
+
+
+def token_after(toks, pos, keyword):
+    """Return the token that follows the first occurrence of keyword, or None."""
+    idx = pos.get(keyword, -1)
+    if 0 <= idx < len(toks) - 1:
+        return toks[idx + 1]
+    return None
+
+
+def _invoke_tool(tool_name: str, *args):
+    """Invoke a tool by name with positional arguments, in the order of its parameters."""
+    tool = _TOOLS_BY_NAME[tool_name]
+    return tool.invoke(dict(zip(tool.args, args)))
+
+
+@ttl_cache(maxsize=2048, ttl=TOOL_CACHE_TTL)
+def _run_catalog_tool(tool_name: str, *args):
+    """Run a music catalog tool, caching the result per (tool, args); errors aren't cached."""
+    return _invoke_tool(tool_name, *args)
+
+
+def _run_tool(tool_name: str, *args):
+    """
+    Run a catalog/invoice tool by name, once.
+    
+    Music catalog results are cached per (tool, args); invoice tools always query
+    the database, since their results change as the customer buys.
     
+    Args:
+        tool_name: Name of the tool to run
+        *args: Positional arguments, in the order of the tool's parameters
+        
+    Returns:
+        The tool result
+    """
+    if tool_name in MUSIC_TOOLS_BY_NAME:
+        return _run_catalog_tool(tool_name, *args)
+    return _invoke_tool(tool_name, *args)
+
+
+# The agents retry a failed tool call once. The retry wraps the cache rather than
+# running inside it, and classify_intent's prefetch doesn't retry, so a failing
+# catalog tool runs at most three times per turn (once prefetched, twice here)
+_run_tool_with_retry = retry(stop=stop_after_attempt(2), reraise=True)(_run_tool)
+
+
+def _artist_param(user_input, toks, toks_lower, pos):
+    """Extract an artist name: the word after "artist", else the first capitalized word."""
+    param = token_after(toks_lower, pos, "artist")
+    if not param:
+        # Try to find any capitalized words as potential artist names
+        potential_artists = _CAPWORD_RE.findall(user_input)
+        param = potential_artists[0] if potential_artists else "Queen"  # Default artist
+    return param
+
+
+def _param_after(keyword, default, keep_case=False):
+    """Build an extractor returning the word after keyword, or default."""
+    def extract(user_input, toks, toks_lower, pos):
+        return token_after(toks if keep_case else toks_lower, pos, keyword) or default
+    return extract
+
+
+def _invoice_id_param(user_input, toks, toks_lower, pos):
+    """Extract the invoice ID following "invoice", keeping only its digits."""
+    invoice_id = token_after(toks_lower, pos, "invoice")
+    if invoice_id:
+        # Remove any non-numeric characters
+        invoice_id = ''.join(c for c in invoice_id if c.isdigit())
+    return invoice_id or "1"  # Default invoice ID
+
+
+# Keyword routing rules, checked in order: (keywords that must all be present,
+# parameter extractor, tool name). The first matching rule wins.
+_MUSIC_RULES = (
+    (frozenset({"artist", "album"}), _artist_param, "get_albums_by_artist"),
+    (frozenset({"artist"}), _artist_param, "get_tracks_by_artist"),
+    (frozenset({"genre"}), _param_after("genre", "Rock"), "get_songs_by_genre"),
+    # Song titles keep their original casing
+    (frozenset({"song"}), _param_after("song", "The", keep_case=True), "check_for_songs"),
+    (frozenset({"track"}), _param_after("track", "The", keep_case=True), "check_for_songs"),
+)
+_INVOICE_RULES = (
+    (frozenset({"price"}), None, "get_invoices_sorted_by_unit_price"),
+    (frozenset({"expensive"}), None, "get_invoices_sorted_by_unit_price"),
+    (frozenset({"employee"}), _invoice_id_param, "get_employee_by_invoice_and_customer"),
+    (frozenset({"support"}), _invoice_id_param, "get_employee_by_invoice_and_customer"),
+)
+
+
+def _match_rule(rules, user_input: str):
+    """Return (tool name, extracted parameter) for the first rule matching user_input."""
+    hits = intent_hits(user_input)
+    for keywords, extract, tool_name in rules:
+        if keywords <= hits:
+            if extract is None:
+                return tool_name, None
+            return tool_name, extract(user_input, *tokenize_input(user_input))
+    return None, None
+
+
+@lru_cache(maxsize=4096)
+def classify_music_intent(user_input: str) -> tuple[Optional[str], str]:
+    """
+    Pick a music tool and its parameter from the user's message using keywords.
+    
+    Args:
+        user_input: The user's message
+        
+    Returns:
+        Tuple of (tool name or None, parameter for the tool)
+    """
+    tool_name, param = _match_rule(_MUSIC_RULES, user_input)
+    return tool_name, param or ""
+
+
+@lru_cache(maxsize=4096)
+def classify_invoice_intent(user_input: str) -> tuple[str, Optional[str]]:
+    """
+    Pick an invoice tool and, if it needs one, an invoice ID from the user's message.
+    
+    Args:
+        user_input: The user's message
+        
+    Returns:
+        Tuple of (tool name, invoice ID or None)
+    """
+    tool_name, invoice_id = _match_rule(_INVOICE_RULES, user_input)
+    # Default to showing invoices by date
+    return tool_name or "get_invoices_by_customer_sorted_by_date", invoice_id
+
+
+@lru_cache(maxsize=1)
+def build_music_catalog_agent():
+    """Build and return the music catalog agent (compiled once per process)."""
     # Define music tools
     music_tools = [get_albums_by_artist, get_tracks_by_artist, get_songs_by_genre, check_for_songs]
     
@@ -79,99 +386,43 @@ def build_music_catalog_agent():
         """
     
     # Define the music_assistant node function
-    def music_assistant(state: State, config: RunnableConfig): 
-        try:
-            # Get memory from state
-            memory = "None" 
-            if "loaded_memory" in state: 
-                memory = state["loaded_memory"]
-
-            # Get user input
-            if "messages" in state and state["messages"]:
-                user_input = state["messages"][-1].content
-            else:
-                user_input = "Tell me about music"
-                
-            # Simple keyword-based tool selection instead of using LLM
-            user_input_lower = user_input.lower()
-            
-            # Select tool based on keywords
-            selected_tool = None
-            param = ""
-            
-            if "artist" in user_input_lower:
-                # Extract artist name - simple approach
-                words = user_input_lower.split()
-                artist_idx = words.index("artist") if "artist" in words else -1
-                if artist_idx >= 0 and artist_idx < len(words) - 1:
-                    param = words[artist_idx + 1]
-                else:
-                    # Try to find any capitalized words as potential artist names
-                    import re
-                    potential_artists = re.findall(r'\b[A-Z][a-z]*\b', user_input)
-                    if potential_artists:
-                        param = potential_artists[0]
-                    else:
-                        param = "Queen"  # Default artist
-                
-                if "album" in user_input_lower:
-                    selected_tool = get_albums_by_artist
-                else:
-                    selected_tool = get_tracks_by_artist
-                    
-            elif "genre" in user_input_lower:
-                # Extract genre - simple approach
-                words = user_input_lower.split()
-                genre_idx = words.index("genre") if "genre" in words else -1
-                if genre_idx >= 0 and genre_idx < len(words) - 1:
-                    param = words[genre_idx + 1]
-                else:
-                    param = "Rock"  # Default genre
-                
-                selected_tool = get_songs_by_genre
-                
-            elif "song" in user_input_lower or "track" in user_input_lower:
-                # Extract song title - simple approach
-                words = user_input.split()
-                song_idx = -1
-                if "song" in user_input_lower:
-                    song_idx = user_input_lower.split().index("song")
-                elif "track" in user_input_lower:
-                    song_idx = user_input_lower.split().index("track")
-                    
-                if song_idx >= 0 and song_idx < len(words) - 1:
-                    param = words[song_idx + 1]
-                else:
-                    param = "The"  # Default song search term
-                
-                selected_tool = check_for_songs
+    @safe_node(lambda: {"messages": [_MUSIC_ERROR_MSG.model_copy()]})
+    async def music_assistant(state: State, config: RunnableConfig): 
+        # Get memory loaded for this thread
+        memory = get_loaded_memory(config)
+
+        # Get user input
+        if "messages" in state and state["messages"]:
+            user_input = state["messages"][-1].content
+        else:
+            user_input = "Tell me about music"
             
-            # If a tool was selected, execute it
-            if selected_tool:
-                try:
-                    # Execute the tool with the parameter
-                    print(f"Using music tool: {selected_tool.name} with parameter: {param}")
-                    tool_result = selected_tool(param)
-                    
-                    # Format a response with the tool result
-                    if tool_result:
-                        response = f"Here's what I found about {param}:\n\n{tool_result}"
-                    else:
-                        response = f"I couldn't find any information about {param} in our music catalog."
-                    
-                except Exception as tool_error:
-                    print(f"Error executing music tool: {str(tool_error)}")
-                    response = f"I tried to search for information about {param}, but encountered an error. Could you please try a different search or rephrase your question?"
+        # Simple keyword-based tool selection instead of using LLM
+        tool_name, param = classify_music_intent(user_input)
+        selected_tool = MUSIC_TOOLS_BY_NAME.get(tool_name)
+        
+        # Direct response if no tool was selected
+        if not selected_tool:
+            return {"messages": [_MUSIC_HELP_MSG.model_copy()]}
+        
+        # Execute the tool with the parameter
+        print(f"Using music tool: {selected_tool.name} with parameter: {param}")
+        # Tools are synchronous (DB access), so run them off the event loop
+        try:
+            tool_result = await asyncio.to_thread(_run_tool_with_retry, selected_tool.name, param)
+        except Exception as tool_error:
+            # Tell the user what failed rather than falling back to the generic node apology
+            print(f"Error executing music tool: {str(tool_error)}")
+            response = f"I tried to search for information about {param}, but encountered an error. Could you please try a different search or rephrase your question?"
+        else:
+            # Format a response with the tool result
+            if tool_result:
+                response = f"Here's what I found about {param}:\n\n{tool_result}"
             else:
-                # Direct response if no tool was selected
-                response = "I can help you find information about music in our catalog. You can ask about artists, albums, songs, or genres."
-            
-            # Return updated state with AI message
-            return {"messages": [AIMessage(content=response)]}
-            
-        except Exception as e:
-            print(f"Error in music_assistant: {str(e)}")
-            return {"messages": [AIMessage(content="I'm sorry, I'm having trouble processing your music-related request right now. Please try again later.")]}
+                response = f"I couldn't find any information about {param} in our music catalog."
+        
+        # Return updated state with AI message
+        return {"messages": [AIMessage(content=response)]}
     
     # Create the graph
     music_workflow = StateGraph(State)
@@ -191,11 +442,9 @@ def build_music_catalog_agent():
     )
 
 
+@lru_cache(maxsize=1)
 def build_invoice_agent():
-    """Build and return the invoice information agent."""
-    # Get the LLM
-    llm = get_llm()
-    
+    """Build and return the invoice information agent (compiled once per process)."""
     # Define invoice tools
     invoice_tools = [
         get_invoices_by_customer_sorted_by_date,
@@ -208,8 +457,8 @@ def build_invoice_agent():
     You are a subagent among a team of assistants. You are specialized for retrieving and processing invoice information. You are routed for invoice-related portion of the questions, so only respond to them.. 
 
     You have access to three tools. These tools enable you to retrieve and process invoice information from the database. Here are the tools:
-    - get_invoices_by_customer_sorted_by_date: This tool retrieves all invoices for a customer, sorted by invoice date.
-    - get_invoices_sorted_by_unit_price: This tool retrieves all invoices for a customer, sorted by unit price.
+    - get_invoices_by_customer_sorted_by_date: This tool retrieves a customer's most recent invoices (up to 20), newest first.
+    - get_invoices_sorted_by_unit_price: This tool retrieves a customer's invoice lines with the highest unit price (up to 20).
     - get_employee_by_invoice_and_customer: This tool retrieves the employee information associated with an invoice and a customer.
     
     If you are unable to retrieve the invoice information, inform the customer you are unable to retrieve the information, and ask if they would like to search for something else.
@@ -223,73 +472,42 @@ def build_invoice_agent():
     """
     
     # Define the invoice_assistant node function
-    def invoice_assistant(state: State, config: RunnableConfig): 
-        try:
-            # Get user input
-            if "messages" in state and state["messages"]:
-                user_input = state["messages"][-1].content
-            else:
-                user_input = "Tell me about my invoices"
-                
-            # Simple keyword-based tool selection instead of using LLM
-            user_input_lower = user_input.lower()
-            
-            # Get customer ID from state or use default
-            customer_id = state.get("customer_id", "1")
-            
-            # Select tool based on keywords
-            selected_tool = None
-            invoice_id = None
+    @safe_node(lambda: {"messages": [_INVOICE_ERROR_MSG.model_copy()]})
+    async def invoice_assistant(state: State, config: RunnableConfig): 
+        # Get user input
+        if "messages" in state and state["messages"]:
+            user_input = state["messages"][-1].content
+        else:
+            user_input = "Tell me about my invoices"
             
-            if "price" in user_input_lower or "expensive" in user_input_lower:
-                selected_tool = get_invoices_sorted_by_unit_price
-            elif "employee" in user_input_lower or "support" in user_input_lower:
-                selected_tool = get_employee_by_invoice_and_customer
-                # Try to extract invoice ID - simple approach
-                words = user_input_lower.split()
-                invoice_idx = -1
-                if "invoice" in words:
-                    invoice_idx = words.index("invoice")
-                    
-                if invoice_idx >= 0 and invoice_idx < len(words) - 1:
-                    try:
-                        invoice_id = words[invoice_idx + 1]
-                        # Remove any non-numeric characters
-                        invoice_id = ''.join(c for c in invoice_id if c.isdigit())
-                    except:
-                        invoice_id = "1"  # Default invoice ID
-                else:
-                    invoice_id = "1"  # Default invoice ID
+        # Simple keyword-based tool selection instead of using LLM
+        tool_name, invoice_id = classify_invoice_intent(user_input)
+        
+        # Get customer ID from state or use default
+        customer_id = state.get("customer_id", "1")
+        
+        # Execute the tool with the appropriate parameters
+        if invoice_id:
+            print(f"Using invoice tool: {tool_name} with invoice_id: {invoice_id} and customer_id: {customer_id}")
+            args = (invoice_id, customer_id)
+        else:
+            print(f"Using invoice tool: {tool_name} with customer_id: {customer_id}")
+            args = (customer_id,)
+        try:
+            tool_result = await asyncio.to_thread(_run_tool_with_retry, tool_name, *args)
+        except Exception as tool_error:
+            # Tell the user what failed rather than falling back to the generic node apology
+            print(f"Error executing invoice tool: {str(tool_error)}")
+            response = "I tried to retrieve your invoice information, but encountered an error. Could you please try again later?"
+        else:
+            # Format a response with the tool result
+            if tool_result:
+                response = f"Here's what I found about your invoices:\n\n{tool_result}"
             else:
-                # Default to showing invoices by date
-                selected_tool = get_invoices_by_customer_sorted_by_date
-            
-            # Execute the selected tool
-            try:
-                # Execute the tool with the appropriate parameters
-                if selected_tool.name == "get_employee_by_invoice_and_customer" and invoice_id:
-                    print(f"Using invoice tool: {selected_tool.name} with invoice_id: {invoice_id} and customer_id: {customer_id}")
-                    tool_result = selected_tool(invoice_id, customer_id)
-                else:
-                    print(f"Using invoice tool: {selected_tool.name} with customer_id: {customer_id}")
-                    tool_result = selected_tool(customer_id)
-                
-                # Format a response with the tool result
-                if tool_result:
-                    response = f"Here's what I found about your invoices:\n\n{tool_result}"
-                else:
-                    response = "I couldn't find any invoice information for your account."
-                
-            except Exception as tool_error:
-                print(f"Error executing invoice tool: {str(tool_error)}")
-                response = "I tried to retrieve your invoice information, but encountered an error. Could you please try again later?"
-            
-            # Return updated state with AI message
-            return {"messages": [AIMessage(content=response)]}
-            
-        except Exception as e:
-            print(f"Error in invoice_assistant: {str(e)}")
-            return {"messages": [AIMessage(content="I'm sorry, I'm having trouble processing your invoice-related request right now. Please try again later.")]}
+                response = "I couldn't find any invoice information for your account."
+        
+        # Return updated state with AI message
+        return {"messages": [AIMessage(content=response)]}
     
     # Create the graph
     invoice_workflow = StateGraph(State)
@@ -309,40 +527,38 @@ def build_invoice_agent():
     )
 
 
+# Compiled supervisors keyed by the identity of the sub-agents they wrap. The
+# sub-agents are stored alongside so their ids can't be reused while cached.
+_SUPERVISORS = {}
+
+
 def build_supervisor_agent(music_agent, invoice_agent):
-    """Build and return the supervisor agent."""
-    # Get the LLM
-    llm = get_llm()
-    
-    # Define the supervisor prompt
-    supervisor_prompt = """You are an expert customer support assistant for a digital music store. 
-    You are dedicated to providing exceptional service and ensuring customer queries are answered thoroughly. 
-    You have a team of subagents that you can use to help answer queries from customers. 
-    Your primary role is to serve as a supervisor/planner for this multi-agent team that helps answer queries from customers. 
+    """Build and return the supervisor agent (compiled once per pair of sub-agents)."""
+    key = (id(music_agent), id(invoice_agent))
+    if key not in _SUPERVISORS:
+        _SUPERVISORS[key] = (music_agent, invoice_agent, _build_supervisor_agent(music_agent, invoice_agent))
+    return _SUPERVISORS[key][2]
 
-    Your team is composed of two subagents that you can use to help answer the customer's request:
-    1. music_catalog_subagent: this subagent has access to user's saved music preferences. It can also retrieve information about the digital music store's music 
-    catalog (albums, tracks, songs, etc.) from the database. 
-    3. invoice_information_subagent: this subagent is able to retrieve information about a customer's past purchases or invoices 
-    from the database. 
 
-    Based on the existing steps that have been taken in the messages, your role is to generate the next subagent that needs to be called. 
-    This could be one step in an inquiry that needs multiple sub-agent calls. """
+def _build_supervisor_agent(music_agent, invoice_agent):
+    """Build the supervisor agent graph."""
+    # Get the LLM
+    llm = get_llm()
     
     # Create tools from the agents
-    from langchain_core.tools import Tool
-    
     try:
         music_tool = Tool(
             name="music_catalog_subagent",
             description="Use this agent for questions about music catalog, albums, tracks, songs, artists, etc.",
-            func=music_agent.invoke
+            func=music_agent.invoke,
+            coroutine=music_agent.ainvoke
         )
         
         invoice_tool = Tool(
             name="invoice_information_subagent",
             description="Use this agent for questions about customer invoices, purchases, etc.",
-            func=invoice_agent.invoke
+            func=invoice_agent.invoke,
+            coroutine=invoice_agent.ainvoke
         )
         
         tools = [music_tool, invoice_tool]
@@ -356,7 +572,6 @@ def build_supervisor_agent(music_agent, invoice_agent):
             llm=llm,
             tools=tools,
             name="supervisor",
-            system_prompt=supervisor_prompt,
             state_schema=State,
             checkpointer=checkpointer,
             store=memory_store
@@ -368,29 +583,28 @@ def build_supervisor_agent(music_agent, invoice_agent):
         print(f"Error building supervisor agent: {str(e)}")
         
         # Create a fallback supervisor that doesn't use tools
-        def fallback_supervisor(state: State, config: RunnableConfig):
+        @safe_node(lambda: {"messages": [_SUPERVISOR_ERROR_MSG.model_copy()]})
+        async def fallback_supervisor(state: State, config: RunnableConfig):
             """Fallback supervisor that doesn't use tools"""
-            try:
-                # Get the user input
-                user_input = state["messages"][-1].content if state["messages"] and len(state["messages"]) > 0 else "Hello"
-                
-                # Create a simple prompt
-                prompt = f"""You are an expert customer support assistant for a digital music store.
-                You are dedicated to providing exceptional service and ensuring customer queries are answered thoroughly.
-                
-                The customer query is: {user_input}
-                
-                Please respond to the query directly as best you can."""
-                
-                # Call LLM directly
-                response = llm.invoke(prompt)
-                
-                # Return updated state with AI message
-                return {"messages": [AIMessage(content=response.content if hasattr(response, 'content') else str(response))]}
-                
-            except Exception as inner_e:
-                print(f"Error in fallback supervisor: {str(inner_e)}")
-                return {"messages": [AIMessage(content="I'm sorry, I'm having trouble processing your request right now. Please try again later.")]}
+            # Get the user input
+            user_input = state["messages"][-1].content if state["messages"] and len(state["messages"]) > 0 else "Hello"
+            
+            # Create a simple prompt
+            prompt = f"""You are an expert customer support assistant for a digital music store.
+            You are dedicated to providing exceptional service and ensuring customer queries are answered thoroughly.
+            
+            The customer query is: {user_input}
+            
+            Please respond to the query directly as best you can."""
+            
+            # Call LLM directly, streaming so tokens reach callers using
+            # stream_mode="messages" as they are generated
+            chunks = []
+            async for chunk in llm.astream(prompt, config=config):
+                chunks.append(chunk.content if hasattr(chunk, 'content') else str(chunk))
+            
+            # Return updated state with AI message
+            return {"messages": [AIMessage(content="".join(chunks))]}
         
         # Create a simple graph
         fallback_graph = StateGraph(State)
@@ -405,34 +619,16 @@ def build_supervisor_agent(music_agent, invoice_agent):
 def build_verify_info_node(llm):
     """Build and return the customer verification node."""
     # Define the verify_info node function
+    @safe_node(lambda: {"customer_id": "1", "messages": [_VERIFY_ERROR_MSG.model_copy()]})
     def verify_info(state: State, config: RunnableConfig):
         """Verify the customer's account by parsing their input and matching it with the database."""
-        try:
-            # Check if already verified
-            if state.get("customer_id") is None: 
-                # For testing purposes, always use customer ID 1
-                # This avoids using the LLM which is causing the 404 error
-                customer_id = "1"
-                intent_message = SystemMessage(
-                    content= f"Thank you for contacting us! I'll help you with your request. Using account ID {customer_id}."
-                )
-                
-                # Update state with customer_id and confirmation
-                return {
-                    "customer_id": customer_id,
-                    "messages" : [intent_message]
-                }
-            else:
-                # Already verified, do nothing
-                return {}
-                
-        except Exception as e:
-            print(f"Unexpected error in verify_info: {str(e)}")
-            # Use a default customer ID for testing
-            return {
-                "customer_id": "1",
-                "messages": [SystemMessage(content="I'm experiencing technical difficulties, but I'll help you with a test account.")]
-            }
+        # Check if already verified
+        if state.get("customer_id") is None: 
+            # For testing purposes, always use customer ID 1
+            # This avoids using the LLM which is causing the 404 error
+            return {"customer_id": "1", "messages": [_VERIFIED_MSG.model_copy()]}
+        # Already verified, do nothing
+        return _EMPTY
     
     return verify_info
 
@@ -454,82 +650,108 @@ def build_human_input_node():
 def build_load_memory_node(store):
     """Build and return the memory loading node."""
     # Define the load_memory node function
-    def load_memory(state: State, config: RunnableConfig):
+    @safe_node()
+    async def load_memory(state: State, config: RunnableConfig):
         """Loads music preferences from users, if available."""
         # Get user ID from config or state
-        user_id = config.get("configurable", {}).get("user_id", "")
-        if not user_id and "customer_id" in state:
-            user_id = state["customer_id"]
+        run_config = RunConfig.model_validate(config.get("configurable", {}))
+        user_id = run_config.user_id or state.get("customer_id", "")
+        thread_id = run_config.thread_id
         
         # If no user ID, return empty memory
         if not user_id:
-            return {"loaded_memory": ""}
+            set_loaded_memory(thread_id, "")
+            return _EMPTY
         
-        # Load memory from database
-        memory = load_user_memory(user_id)
+        # Load memory from database (Django ORM is sync-only, so run it in a thread)
+        memory = await asyncio.to_thread(load_user_memory, user_id)
         
-        # Update state with loaded memory
-        return {"loaded_memory": memory}
+        # Keep loaded memory in the per-thread cache rather than checkpointed state
+        set_loaded_memory(thread_id, memory)
+        return _EMPTY
     
     return load_memory
 
 
+def build_classify_intent_node():
+    """Build and return the intent classification node."""
+    # Define the classify_intent node function
+    @safe_node()
+    async def classify_intent(state: State, config: RunnableConfig):
+        """Pick the agents for this turn and speculatively warm the catalog tool cache."""
+        # Use the same message the supervisor and sub-agents will route on
+        messages = state.get("messages", [])
+        user_input = messages[-1].content if messages else "Hello"
+        domains = select_agent_domains(user_input)
+        
+        # Run the catalog tool call the music agent is about to make, so the DB work
+        # overlaps with load_memory and the agent hits the cache (invoice results
+        # aren't cached, so prefetching them would only query twice)
+        if "music" in domains:
+            tool_name, param = classify_music_intent(user_input)
+            if tool_name:
+                try:
+                    await asyncio.to_thread(_run_tool, tool_name, param)
+                except Exception:
+                    # A failed prefetch is not an error; the agent runs the tool itself
+                    pass
+        
+        return {"selected_agents": domains}
+    
+    return classify_intent
+
+
 def build_create_memory_node(llm, store):
     """Build and return the memory creation/update node."""
     # Define the create_memory node function
-    def create_memory(state: State, config: RunnableConfig):
-        try:
-            # Get user ID from config or state
-            user_id = config.get("configurable", {}).get("user_id", "")
-            if not user_id and "customer_id" in state:
-                user_id = state["customer_id"]
-            
-            # If no user ID, do nothing
-            if not user_id:
-                print("No user_id found, skipping memory creation")
-                return {}
-            
-            # Save default memory to database
-            # This avoids using the LLM which is causing the 404 error
-            try:
-                # Extract potential music preferences from messages
-                music_prefs = ["rock", "pop"]  # Default preferences
-                
-                if "messages" in state and len(state["messages"]) > 0:
-                    # Try to extract some basic preferences from the messages
-                    message_text = " ".join([
-                        msg.content if hasattr(msg, "content") else str(msg) 
-                        for msg in state["messages"]
-                    ]).lower()
-                    
-                    # Simple keyword extraction
-                    genres = ["rock", "pop", "jazz", "classical", "hip hop", "rap", "country", 
-                             "blues", "electronic", "dance", "metal", "folk", "indie"]
-                    
-                    found_genres = [genre for genre in genres if genre in message_text]
-                    if found_genres:
-                        music_prefs = found_genres
-                
-                # Save memory to database
-                save_user_memory(
-                    user_id=user_id,
-                    customer_id=user_id,
-                    preferences={"music": music_prefs}
-                )
-                print(f"Saved default memory for user {user_id}")
-            except Exception as save_error:
-                print(f"Error saving memory: {str(save_error)}")
-            
-            return {}
-        except Exception as e:
-            print(f"Error in create_memory: {str(e)}")
-            return {}
+    @safe_node()
+    async def create_memory(state: State, config: RunnableConfig):
+        # Get user ID from config or state
+        run_config = RunConfig.model_validate(config.get("configurable", {}))
+        user_id = run_config.user_id or state.get("customer_id", "")
+        
+        # If no user ID, do nothing
+        if not user_id:
+            print("No user_id found, skipping memory creation")
+            return _EMPTY
+        
+        # Save default memory to database
+        # This avoids using the LLM which is causing the 404 error
+        # Extract potential music preferences from messages
+        music_prefs = ["rock", "pop"]  # Default preferences
+        
+        # Genres found on earlier turns are kept in state, so only messages
+        # added since the last scan need to be looked at
+        messages = state.get("messages", [])
+        scanned_upto = state.get("scanned_upto", 0)
+        found = set(state.get("music_preferences") or [])
+        
+        # Try to extract some basic preferences from the new messages, one
+        # message at a time so no joined copy of the history is built
+        for msg in messages[scanned_upto:]:
+            text = msg.content if hasattr(msg, "content") else str(msg)
+            if isinstance(text, str):
+                found.update(find_genres(text.lower()))
+        
+        found_genres = [genre for genre in GENRES if genre in found]
+        if found_genres:
+            music_prefs = found_genres
+        
+        # Hand the save to the write-behind queue so the response isn't held up by the DB
+        queue_user_memory(
+            user_id=user_id,
+            customer_id=user_id,
+            preferences={"music": music_prefs}
+        )
+        print(f"Queued memory save for user {user_id}")
+        
+        return {"scanned_upto": len(messages), "music_preferences": found_genres}
     
     return create_memory
 
 
 def build_complete_agent_system():
-    """Build and return the complete agent system."""
+    """Build and return the complete agent system (see get_agent_system for the shared instance)."""
     # Get components
     llm = get_llm()
     checkpointer = get_checkpointer()
@@ -548,12 +770,15 @@ def build_complete_agent_system():
     load_memory_node = build_load_memory_node(memory_store)
     create_memory_node = build_create_memory_node(llm, memory_store)
     
-    # Define conditional routing function
+    classify_intent_node = build_classify_intent_node()
+    
+    # Define conditional routing function; a verified customer fans out to memory
+    # loading and intent classification, which run concurrently
     def should_interrupt(state: State, config: RunnableConfig):
         if state.get("customer_id") is not None:
-            return "continue"
+            return ["load_memory", "classify_intent"]
         else:
-            return "interrupt"
+            return "human_input"
     
     # Create the complete graph
     multi_agent_final = StateGraph(State)
@@ -562,6 +787,7 @@ def build_complete_agent_system():
     multi_agent_final.add_node("verify_info", verify_info_node)
     multi_agent_final.add_node("human_input", human_input_node)
     multi_agent_final.add_node("load_memory", load_memory_node)
+    multi_agent_final.add_node("classify_intent", classify_intent_node)
     multi_agent_final.add_node("supervisor", supervisor)
     multi_agent_final.add_node("create_memory", create_memory_node)
     
@@ -570,13 +796,11 @@ def build_complete_agent_system():
     multi_agent_final.add_conditional_edges(
         "verify_info",
         should_interrupt,
-        {
-            "continue": "load_memory",
-            "interrupt": "human_input",
-        },
+        ["load_memory", "classify_intent", "human_input"],
     )
     multi_agent_final.add_edge("human_input", "verify_info")
-    multi_agent_final.add_edge("load_memory", "supervisor")
+    # The supervisor waits for both branches
+    multi_agent_final.add_edge(["load_memory", "classify_intent"], "supervisor")
     multi_agent_final.add_edge("supervisor", "create_memory")
     multi_agent_final.add_edge("create_memory", END)
     
@@ -588,23 +812,117 @@ def build_complete_agent_system():
     )
 
 
-def run_agent_with_input(agent_graph, user_input, thread_id=None, user_id=None, resume_input=None):
+# The agent system shared by every request in this process
+_AGENT_SYSTEM = None
+_AGENT_SYSTEM_LOCK = threading.Lock()
+
+
+def get_agent_system():
+    """
+    Get the agent system, building it on first use
+    
+    The lock makes concurrent first requests wait for a single build instead of
+    each compiling their own graph.
+    
+    Returns:
+        The compiled agent graph
+    """
+    global _AGENT_SYSTEM
+    if _AGENT_SYSTEM is None:
+        with _AGENT_SYSTEM_LOCK:
+            if _AGENT_SYSTEM is None:
+                _AGENT_SYSTEM = build_complete_agent_system()
+    return _AGENT_SYSTEM
+
+
+def _reset_agent_system_after_fork():
+    """Forget the parent's agent system and clients so a forked worker builds its own"""
+    global _AGENT_SYSTEM, _AGENT_SYSTEM_LOCK
+    _AGENT_SYSTEM = None
+    # The parent may have held the lock while forking
+    _AGENT_SYSTEM_LOCK = threading.Lock()
+    build_music_catalog_agent.cache_clear()
+    build_invoice_agent.cache_clear()
+    _SUPERVISORS.clear()
+    # Connection pools, HTTP clients and the checkpoint database connection must
+    # not be shared across processes
+    clear_client_caches()
+    get_checkpointer.cache_clear()
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_agent_system_after_fork)
+
+
+def run_agent_with_input(agent_graph, user_input, thread_id=None, user_id=None, resume_input=None, on_token=None):
     """
     Run the agent with user input and handle interrupts
     
+    Synchronous entry point for callers such as Django views; see arun_agent_with_input.
+    
+    Args:
+        agent_graph: The compiled agent graph
+        user_input: The user's input message
+        thread_id: Optional thread ID for continuing a conversation
+        user_id: Optional user ID for loading preferences
+        resume_input: Optional input to resume from an interrupt
+        on_token: Optional callback receiving AI message tokens as they are generated
+        
+    Returns:
+        Dict containing the result and any interrupt information
+    """
+    return asyncio.run(arun_agent_with_input(
+        agent_graph, user_input, thread_id=thread_id, user_id=user_id, resume_input=resume_input,
+        on_token=on_token
+    ))
+
+
+async def _ainvoke_graph(agent_graph, graph_input, config, on_token=None):
+    """
+    Invoke the graph, passing AI message tokens to on_token while it runs
+    
+    Args:
+        agent_graph: The compiled agent graph
+        graph_input: Input (or resume Command) for the graph
+        config: Run configuration
+        on_token: Optional callback receiving each token's text
+        
+    Returns:
+        The final graph state
+    """
+    if on_token is None:
+        return await agent_graph.ainvoke(graph_input, config=config)
+    
+    # "messages" carries LLM tokens as they are generated, "values" the state after each step
+    result = None
+    async for mode, chunk in agent_graph.astream(graph_input, config=config, stream_mode=["messages", "values"]):
+        if mode == "messages":
+            message = chunk[0]
+            if isinstance(message, AIMessageChunk) and isinstance(message.content, str) and message.content:
+                on_token(message.content)
+        else:
+            result = chunk
+    return result
+
+
+async def arun_agent_with_input(agent_graph, user_input, thread_id=None, user_id=None, resume_input=None, on_token=None):
+    """
+    Run the agent asynchronously with user input and handle interrupts
+    
     Args:
         agent_graph: The compiled agent graph
         user_input: The user's input message
         thread_id: Optional thread ID for continuing a conversation
         user_id: Optional user ID for loading preferences
         resume_input: Optional input to resume from an interrupt
+        on_token: Optional callback receiving AI message tokens as they are generated
         
     Returns:
         Dict containing the result and any interrupt information
     """
     # Generate thread ID if not provided
     if not thread_id:
-        thread_id = str(uuid.uuid4())
+        thread_id = str(uuid7())
     
     # Set up configuration
     config = {
@@ -626,20 +944,16 @@ def run_agent_with_input(agent_graph, user_input, thread_id=None, user_id=None,
             
             try:
                 # Try to resume with the message included in the state
-                result = agent_graph.invoke(
-                    Command(resume=resume_input), 
-                    config=config
-                )
+                result = await _ainvoke_graph(agent_graph, Command(resume=resume_input), config, on_token)
             except Exception as resume_error:
                 print(f"Error with resume command: {str(resume_error)}")
                 # Fallback to a fresh start with the resume input as a message
-                result = agent_graph.invoke(
-                    {"messages": [resume_message]},
-                    config=config
-                )
+                result = await _ainvoke_graph(agent_graph, {"messages": [resume_message]}, config, on_token)
         # Initial invocation
         else:
-            result = agent_graph.invoke({"messages": [HumanMessage(content=user_input)]}, config=config)
+            result = await _ainvoke_graph(
+                agent_graph, {"messages": [HumanMessage(content=user_input)]}, config, on_token
+            )
         
         # Return successful result
         return {
@@ -657,7 +971,6 @@ def run_agent_with_input(agent_graph, user_input, thread_id=None, user_id=None,
             }
         # Other error
         else:
-            import traceback
             error_details = traceback.format_exc()
             print(f"Error in run_agent_with_input: {error_details}")
             return {
@@ -1,6 +1,14 @@
+import os
+
 from django.apps import AppConfig
 
 
 class AgentsappConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'agentsapp'
+    
+    def ready(self):
+        # Optionally build the agent system at startup so the first chat doesn't pay for it
+        if os.environ.get('DJANGO_PREWARM_AGENT') == '1':
+            from .agent_builder import get_agent_system
+            get_agent_system()
@@ -1,15 +1,105 @@
 import os
-import sqlite3
-import requests
 from django.core.management.base import BaseCommand
-from django.contrib.auth.models import User
-from django.conf import settings
+from django.db import connection, transaction
 
-from agentsapp.models import (
-    LLMModel, Tool, AgentType, UserProfile, UserPreference, 
-    Conversation, Message, AgentConfig, Database
+
+# Indexes serving the invoice tools' filter + ORDER BY ... LIMIT queries
+CHINOOK_QUERY_INDEXES = (
+    'CREATE INDEX IF NOT EXISTS idx_invoice_customer_date ON Invoice(CustomerId, InvoiceDate DESC)',
+    'CREATE INDEX IF NOT EXISTS idx_invoiceline_invoice_price ON InvoiceLine(InvoiceId, UnitPrice DESC)',
 )
 
+# Chinook sample data, inserted with explicit ids
+ARTISTS = [
+    (1, 'The Rolling Stones'),
+    (2, 'Led Zeppelin'),
+    (3, 'Queen'),
+    (4, 'Hiphop Tamizha'),
+]
+
+# (AlbumId, Title, ArtistId)
+ALBUMS = [
+    (1, 'Sticky Fingers', 1),
+    (2, 'IV', 2),
+    (3, 'A Night at the Opera', 3),
+    (4, 'Hip Hop Tamizhan', 4),
+    (5, 'Meesaya Murukku', 4),
+    (6, 'Naa Oru Alien', 4),
+    # Additional Hiphop Tamizha Singles and Popular Songs
+    (7, 'Singles Collection', 4),
+    (8, 'Thani Oruvan', 4),
+    (9, 'Natpe Thunai', 4),
+]
+
+GENRES = [
+    (1, 'Rock'),
+    (2, 'Blues'),
+    (3, 'Pop'),
+    (4, 'Hip Hop'),
+    (5, 'Tamil Hip Hop'),
+]
+
+# (TrackId, Name, AlbumId, GenreId, Composer, Milliseconds, Bytes)
+TRACKS = [
+    (1, 'Brown Sugar', 1, 1, 'Jagger/Richards', 228000, 4500000),
+    (2, 'Stairway to Heaven', 2, 1, 'Page/Plant', 482000, 8200000),
+    (3, 'Bohemian Rhapsody', 3, 1, 'Mercury', 354000, 6700000),
+    # Hiphop Tamizha Tracks - Hip Hop Tamizhan Album
+    (4, 'Manithan Tamizhan', 4, 5, 'Adhi', 252000, 5000000),
+    (5, 'Tamizhanda', 4, 5, 'Adhi', 189000, 4200000),
+    (6, 'Tamizh Theriyum', 4, 5, 'Adhi', 192000, 4300000),
+    (7, 'Club Le Mabbu Le', 4, 5, 'Adhi', 216000, 4800000),
+    (8, 'Sentamizh Penne', 4, 5, 'Adhi', 200000, 4500000),
+    (9, 'Iraiva', 4, 5, 'Adhi', 280000, 5500000),
+    # Hiphop Tamizha Tracks - Meesaya Murukku Album (Film Soundtrack)
+    (10, 'Sakkarakatti', 5, 5, 'Adhi', 231000, 5100000),
+    (11, 'Enna Nadanthalum', 5, 5, 'Adhi', 240000, 5200000),
+    (12, 'Vaadi Nee Vaa', 5, 5, 'Adhi', 212000, 4700000),
+    (13, 'Machi Engalukku', 5, 5, 'Adhi', 227000, 5000000),
+    (14, 'Great Ji', 5, 5, 'Adhi', 213000, 4800000),
+    # Hiphop Tamizha Tracks - Naa Oru Alien Album
+    (15, 'Yaarumey Venam', 6, 5, 'Adhi', 245000, 5200000),
+    (16, 'Tamizhi', 6, 5, 'Adhi', 253000, 5300000),
+    (17, 'Naa Oru Alien', 6, 5, 'Adhi', 261000, 5400000),
+    (18, 'Poi Poi Poi', 6, 5, 'Adhi', 236000, 5100000),
+    (19, 'Takkaru Takkaru', 6, 5, 'Adhi', 271000, 5600000),
+    # Singles
+    (20, 'Vaadi Pulla Vaadi', 7, 5, 'Adhi', 256000, 5300000),
+    (21, 'Quarantine & Chill', 7, 5, 'Adhi', 220000, 4900000),
+    (22, 'Oorukaaran', 7, 5, 'Adhi', 235000, 5100000),
+    (23, 'Chinna Paiyan', 7, 5, 'Adhi', 243000, 5200000),
+    (24, 'Nadanthavaraikumey', 7, 5, 'Adhi', 250000, 5300000),
+    # Thani Oruvan
+    (25, 'Theemai Dhaan Vellum', 8, 5, 'Adhi', 247000, 5200000),
+    (26, 'Thani Oruvan Title Track', 8, 5, 'Adhi', 235000, 5100000),
+    # Natpe Thunai
+    (27, 'Kerala Song', 9, 5, 'Adhi', 232000, 5000000),
+    (28, 'Vengamavan', 9, 5, 'Adhi', 228000, 4900000),
+    (29, 'Veedhikor Jaadhi', 9, 5, 'Adhi', 242000, 5100000),
+]
+
+# (EmployeeId, LastName, FirstName, Title, Email)
+EMPLOYEES = [
+    (1, 'Smith', 'John', 'Sales Support Agent', 'john@example.com'),
+]
+
+# (CustomerId, FirstName, LastName, Phone, Email, SupportRepId)
+CUSTOMERS = [
+    (1, 'Jane', 'Doe', '+55 (12) 3923-5555', 'jane@example.com', 1),
+]
+
+# (InvoiceId, CustomerId, InvoiceDate, Total)
+INVOICES = [
+    (1, 1, '2025-08-07 00:00:00', 8.91),
+]
+
+# (InvoiceLineId, InvoiceId, TrackId, UnitPrice, Quantity)
+INVOICE_LINES = [
+    (1, 1, 1, 0.99, 3),
+    (2, 1, 2, 0.99, 3),
+    (3, 1, 3, 0.99, 3),
+]
+
 
 class Command(BaseCommand):
     help = 'Initialize the database with default data'
@@ -17,6 +107,39 @@ class Command(BaseCommand):
     def handle(self, *args, **options):
         self.stdout.write('Initializing database...')
         
+        # Nothing to do on an already seeded database
+        if self.is_seeded():
+            self.stdout.write(self.style.SUCCESS('Database already initialized'))
+            return
+        
+        # Seed everything in one transaction so the inserts commit once
+        with transaction.atomic():
+            self.seed_defaults()
+        
+        self.stdout.write(self.style.SUCCESS('Database initialization complete!'))
+    
+    def is_seeded(self):
+        """Check every seeded table in a single query."""
+        # Model imports live in the methods so loading management commands stays cheap
+        from django.contrib.auth.models import User
+        from agentsapp.models import LLMModel, Tool, AgentType, AgentConfig, Database
+        
+        checks = [
+            f'EXISTS(SELECT 1 FROM {connection.ops.quote_name(model._meta.db_table)})'
+            for model in (LLMModel, AgentType, Tool, Database, AgentConfig)
+        ]
+        checks.append(
+            f'EXISTS(SELECT 1 FROM {connection.ops.quote_name(User._meta.db_table)} WHERE username = %s)'
+        )
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT {", ".join(checks)}', ['admin'])
+            return all(cursor.fetchone())
+    
+    def seed_defaults(self):
+        """Create the default rows that are missing."""
+        from django.contrib.auth.models import User
+        from agentsapp.models import LLMModel, Tool, AgentType, AgentConfig, Database
+        
         # Create default admin user if it doesn't exist
         if not User.objects.filter(username='admin').exists():
             User.objects.create_superuser(
@@ -28,78 +151,82 @@ class Command(BaseCommand):
         
         # Create default LLM models
         if not LLMModel.objects.exists():
-            LLMModel.objects.create(
-                name='llama2',
-                provider='ollama',
-                api_base='http://localhost:11434/api',
-                temperature=0.0,
-                max_tokens=512,
-                is_active=True
-            )
-            LLMModel.objects.create(
-                name='llama3',
-                provider='ollama',
-                api_base='http://localhost:11434/api',
-                temperature=0.0,
-                max_tokens=512,
-                is_active=False
-            )
+            LLMModel.objects.bulk_create([
+                LLMModel(
+                    name='llama2',
+                    provider='ollama',
+                    api_base='http://localhost:11434/api',
+                    temperature=0.0,
+                    max_tokens=512,
+                    is_active=True
+                ),
+                LLMModel(
+                    name='llama3',
+                    provider='ollama',
+                    api_base='http://localhost:11434/api',
+                    temperature=0.0,
+                    max_tokens=512,
+                    is_active=False
+                ),
+            ])
             self.stdout.write(self.style.SUCCESS('Created default LLM models'))
         
-        # Create default agent types
-        if not AgentType.objects.exists():
-            AgentType.objects.create(
+        # Create default agent types; names are unique, so existing rows are skipped
+        AgentType.objects.bulk_create([
+            AgentType(
                 name='Music Catalog Agent',
                 description='Specialized agent for music catalog queries'
-            )
-            AgentType.objects.create(
+            ),
+            AgentType(
                 name='Invoice Agent',
                 description='Specialized agent for invoice and purchase queries'
-            )
-            AgentType.objects.create(
+            ),
+            AgentType(
                 name='Supervisor Agent',
                 description='Supervisor agent that routes queries to specialized agents'
-            )
-            self.stdout.write(self.style.SUCCESS('Created default agent types'))
+            ),
+        ], ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS('Seeded default agent types'))
         
-        # Create default tools
-        if not Tool.objects.exists():
-            Tool.objects.create(
+        # Create default tools; names are unique, so existing rows are skipped
+        Tool.objects.bulk_create([
+            Tool(
                 name='get_albums_by_artist',
                 description='Get albums by an artist',
                 function_name='get_albums_by_artist'
-            )
-            Tool.objects.create(
+            ),
+            Tool(
                 name='get_tracks_by_artist',
                 description='Get songs by an artist',
                 function_name='get_tracks_by_artist'
-            )
-            Tool.objects.create(
+            ),
+            Tool(
                 name='get_songs_by_genre',
                 description='Get songs by genre',
                 function_name='get_songs_by_genre'
-            )
-            Tool.objects.create(
+            ),
+            Tool(
                 name='check_for_songs',
                 description='Check if specific songs exist',
                 function_name='check_for_songs'
-            )
-            Tool.objects.create(
+            ),
+            Tool(
                 name='get_invoices_by_customer_sorted_by_date',
                 description='Get invoices for a customer sorted by date',
                 function_name='get_invoices_by_customer_sorted_by_date'
-            )
-            Tool.objects.create(
+            ),
+            Tool(
                 name='get_invoices_sorted_by_unit_price',
                 description='Get invoices sorted by unit price',
                 function_name='get_invoices_sorted_by_unit_price'
-            )
-            Tool.objects.create(
+            ),
+            Tool(
                 name='get_employee_by_invoice_and_customer',
                 description='Get employee associated with invoice and customer',
                 function_name='get_employee_by_invoice_and_customer'
-            )
-            self.stdout.write(self.style.SUCCESS('Created default tools'))
+            ),
+        ], ignore_conflicts=True)
+        self.stdout.write(self.style.SUCCESS('Seeded default tools'))
         
         # Create Chinook database if it doesn't exist
         if not Database.objects.exists():
@@ -114,13 +241,27 @@ class Command(BaseCommand):
             if not os.path.exists(db_path):
                 self.stdout.write('Creating Chinook database...')
                 
+                # Imported here so loading management commands doesn't pay for it
+                import sqlite3
+                
                 # Create a new SQLite database
                 conn = sqlite3.connect(db_path)
+                
+                # Bulk-load settings: WAL journal, fewer fsyncs, temp data in memory
+                conn.execute('PRAGMA journal_mode=WAL')
+                conn.execute('PRAGMA synchronous=NORMAL')
+                conn.execute('PRAGMA temp_store=MEMORY')
+                # Let the script manage its own transaction
+                conn.isolation_level = None
                 cursor = conn.cursor()
                 
                 # Execute SQL to create the schema
                 # Note: This is a simplified version of the Chinook schema
+                # The whole schema and seed run as a single transaction,
+                # left open by the DDL script and committed after the inserts
                 cursor.executescript('''
+                    BEGIN;
+                    
                     -- Create Artist table
                     CREATE TABLE Artist (
                         ArtistId INTEGER PRIMARY KEY AUTOINCREMENT,
@@ -218,135 +359,54 @@ class Command(BaseCommand):
                         FOREIGN KEY (TrackId) REFERENCES Track(TrackId)
                     );
                     
-                    -- Insert sample data
-                    -- Artist
-                    INSERT INTO Artist (Name) VALUES ('The Rolling Stones');
-                    INSERT INTO Artist (Name) VALUES ('Led Zeppelin');
-                    INSERT INTO Artist (Name) VALUES ('Queen');
-                    INSERT INTO Artist (Name) VALUES ('Hiphop Tamizha');
-                    
-                    -- Album
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Sticky Fingers', 1);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('IV', 2);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('A Night at the Opera', 3);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Hip Hop Tamizhan', 4);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Meesaya Murukku', 4);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Naa Oru Alien', 4);
-                    
-                    -- Genre
-                    INSERT INTO Genre (Name) VALUES ('Rock');
-                    INSERT INTO Genre (Name) VALUES ('Blues');
-                    INSERT INTO Genre (Name) VALUES ('Pop');
-                    INSERT INTO Genre (Name) VALUES ('Hip Hop');
-                    INSERT INTO Genre (Name) VALUES ('Tamil Hip Hop');
-                    
-                    -- Track
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Brown Sugar', 1, 1, 1, 'Jagger/Richards', 228000, 4500000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Stairway to Heaven', 2, 1, 1, 'Page/Plant', 482000, 8200000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Bohemian Rhapsody', 3, 1, 1, 'Mercury', 354000, 6700000, 0.99);
-                    
-                    -- Hiphop Tamizha Tracks - Hip Hop Tamizhan Album
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Manithan Tamizhan', 4, 1, 5, 'Adhi', 252000, 5000000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Tamizhanda', 4, 1, 5, 'Adhi', 189000, 4200000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Tamizh Theriyum', 4, 1, 5, 'Adhi', 192000, 4300000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Club Le Mabbu Le', 4, 1, 5, 'Adhi', 216000, 4800000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Sentamizh Penne', 4, 1, 5, 'Adhi', 200000, 4500000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Iraiva', 4, 1, 5, 'Adhi', 280000, 5500000, 0.99);
-                    
-                    -- Hiphop Tamizha Tracks - Meesaya Murukku Album (Film Soundtrack)
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Sakkarakatti', 5, 1, 5, 'Adhi', 231000, 5100000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Enna Nadanthalum', 5, 1, 5, 'Adhi', 240000, 5200000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Vaadi Nee Vaa', 5, 1, 5, 'Adhi', 212000, 4700000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Machi Engalukku', 5, 1, 5, 'Adhi', 227000, 5000000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Great Ji', 5, 1, 5, 'Adhi', 213000, 4800000, 0.99);
-                    
-                    -- Hiphop Tamizha Tracks - Naa Oru Alien Album
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Yaarumey Venam', 6, 1, 5, 'Adhi', 245000, 5200000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Tamizhi', 6, 1, 5, 'Adhi', 253000, 5300000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Naa Oru Alien', 6, 1, 5, 'Adhi', 261000, 5400000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Poi Poi Poi', 6, 1, 5, 'Adhi', 236000, 5100000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Takkaru Takkaru', 6, 1, 5, 'Adhi', 271000, 5600000, 0.99);
-                    
-                    -- Additional Hiphop Tamizha Singles and Popular Songs
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Singles Collection', 4);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Thani Oruvan', 4);
-                    INSERT INTO Album (Title, ArtistId) VALUES ('Natpe Thunai', 4);
-                    
-                    -- Singles
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Vaadi Pulla Vaadi', 7, 1, 5, 'Adhi', 256000, 5300000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Quarantine & Chill', 7, 1, 5, 'Adhi', 220000, 4900000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Oorukaaran', 7, 1, 5, 'Adhi', 235000, 5100000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Chinna Paiyan', 7, 1, 5, 'Adhi', 243000, 5200000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Nadanthavaraikumey', 7, 1, 5, 'Adhi', 250000, 5300000, 0.99);
-                    
-                    -- Thani Oruvan
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Theemai Dhaan Vellum', 8, 1, 5, 'Adhi', 247000, 5200000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Thani Oruvan Title Track', 8, 1, 5, 'Adhi', 235000, 5100000, 0.99);
-                    
-                    -- Natpe Thunai
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Kerala Song', 9, 1, 5, 'Adhi', 232000, 5000000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Vengamavan', 9, 1, 5, 'Adhi', 228000, 4900000, 0.99);
-                    INSERT INTO Track (Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice)
-                    VALUES ('Veedhikor Jaadhi', 9, 1, 5, 'Adhi', 242000, 5100000, 0.99);
-                    
-                    -- Employee
-                    INSERT INTO Employee (LastName, FirstName, Title, Email)
-                    VALUES ('Smith', 'John', 'Sales Support Agent', 'john@example.com');
-                    
-                    -- Customer
-                    INSERT INTO Customer (FirstName, LastName, Phone, Email, SupportRepId)
-                    VALUES ('Jane', 'Doe', '+55 (12) 3923-5555', 'jane@example.com', 1);
-                    
-                    -- Invoice
-                    INSERT INTO Invoice (CustomerId, InvoiceDate, Total)
-                    VALUES (1, '2025-08-07 00:00:00', 8.91);
-                    
-                    -- InvoiceLine
-                    INSERT INTO InvoiceLine (InvoiceId, TrackId, UnitPrice, Quantity)
-                    VALUES (1, 1, 0.99, 3);
-                    INSERT INTO InvoiceLine (InvoiceId, TrackId, UnitPrice, Quantity)
-                    VALUES (1, 2, 0.99, 3);
-                    INSERT INTO InvoiceLine (InvoiceId, TrackId, UnitPrice, Quantity)
-                    VALUES (1, 3, 0.99, 3);
+                    -- Index the foreign keys the agent tools filter and join on
+                    -- (Invoice and InvoiceLine are covered by CHINOOK_QUERY_INDEXES)
+                    CREATE INDEX idx_album_artist ON Album(ArtistId);
+                    CREATE INDEX idx_track_album ON Track(AlbumId);
+                    CREATE INDEX idx_track_genre ON Track(GenreId);
                 ''')
                 
-                conn.commit()
+                # Seed rows carry explicit ids, so re-running an insert is a no-op
+                for statement, rows in (
+                    ("INSERT OR IGNORE INTO Artist (ArtistId, Name) VALUES (?, ?)", ARTISTS),
+                    ("INSERT OR IGNORE INTO Album (AlbumId, Title, ArtistId) VALUES (?, ?, ?)", ALBUMS),
+                    ("INSERT OR IGNORE INTO Genre (GenreId, Name) VALUES (?, ?)", GENRES),
+                    (
+                        "INSERT OR IGNORE INTO Track (TrackId, Name, AlbumId, MediaTypeId, GenreId, Composer, Milliseconds, Bytes, UnitPrice) "
+                        "VALUES (?, ?, ?, 1, ?, ?, ?, ?, 0.99)",
+                        TRACKS
+                    ),
+                    ("INSERT OR IGNORE INTO Employee (EmployeeId, LastName, FirstName, Title, Email) VALUES (?, ?, ?, ?, ?)", EMPLOYEES),
+                    ("INSERT OR IGNORE INTO Customer (CustomerId, FirstName, LastName, Phone, Email, SupportRepId) VALUES (?, ?, ?, ?, ?, ?)", CUSTOMERS),
+                    ("INSERT OR IGNORE INTO Invoice (InvoiceId, CustomerId, InvoiceDate, Total) VALUES (?, ?, ?, ?)", INVOICES),
+                    ("INSERT OR IGNORE INTO InvoiceLine (InvoiceLineId, InvoiceId, TrackId, UnitPrice, Quantity) VALUES (?, ?, ?, ?, ?)", INVOICE_LINES),
+                ):
+                    cursor.executemany(statement, rows)
+                
+                for statement in CHINOOK_QUERY_INDEXES:
+                    cursor.execute(statement)
+                
+                # Gather planner statistics for the agent queries
+                cursor.execute('ANALYZE')
+                cursor.execute('COMMIT')
+                
                 conn.close()
                 
                 self.stdout.write(self.style.SUCCESS('Created Chinook database'))
+            else:
+                import sqlite3
+                
+                # Add the invoice tool indexes to a database created elsewhere
+                conn = sqlite3.connect(db_path)
+                with conn:
+                    for statement in CHINOOK_QUERY_INDEXES:
+                        conn.execute(statement)
+                    conn.execute('ANALYZE')
+                conn.close()
             
             # Register the database in Django
             Database.objects.create(
                 name='Chinook',
-                description='Sample music store database',
                 connection_string=f'sqlite:///{db_path}',
                 is_active=True
             )
@@ -357,9 +417,6 @@ class Command(BaseCommand):
             AgentConfig.objects.create(
                 name='Default Configuration',
                 description='Default agent configuration',
-                config_json='{"max_steps": 10, "temperature": 0.0}',
                 is_active=True
             )
-            self.stdout.write(self.style.SUCCESS('Created default agent configuration'))
-        
-        self.stdout.write(self.style.SUCCESS('Database initialization complete!')) 
\ No newline at end of file
+            self.stdout.write(self.style.SUCCESS('Created default agent configuration')) 
\ No newline at end of file
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:07
+
+import agentsapp.models
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0002_alter_message_options_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='conversation',
+            name='thread_id',
+            field=models.UUIDField(default=agentsapp.models.uuid7, unique=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:12
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0003_conversation_thread_id_uuid7'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='conversation',
+            index=models.Index(fields=['user', '-updated_at'], name='agentsapp_c_user_id_e5d4fb_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'created_at'], name='agentsapp_m_convers_149e14_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:20
+
+from django.db import migrations, models
+
+
+def fill_empty_metadata(apps, schema_editor):
+    """Store an empty JSON object where no metadata was saved yet"""
+    Conversation = apps.get_model('agentsapp', 'Conversation')
+    Conversation.objects.filter(models.Q(metadata__isnull=True) | models.Q(metadata='')).update(metadata='{}')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0004_conversation_message_indexes'),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name='conversation',
+            old_name='_metadata',
+            new_name='metadata',
+        ),
+        migrations.RunPython(fill_empty_metadata, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='conversation',
+            name='metadata',
+            field=models.JSONField(blank=True, default=dict, null=True),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0005_conversation_metadata_jsonfield'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='llmmodel',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True),
+        ),
+        migrations.AlterField(
+            model_name='llmmodel',
+            name='updated_at',
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
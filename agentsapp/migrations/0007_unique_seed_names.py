@@ -0,0 +1,38 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0006_llmmodel_auto_timestamps'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='agenttype',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='database',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='llmmodel',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='tool',
+            name='function_name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+        migrations.AlterField(
+            model_name='tool',
+            name='name',
+            field=models.CharField(max_length=100, unique=True),
+        ),
+    ]
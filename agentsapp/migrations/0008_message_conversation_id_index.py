@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:36
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0007_unique_seed_names'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='message',
+            index=models.Index(fields=['conversation', 'id'], name='agentsapp_m_convers_42bba6_idx'),
+        ),
+    ]
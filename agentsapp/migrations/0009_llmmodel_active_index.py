@@ -0,0 +1,17 @@
+# Generated by Django 5.2.18 on 2026-10-15 02:43
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('agentsapp', '0008_message_conversation_id_index'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='llmmodel',
+            index=models.Index(condition=models.Q(('is_active', True)), fields=['is_active'], name='llm_active_idx'),
+        ),
+    ]
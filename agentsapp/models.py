@@ -1,13 +1,37 @@
 from django.db import models
 from django.contrib.auth.models import User
+import os
+import time
 import uuid
-import json
-from django.utils import timezone
+
+
+def uuid7():
+    """
+    Generate a time-ordered UUID (version 7, RFC 9562)
+    
+    New IDs sort after older ones, so inserts keyed on them land at the end of
+    the index instead of scattering across it like uuid4.
+    
+    Returns:
+        A uuid.UUID
+    """
+    # Python 3.14+ ships an implementation
+    if hasattr(uuid, "uuid7"):
+        return uuid.uuid7()
+    
+    timestamp_ms = time.time_ns() // 1_000_000
+    rand = int.from_bytes(os.urandom(10), "big")
+    value = (timestamp_ms & 0xFFFF_FFFF_FFFF) << 80  # 48-bit unix_ts_ms
+    value |= 0x7 << 76  # version
+    value |= ((rand >> 68) & 0xFFF) << 64  # rand_a
+    value |= 0b10 << 62  # variant
+    value |= rand & ((1 << 62) - 1)  # rand_b
+    return uuid.UUID(int=value)
 
 
 class LLMModel(models.Model):
     """Model for storing LLM configurations"""
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     provider = models.CharField(max_length=50)
     api_base = models.CharField(max_length=200, blank=True, null=True)
     api_key = models.CharField(max_length=200, blank=True, null=True)
@@ -15,8 +39,14 @@ class LLMModel(models.Model):
     temperature = models.FloatField(default=0.7)
     max_tokens = models.IntegerField(default=1000)
     is_active = models.BooleanField(default=False)
-    created_at = models.DateTimeField(default=timezone.now)
-    updated_at = models.DateTimeField(default=timezone.now)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    class Meta:
+        indexes = [
+            # Partial index over the (single) active row, which get_llm looks up
+            models.Index(fields=["is_active"], name="llm_active_idx", condition=models.Q(is_active=True)),
+        ]
     
     def __str__(self):
         return f"{self.name} ({self.provider})"
@@ -24,7 +54,7 @@ class LLMModel(models.Model):
 
 class AgentType(models.Model):
     """Model for storing agent type configurations"""
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     description = models.TextField(blank=True, null=True)
     
     def __str__(self):
@@ -33,9 +63,9 @@ class AgentType(models.Model):
 
 class Tool(models.Model):
     """Model for storing tool configurations"""
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     description = models.TextField()
-    function_name = models.CharField(max_length=100)
+    function_name = models.CharField(max_length=100, unique=True)
     
     def __str__(self):
         return self.name
@@ -52,12 +82,13 @@ class AgentConfig(models.Model):
     is_active = models.BooleanField(default=False)
     
     def __str__(self):
-        return f"{self.name} ({self.agent_type.name if self.agent_type else 'No Type'})"
+        # Test the raw id so an unset type doesn't cost a query
+        return f"{self.name} ({self.agent_type.name if self.agent_type_id else 'No Type'})"
 
 
 class Database(models.Model):
     """Model for storing database configurations"""
-    name = models.CharField(max_length=100)
+    name = models.CharField(max_length=100, unique=True)
     connection_string = models.CharField(max_length=500)
     is_active = models.BooleanField(default=False)
     
@@ -89,27 +120,19 @@ class UserPreference(models.Model):
 
 class Conversation(models.Model):
     """Model for storing conversations"""
-    thread_id = models.UUIDField(default=uuid.uuid4, unique=True)
+    thread_id = models.UUIDField(default=uuid7, unique=True)
     user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="conversations")
     title = models.CharField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
-    _metadata = models.TextField(blank=True, null=True, db_column="metadata")
+    metadata = models.JSONField(blank=True, null=True, default=dict)
+    
+    class Meta:
+        # Serves the per-user conversation list ordered by most recent activity
+        indexes = [models.Index(fields=["user", "-updated_at"])]
     
     def __str__(self):
         return f"{self.title} ({self.user.username})"
-    
-    @property
-    def metadata(self):
-        """Get metadata as dictionary"""
-        if self._metadata:
-            return json.loads(self._metadata)
-        return {}
-    
-    @metadata.setter
-    def metadata(self, value):
-        """Set metadata from dictionary"""
-        self._metadata = json.dumps(value)
 
 
 class Message(models.Model):
@@ -125,6 +148,12 @@ class Message(models.Model):
     
     class Meta:
         ordering = ["created_at"]
+        indexes = [
+            # Matches the default ordering so per-conversation reads are served from the index
+            models.Index(fields=["conversation", "created_at"]),
+            # Serves rewinding a conversation past a message (id range within a conversation)
+            models.Index(fields=["conversation", "id"]),
+        ]
     
     def __str__(self):
         return f"{self.role}: {self.content[:50]}..."
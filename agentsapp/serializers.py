@@ -1,3 +1,4 @@
+from collections import Counter
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from .models import (
@@ -48,6 +49,39 @@ class UserProfileSerializer(serializers.ModelSerializer):
         fields = ['id', 'user', 'customer_id', 'preferences']
 
 
+# Number of characters of message content shown in previews
+PREVIEW_LENGTH = 100
+
+
+def preview_content(content):
+    """Truncate message content to a preview, marking it when cut"""
+    return content[:PREVIEW_LENGTH] + ('...' if len(content) > PREVIEW_LENGTH else '')
+
+
+def get_agent_history(conversation):
+    """Get the agent history entries recorded in a conversation's metadata"""
+    return agent_history_from_metadata(conversation.metadata)
+
+
+def agent_history_from_metadata(metadata):
+    """Get the agent history entries from a conversation metadata value"""
+    return (metadata.get('agent_history') if metadata else None) or []
+
+
+def summarize_agents(history):
+    """Count the agent history entries per agent type"""
+    return dict(Counter(entry.get('agent_type', 'unknown') for entry in history))
+
+
+def agent_types_by_message(history):
+    """Map message ids to the agent type recorded for them in the agent history"""
+    return {
+        entry['message_id']: entry.get('agent_type', 'unknown')
+        for entry in history
+        if 'message_id' in entry
+    }
+
+
 class MessageSerializer(serializers.ModelSerializer):
     agent_type = serializers.SerializerMethodField()
     
@@ -58,15 +92,11 @@ class MessageSerializer(serializers.ModelSerializer):
     def get_agent_type(self, obj):
         """Get the agent type that generated this message"""
         try:
-            if obj.conversation and hasattr(obj.conversation, 'metadata'):
-                metadata = obj.conversation.metadata
-                if metadata and 'agent_history' in metadata:
-                    # Find the agent entry with the closest timestamp to this message
-                    agent_entries = metadata['agent_history']
-                    for entry in agent_entries:
-                        if 'message_id' in entry and entry['message_id'] == obj.id:
-                            return entry.get('agent_type', 'unknown')
-            return "unknown"
+            # ConversationSerializer builds the message id -> agent type map once
+            agent_by_mid = self.context.get('agent_by_mid')
+            if agent_by_mid is None:
+                agent_by_mid = agent_types_by_message(get_agent_history(obj.conversation))
+            return agent_by_mid.get(obj.id, 'unknown')
         except Exception:
             return "unknown"
 
@@ -80,14 +110,35 @@ class ConversationSerializer(serializers.ModelSerializer):
         model = Conversation
         fields = ['id', 'thread_id', 'title', 'user', 'messages', 'created_at', 'updated_at', 'agents_used']
     
+    def to_representation(self, instance):
+        # Read the agent history once and share it with the nested messages and agents_used
+        self._agent_history = get_agent_history(instance)
+        self.context['agent_by_mid'] = agent_types_by_message(self._agent_history)
+        try:
+            return super().to_representation(instance)
+        finally:
+            self._agent_history = None
+    
     def get_agents_used(self, obj):
         """Get a list of unique agents used in this conversation"""
-        if hasattr(obj, 'metadata'):
-            metadata = obj.metadata
-            if metadata and 'agent_history' in metadata:
-                return list(set([entry.get('agent_type', 'unknown') 
-                           for entry in metadata['agent_history']]))
-        return []
+        history = getattr(self, '_agent_history', None)
+        if history is None:
+            history = get_agent_history(obj)
+        return sorted({entry.get('agent_type', 'unknown') for entry in history})
+
+
+class MessagePreviewSerializer(MessageSerializer):
+    """Message serializer that returns a content preview instead of the full body"""
+    content = serializers.SerializerMethodField()
+    
+    def get_content(self, obj):
+        # The view annotates only the first PREVIEW_LENGTH + 1 characters
+        return preview_content(obj.content_preview)
+
+
+class ConversationPreviewSerializer(ConversationSerializer):
+    """Conversation serializer whose messages carry content previews"""
+    messages = MessagePreviewSerializer(many=True, read_only=True)
 
 
 class ConversationListSerializer(serializers.ModelSerializer):
@@ -101,30 +152,71 @@ class ConversationListSerializer(serializers.ModelSerializer):
         fields = ['id', 'thread_id', 'title', 'created_at', 'updated_at', 'message_count', 'agent_summary', 'last_message']
     
     def get_message_count(self, obj):
+        # Use the count annotated by the view when present instead of a query per row
+        if hasattr(obj, 'message_count'):
+            return obj.message_count
         return obj.messages.count()
     
     def get_agent_summary(self, obj):
         """Get a summary of agents used in this conversation"""
-        if hasattr(obj, 'metadata'):
-            metadata = obj.metadata
-            if metadata and 'agent_history' in metadata:
-                agent_counts = {}
-                for entry in metadata['agent_history']:
-                    agent_type = entry.get('agent_type', 'unknown')
-                    agent_counts[agent_type] = agent_counts.get(agent_type, 0) + 1
-                return agent_counts
-        return {}
+        return summarize_agents(get_agent_history(obj))
     
     def get_last_message(self, obj):
         """Get the last message in the conversation"""
-        last_message = obj.messages.last()
-        if last_message:
-            return {
-                'role': last_message.role,
-                'content': last_message.content[:100] + ('...' if len(last_message.content) > 100 else ''),
-                'created_at': last_message.created_at
-            }
-        return None
+        # Use the fields annotated by the view when present instead of a query per row
+        if hasattr(obj, 'last_message_role'):
+            if obj.last_message_role is None:
+                return None
+            role, content, created_at = obj.last_message_role, obj.last_message_content, obj.last_message_created_at
+        else:
+            last_message = obj.messages.last()
+            if not last_message:
+                return None
+            role, content, created_at = last_message.role, last_message.content, last_message.created_at
+        
+        return {
+            'role': role,
+            'content': preview_content(content),
+            'created_at': created_at
+        }
+
+
+# Columns conversation_list_item reads from the view's annotated list queryset
+CONVERSATION_LIST_VALUES = (
+    'id', 'thread_id', 'title', 'created_at', 'updated_at', 'metadata', 'message_count',
+    'last_message_role', 'last_message_content', 'last_message_created_at',
+)
+
+
+def conversation_list_item(row):
+    """
+    Build the ConversationListSerializer representation from a values() row
+    
+    Skips model instances and per-field serializer calls for the list endpoint.
+    
+    Args:
+        row: Dict of CONVERSATION_LIST_VALUES
+        
+    Returns:
+        Dict with the same fields ConversationListSerializer outputs
+    """
+    last_message = None
+    if row['last_message_role'] is not None:
+        last_message = {
+            'role': row['last_message_role'],
+            'content': preview_content(row['last_message_content']),
+            'created_at': row['last_message_created_at']
+        }
+    return {
+        'id': row['id'],
+        'thread_id': row['thread_id'],
+        'title': row['title'],
+        'created_at': row['created_at'],
+        'updated_at': row['updated_at'],
+        'message_count': row['message_count'],
+        'agent_summary': summarize_agents(agent_history_from_metadata(row['metadata'])),
+        'last_message': last_message
+    }
 
 
 class AgentConfigSerializer(serializers.ModelSerializer):
@@ -156,6 +248,7 @@ class ChatResponseSerializer(serializers.Serializer):
     response = serializers.CharField(required=False)
     requires_input = serializers.BooleanField(required=False, default=False) 
     agent_type = serializers.CharField(required=False)
+    task_id = serializers.CharField(required=False)
 
 
 class ContinueChatSerializer(serializers.Serializer):
@@ -0,0 +1,512 @@
+import json
+import logging
+import uuid
+from functools import lru_cache
+from typing import Dict, Optional, Any
+
+import redis
+from celery import shared_task
+from django.conf import settings
+from django.db import transaction
+
+from langchain_core.messages import AIMessage
+
+from .models import Conversation, Message
+from .agent_builder import get_agent_system, run_agent_with_input
+from .utils import save_detailed_chat_history, detect_agent_type
+
+
+logger = logging.getLogger(__name__)
+
+
+# Task states recorded in the state store
+TASK_QUEUED = "queued"
+TASK_RUNNING = "running"
+TASK_COMPLETED = "completed"
+TASK_FAILED = "failed"
+
+# Replies saved when a run fails
+_ERROR_APOLOGY = "I'm sorry, I encountered an unexpected error. Please try again."
+_RUN_ERROR_APOLOGY = "I'm sorry, I encountered an error processing your request. Let me try a different approach."
+_RUN_ERROR_FALLBACK = "I'm having trouble with our AI system at the moment. Please try again later or contact customer support for immediate assistance."
+_RESUME_ERROR_APOLOGY = "I'm sorry, I encountered an error processing your request. Let me try again."
+_ERROR_MESSAGE = "Error processing message: %s"
+
+# Redis stream of events published while an agent task runs: "token" (reply text
+# as it is generated), "retry" (discard the tokens so far) and "done" (final payload)
+TASK_EVENTS_KEY = "task:{task_id}:events"
+# How long an events reader blocks waiting for the next event (milliseconds)
+TASK_EVENTS_BLOCK_MS = 15000
+
+
+@lru_cache(maxsize=1)
+def get_state_store():
+    """Get the Redis client holding agent task states (one per process)"""
+    return redis.Redis.from_url(settings.AGENT_TASK_STATE_URL, decode_responses=True)
+
+
+def set_task_state(task_id: str, **fields):
+    """
+    Record fields of an agent task's state
+
+    Args:
+        task_id: The task ID
+        **fields: Fields to set; a "result" dict is stored as JSON
+    """
+    if "result" in fields:
+        fields["result"] = json.dumps(fields["result"])
+    key = f"task:{task_id}"
+    pipe = get_state_store().pipeline()
+    pipe.hset(key, mapping=fields)
+    pipe.expire(key, settings.AGENT_TASK_STATE_TTL)
+    pipe.execute()
+
+
+def publish_task_event(task_id: str, event: str, data=None):
+    """
+    Append an event to an agent task's event stream
+
+    Args:
+        task_id: The task ID
+        event: The event name
+        data: The event data, stored as JSON
+    """
+    key = TASK_EVENTS_KEY.format(task_id=task_id)
+    pipe = get_state_store().pipeline()
+    pipe.xadd(key, {"event": event, "data": json.dumps(data)})
+    pipe.expire(key, settings.AGENT_TASK_STATE_TTL)
+    pipe.execute()
+
+
+def finish_task(task_id: str, status: str, payload: Dict[str, Any]):
+    """
+    Record an agent task's final state and publish its "done" event
+
+    Args:
+        task_id: The task ID
+        status: TASK_COMPLETED or TASK_FAILED
+        payload: Response payload for the client
+    """
+    set_task_state(task_id, status=status, result=payload)
+    publish_task_event(task_id, "done", payload)
+
+
+def iter_task_events(task_id: str):
+    """
+    Follow an agent task's event stream until its "done" event
+
+    Args:
+        task_id: The task ID
+
+    Returns:
+        Iterator of (event, JSON data) tuples; (None, None) each time no event
+        arrived within TASK_EVENTS_BLOCK_MS, so callers can send a keep-alive
+    """
+    store = get_state_store()
+    key = TASK_EVENTS_KEY.format(task_id=task_id)
+    last_id = "0-0"
+    while True:
+        entries = store.xread({key: last_id}, count=100, block=TASK_EVENTS_BLOCK_MS)
+        if not entries:
+            # Stop following a task that expired without finishing
+            if get_task_state(task_id) is None:
+                return
+            yield None, None
+            continue
+        for last_id, fields in entries[0][1]:
+            yield fields["event"], fields["data"]
+            if fields["event"] == "done":
+                return
+
+
+def get_task_state(task_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Get an agent task's state
+
+    Args:
+        task_id: The task ID
+
+    Returns:
+        Dict of the task's fields, or None if the task is unknown or expired
+    """
+    state = get_state_store().hgetall(f"task:{task_id}")
+    if not state:
+        return None
+    if "result" in state:
+        state["result"] = json.loads(state["result"])
+    return state
+
+
+def queue_agent_task(conversation, user_id: str, user_input=None, resume_input=None) -> str:
+    """
+    Queue an agent run for a conversation
+
+    Args:
+        conversation: The conversation object
+        user_id: ID of the user who sent the message
+        user_input: The user's message for a new turn
+        resume_input: The user's reply when resuming an interrupted run
+
+    Returns:
+        The task ID
+    """
+    task_id = str(uuid.uuid4())
+    thread_id = str(conversation.thread_id)
+    # Record the task before queueing it so a poll never finds it missing
+    set_task_state(task_id, status=TASK_QUEUED, thread_id=thread_id, user_id=user_id)
+    run_agent_task.apply_async(
+        args=(conversation.pk, user_input, thread_id, user_id, resume_input),
+        task_id=task_id,
+    )
+    return task_id
+
+
+def get_final_ai_content(result) -> Optional[str]:
+    """
+    Get the content of the last AI message in an agent result
+
+    Args:
+        result: A completed result from run_agent_with_input
+
+    Returns:
+        The message content, or None if the result has no AI message
+    """
+    # Look for the last AI message in the list
+    for msg in reversed(result['result']['messages']):
+        msg_type = type(msg)
+        # Graph results hold AIMessage instances, so test the exact type first
+        if msg_type is AIMessage:
+            return msg.content
+        # Check for the other message formats
+        if msg_type is dict:
+            if msg.get('type') == 'ai':
+                return msg.get('content', "")
+        elif (isinstance(msg, AIMessage) or getattr(msg, 'type', None) == 'ai'
+              or getattr(msg, 'role', None) == 'assistant'):
+            return getattr(msg, 'content', "")
+    return None
+
+
+def run_chat(conversation, message: str, thread_id: str, user_id: str, on_token=None) -> Dict[str, Any]:
+    """
+    Run the agent on a new user message and save its reply
+
+    Args:
+        conversation: The conversation object
+        message: The user's message
+        thread_id: The conversation's thread ID
+        user_id: ID of the user who sent the message
+        on_token: Optional callback receiving reply tokens as they are generated
+
+    Returns:
+        Response payload for the client
+    """
+    result = run_agent_with_input(
+        get_agent_system(),
+        message,
+        thread_id=thread_id,
+        user_id=user_id,
+        on_token=on_token
+    )
+
+    # Check if interrupted (needs user input)
+    if result['status'] == 'interrupted':
+        with transaction.atomic():
+            # Save system message requesting input
+            assistant_message = Message.objects.create(
+                conversation=conversation,
+                role='assistant',
+                content=result['message']
+            )
+
+            # Save detailed chat history with agent info
+            save_detailed_chat_history(
+                conversation,
+                result['message'],
+                "supervisor_agent",
+                assistant_message.id
+            )
+
+        return {
+            'status': 'interrupted',
+            'thread_id': thread_id,
+            'message': result['message'],
+            'requires_input': True
+        }
+
+    # Check for error
+    if result['status'] == 'error':
+        error_message = _ERROR_MESSAGE % result['message']
+        if 'error_details' in result:
+            logger.error("Detailed error: %s", result['error_details'],
+                         extra={'thread_id': thread_id, 'user_id': user_id})
+
+        with transaction.atomic():
+            # Save the error message and a default response in one INSERT
+            assistant_message, assistant_message2 = Message.objects.bulk_create([
+                Message(
+                    conversation=conversation,
+                    role='assistant',
+                    content=_RUN_ERROR_APOLOGY
+                ),
+                Message(
+                    conversation=conversation,
+                    role='assistant',
+                    content=_RUN_ERROR_FALLBACK
+                ),
+            ])
+
+            # Save detailed chat history with agent info
+            save_detailed_chat_history(
+                conversation,
+                "Error processing request",
+                "error_handler",
+                assistant_message.id
+            )
+
+            # Save detailed chat history
+            save_detailed_chat_history(
+                conversation,
+                assistant_message2.content,
+                "fallback_handler",
+                assistant_message2.id
+            )
+
+        return {
+            'status': 'error',
+            'thread_id': thread_id,
+            'message': error_message,
+            'response': assistant_message2.content
+        }
+
+    # Process successful response
+    content = get_final_ai_content(result)
+    if content is not None:
+        # Determine which agent handled the request
+        agent_type = detect_agent_type(message)
+    else:
+        # No assistant message found, provide a fallback
+        content = "I processed your request but couldn't generate a proper response. Please try again."
+        agent_type = "fallback_handler"
+
+    with transaction.atomic():
+        # Save assistant message
+        assistant_message = Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=content
+        )
+
+        # Save detailed chat history with agent info
+        save_detailed_chat_history(
+            conversation,
+            content,
+            agent_type,
+            assistant_message.id
+        )
+
+    return {
+        'status': 'complete',
+        'thread_id': thread_id,
+        'response': content,
+        'agent_type': agent_type
+    }
+
+
+def resume_chat(conversation, message: str, thread_id: str, user_id: str, on_token=None) -> Dict[str, Any]:
+    """
+    Resume an interrupted agent run with the user's reply and save the agent's reply
+
+    Args:
+        conversation: The conversation object
+        message: The user's reply
+        thread_id: The conversation's thread ID
+        user_id: ID of the user who sent the reply
+        on_token: Optional callback receiving reply tokens as they are generated
+
+    Returns:
+        Response payload for the client
+    """
+    agent_system = get_agent_system()
+    result = run_agent_with_input(
+        agent_system,
+        None,  # No initial message when resuming
+        thread_id=thread_id,
+        user_id=user_id,
+        resume_input=message,
+        on_token=on_token
+    )
+
+    # Check if interrupted again (needs more user input)
+    if result['status'] == 'interrupted':
+        # Save system message requesting input
+        Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=result['message']
+        )
+
+        return {
+            'status': 'interrupted',
+            'thread_id': thread_id,
+            'message': result['message'],
+            'requires_input': True
+        }
+
+    # Check for error
+    if result['status'] == 'error':
+        error_message = _ERROR_MESSAGE % result['message']
+        if 'error_details' in result:
+            logger.error("Detailed error: %s", result['error_details'],
+                         extra={'thread_id': thread_id, 'user_id': user_id})
+
+        # Save error message
+        Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=_RESUME_ERROR_APOLOGY
+        )
+
+        # Try again with a fresh conversation (not streamed; its reply arrives with the final payload)
+        result = run_agent_with_input(
+            agent_system,
+            message,  # Use the message as a fresh input
+            thread_id=thread_id,
+            user_id=user_id
+        )
+
+        # If fresh attempt also failed, return error
+        if result['status'] != 'complete':
+            return {
+                'status': 'error',
+                'thread_id': thread_id,
+                'message': error_message
+            }
+
+    # Process successful response
+    content = get_final_ai_content(result)
+    if content is None:
+        return {
+            'status': 'error',
+            'thread_id': thread_id,
+            'message': "No assistant response found"
+        }
+
+    # Save assistant message
+    Message.objects.create(
+        conversation=conversation,
+        role='assistant',
+        content=content
+    )
+
+    return {
+        'status': 'complete',
+        'thread_id': thread_id,
+        'response': content
+    }
+
+
+@shared_task(bind=True, max_retries=3, default_retry_delay=60)
+def run_agent_task(self, conversation_id, user_input, thread_id, user_id, resume_input=None):
+    """
+    Run the agent for a conversation outside the request/response cycle
+
+    Progress is recorded in the state store under the task ID and reply tokens
+    are published to its event stream. Errors building the agent system are
+    retried; errors once the run has started mark the task failed straight away.
+
+    Args:
+        conversation_id: Primary key of the conversation
+        user_input: The user's message for a new turn
+        thread_id: The conversation's thread ID
+        user_id: ID of the user who sent the message
+        resume_input: The user's reply when resuming an interrupted run
+
+    Returns:
+        Response payload for the client
+    """
+    task_id = self.request.id
+    set_task_state(task_id, status=TASK_RUNNING)
+
+    try:
+        conversation = Conversation.objects.get(pk=conversation_id)
+    except Conversation.DoesNotExist:
+        # Deleted since the run was queued; nothing to save the reply to
+        payload = {
+            'status': 'error',
+            'thread_id': thread_id,
+            'message': "Conversation not found"
+        }
+        finish_task(task_id, TASK_FAILED, payload)
+        return payload
+
+    try:
+        # Building the agent system is the only step that runs before the graph
+        # touches the thread's checkpoint, so it is the only one safely retried
+        get_agent_system()
+    except Exception as e:
+        if self.request.retries < self.max_retries:
+            set_task_state(task_id, status=TASK_QUEUED)
+            publish_task_event(task_id, "retry")
+            raise self.retry(exc=e)
+        return fail_agent_task(task_id, conversation, thread_id, user_id, e)
+
+    # Stream the reply to clients following the task's events as it is generated
+    def on_token(token):
+        publish_task_event(task_id, "token", token)
+
+    try:
+        if resume_input is not None:
+            payload = resume_chat(conversation, resume_input, thread_id, user_id, on_token=on_token)
+        else:
+            payload = run_chat(conversation, user_input, thread_id, user_id, on_token=on_token)
+    except Exception as e:
+        # Not retried: the graph may already have added the user's message to the
+        # thread's checkpoint, and running it again would add it a second time
+        return fail_agent_task(task_id, conversation, thread_id, user_id, e)
+
+    finish_task(task_id, TASK_COMPLETED, payload)
+    return payload
+
+
+def fail_agent_task(task_id: str, conversation, thread_id: str, user_id: str, error: Exception) -> Dict[str, Any]:
+    """
+    Save an apology for a failed agent run and mark its task failed
+
+    Args:
+        task_id: The task ID
+        conversation: The conversation object
+        thread_id: The conversation's thread ID
+        user_id: ID of the user who sent the message
+        error: The exception the run failed with
+
+    Returns:
+        Response payload for the client
+    """
+    # The traceback is only formatted if a handler emits the record
+    logger.error("Agent task failed", exc_info=error, extra={'thread_id': thread_id, 'user_id': user_id})
+
+    with transaction.atomic():
+        # Save error message
+        assistant_message = Message.objects.create(
+            conversation=conversation,
+            role='assistant',
+            content=_ERROR_APOLOGY
+        )
+
+        # Save detailed chat history
+        save_detailed_chat_history(
+            conversation,
+            assistant_message.content,
+            "error_handler",
+            assistant_message.id
+        )
+
+    payload = {
+        'status': 'error',
+        'thread_id': thread_id,
+        'message': _ERROR_MESSAGE % error,
+        'response': assistant_message.content
+    }
+    finish_task(task_id, TASK_FAILED, payload)
+    return payload
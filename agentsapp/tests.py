@@ -1,3 +1,362 @@
-from django.test import TestCase
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.urls import reverse
+from rest_framework import status
+from rest_framework.test import APIClient
+
+from . import tasks
+from .agent_builder import classify_invoice_intent, classify_music_intent
+from .models import Conversation, LLMModel, Message
+from .utils import select_agent_domains
+from .views import activate_only
+
+
+# Throttled endpoints count requests in the cache; keep them off Redis in tests
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class FakeStateStore:
+    """In-memory stand-in for the Redis commands the agent task state store uses"""
+
+    def __init__(self):
+        self.hashes = {}
+        self.streams = {}
+
+    def pipeline(self):
+        return self
+
+    def execute(self):
+        return []
+
+    def expire(self, key, ttl):
+        pass
+
+    def hset(self, key, mapping):
+        self.hashes.setdefault(key, {}).update(mapping)
+
+    def hgetall(self, key):
+        return dict(self.hashes.get(key, {}))
+
+    def xadd(self, key, fields):
+        stream = self.streams.setdefault(key, [])
+        stream.append((f"{len(stream) + 1}-0", fields))
+
+    def xread(self, streams, count=None, block=None):
+        (key, last_id), = streams.items()
+        last = int(last_id.split("-")[0])
+        entries = [entry for entry in self.streams.get(key, []) if int(entry[0].split("-")[0]) > last]
+        return [[key, entries[:count]]] if entries else []
+
+
+class MusicIntentTests(TestCase):
+    """Keyword routing of music questions to catalog tools"""
+
+    def test_artist_and_album_picks_albums_by_artist(self):
+        self.assertEqual(
+            classify_music_intent("Which albums does the artist Queen have?"),
+            ("get_albums_by_artist", "queen")
+        )
+
+    def test_artist_picks_tracks_by_artist(self):
+        self.assertEqual(
+            classify_music_intent("Show me the artist Metallica"),
+            ("get_tracks_by_artist", "metallica")
+        )
+
+    def test_genre_wins_over_song(self):
+        self.assertEqual(
+            classify_music_intent("Recommend songs in the genre Jazz"),
+            ("get_songs_by_genre", "jazz")
+        )
+
+    def test_song_title_keeps_its_case(self):
+        self.assertEqual(
+            classify_music_intent("Do you have the track Yesterday?"),
+            ("check_for_songs", "Yesterday")
+        )
+
+    def test_missing_parameter_uses_default(self):
+        self.assertEqual(classify_music_intent("What is your favourite genre"), ("get_songs_by_genre", "Rock"))
+
+    def test_no_keywords(self):
+        self.assertEqual(classify_music_intent("Hello there"), (None, ""))
+
+
+class InvoiceIntentTests(TestCase):
+    """Keyword routing of invoice questions to invoice tools"""
+
+    def test_price_picks_sorted_by_unit_price(self):
+        self.assertEqual(
+            classify_invoice_intent("Show my most expensive purchases"),
+            ("get_invoices_sorted_by_unit_price", None)
+        )
+
+    def test_support_extracts_invoice_id(self):
+        self.assertEqual(
+            classify_invoice_intent("Who was the support rep for invoice 12?"),
+            ("get_employee_by_invoice_and_customer", "12")
+        )
+
+    def test_employee_without_invoice_id_uses_default(self):
+        self.assertEqual(
+            classify_invoice_intent("Which employee helped me?"),
+            ("get_employee_by_invoice_and_customer", "1")
+        )
+
+    def test_defaults_to_invoices_by_date(self):
+        self.assertEqual(
+            classify_invoice_intent("Show my invoices"),
+            ("get_invoices_by_customer_sorted_by_date", None)
+        )
+
+
+class SelectAgentDomainsTests(TestCase):
+    """Picking the sub-agent domains a query touches"""
+
+    def test_single_domain(self):
+        self.assertEqual(select_agent_domains("Play some music"), ["music"])
+        self.assertEqual(select_agent_domains("Where is my PAYMENT?"), ["invoice"])
+
+    def test_both_domains_in_routing_order(self):
+        self.assertEqual(select_agent_domains("I want to buy a song"), ["music", "invoice"])
+
+    def test_terms_match_inside_words(self):
+        self.assertEqual(select_agent_domains("Albums I ordered"), ["music", "invoice"])
+
+    def test_no_domain(self):
+        self.assertEqual(select_agent_domains("Hello"), [])
+
+
+class ConversationMetadataMigrationTests(TransactionTestCase):
+    """0005 turns the text metadata column into JSON, filling in missing values"""
+
+    migrate_from = [('agentsapp', '0004_conversation_message_indexes')]
+    migrate_to = [('agentsapp', '0005_conversation_metadata_jsonfield')]
+
+    def setUp(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_from)
+        old_apps = executor.loader.project_state(self.migrate_from).apps
+
+        OldUser = old_apps.get_model('auth', 'User')
+        OldConversation = old_apps.get_model('agentsapp', 'Conversation')
+        user = OldUser.objects.create(username='migration-user')
+        self.missing_id = OldConversation.objects.create(user=user, title='Missing', _metadata=None).pk
+        self.empty_id = OldConversation.objects.create(user=user, title='Empty', _metadata='').pk
+        self.saved_id = OldConversation.objects.create(user=user, title='Saved', _metadata='{"topic": "jazz"}').pk
+
+        executor = MigrationExecutor(connection)
+        executor.migrate(self.migrate_to)
+        self.apps = executor.loader.project_state(self.migrate_to).apps
+
+    def tearDown(self):
+        executor = MigrationExecutor(connection)
+        executor.migrate(executor.loader.graph.leaf_nodes())
+
+    def test_metadata_is_json(self):
+        Conversation = self.apps.get_model('agentsapp', 'Conversation')
+        metadata = dict(Conversation.objects.values_list('pk', 'metadata'))
+        self.assertEqual(metadata[self.missing_id], {})
+        self.assertEqual(metadata[self.empty_id], {})
+        self.assertEqual(metadata[self.saved_id], {"topic": "jazz"})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ContinueFromMessageTests(TestCase):
+    """Rewinding a conversation before adding a new message"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='listener', password='secret')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.conversation = Conversation.objects.create(user=self.user, title='Chat')
+        self.messages = [
+            Message.objects.create(conversation=self.conversation, role=role, content=content)
+            for role, content in (('user', 'one'), ('assistant', 'two'), ('user', 'three'), ('assistant', 'four'))
+        ]
+        self.url = reverse('conversation-continue-from-message', kwargs={'thread_id': self.conversation.thread_id})
+
+    def post(self, data):
+        with mock.patch('agentsapp.views.queue_agent_task', return_value='task-1') as queue:
+            response = self.client.post(self.url, data, format='json')
+        return response, queue
+
+    def contents(self):
+        return list(self.conversation.messages.order_by('id').values_list('content', flat=True))
+
+    def test_deletes_later_messages(self):
+        response, queue = self.post({'message': 'again', 'continue_from_message_id': self.messages[1].id})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(response.data['task_id'], 'task-1')
+        self.assertEqual(self.contents(), ['one', 'two', 'again'])
+        queue.assert_called_once()
+
+    def test_message_from_another_conversation_deletes_nothing(self):
+        other = Conversation.objects.create(user=self.user, title='Other')
+        foreign = Message.objects.create(conversation=other, role='user', content='elsewhere')
+
+        response, _ = self.post({'message': 'again', 'continue_from_message_id': foreign.id})
+
+        self.assertEqual(response.status_code, status.HTTP_202_ACCEPTED)
+        self.assertEqual(self.contents(), ['one', 'two', 'three', 'four', 'again'])
+        self.assertTrue(Message.objects.filter(pk=foreign.pk).exists())
+
+    def test_without_message_id_appends(self):
+        self.post({'message': 'again'})
+
+        self.assertEqual(self.contents(), ['one', 'two', 'three', 'four', 'again'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BulkDeleteTests(TestCase):
+    """Deleting several users at once"""
+
+    def test_skips_current_user_and_superusers(self):
+        current = User.objects.create_user(username='current')
+        other = User.objects.create_user(username='other')
+        admin = User.objects.create_superuser(username='admin')
+        client = APIClient()
+        client.force_authenticate(current)
+
+        response = client.post(
+            reverse('user-bulk-delete'),
+            {'user_ids': [current.id, other.id, admin.id]},
+            format='json'
+        )
+
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['deleted_count'], 1)
+        self.assertEqual(
+            set(User.objects.values_list('username', flat=True)),
+            {'current', 'admin'}
+        )
+
+
+class ActivateOnlyTests(TestCase):
+    """Switching the active row in a single UPDATE"""
+
+    def setUp(self):
+        self.first = LLMModel.objects.create(name='first', provider='ollama', is_active=True)
+        self.second = LLMModel.objects.create(name='second', provider='ollama')
+        self.third = LLMModel.objects.create(name='third', provider='ollama')
+
+    def active_names(self):
+        return list(LLMModel.objects.filter(is_active=True).values_list('name', flat=True))
+
+    def test_activates_one_row(self):
+        updated = activate_only(LLMModel.objects.all(), self.second.pk)
+
+        # Only the previously active row and the newly active one are touched
+        self.assertEqual(updated, 2)
+        self.assertEqual(self.active_names(), ['second'])
+
+    def test_activating_the_active_row(self):
+        updated = activate_only(LLMModel.objects.all(), self.first.pk)
+
+        self.assertEqual(updated, 1)
+        self.assertEqual(self.active_names(), ['first'])
+
+    def test_sets_other_fields_on_changed_rows(self):
+        activate_only(LLMModel.objects.all(), self.third.pk, temperature=0.1)
+
+        temperatures = dict(LLMModel.objects.values_list('name', 'temperature'))
+        self.assertEqual(temperatures, {'first': 0.1, 'second': 0.7, 'third': 0.1})
+
+
+class AgentTaskTests(TestCase):
+    """Task states and events recorded while an agent task runs"""
+
+    def setUp(self):
+        self.store = FakeStateStore()
+        patcher = mock.patch.object(tasks, 'get_state_store', return_value=self.store)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        self.user = User.objects.create_user(username='listener')
+        self.conversation = Conversation.objects.create(user=self.user, title='Chat')
+        self.thread_id = str(self.conversation.thread_id)
+
+    def run_task(self, conversation_id=None, task_id='task-1'):
+        conversation_id = self.conversation.pk if conversation_id is None else conversation_id
+        tasks.run_agent_task.apply(
+            args=(conversation_id, 'hello', self.thread_id, str(self.user.id)),
+            task_id=task_id
+        )
+        return tasks.get_task_state(task_id), list(tasks.iter_task_events(task_id))
+
+    def test_queue_records_state_before_queueing(self):
+        with mock.patch.object(tasks.run_agent_task, 'apply_async') as apply_async:
+            task_id = tasks.queue_agent_task(self.conversation, str(self.user.id), user_input='hello')
+
+        self.assertEqual(tasks.get_task_state(task_id), {
+            'status': tasks.TASK_QUEUED,
+            'thread_id': self.thread_id,
+            'user_id': str(self.user.id),
+        })
+        apply_async.assert_called_once_with(
+            args=(self.conversation.pk, 'hello', self.thread_id, str(self.user.id), None),
+            task_id=task_id
+        )
+
+    def test_completed_run_streams_tokens_then_done(self):
+        payload = {'status': 'success', 'thread_id': self.thread_id, 'response': 'Hi there'}
+
+        def run_chat(conversation, message, thread_id, user_id, on_token=None):
+            on_token('Hi')
+            on_token(' there')
+            return payload
+
+        with mock.patch.object(tasks, 'get_agent_system'), mock.patch.object(tasks, 'run_chat', side_effect=run_chat):
+            state, events = self.run_task()
+
+        self.assertEqual(state['status'], tasks.TASK_COMPLETED)
+        self.assertEqual(state['result'], payload)
+        self.assertEqual(
+            [(event, json.loads(data)) for event, data in events],
+            [('token', 'Hi'), ('token', ' there'), ('done', payload)]
+        )
+
+    def test_failed_build_is_retried(self):
+        payload = {'status': 'success', 'thread_id': self.thread_id, 'response': 'Hi'}
+
+        with mock.patch.object(tasks, 'get_agent_system', side_effect=[RuntimeError('down'), None]), \
+                mock.patch.object(tasks, 'run_chat', return_value=payload) as run_chat:
+            state, events = self.run_task()
+
+        self.assertEqual(state['status'], tasks.TASK_COMPLETED)
+        self.assertEqual([event for event, _ in events], ['retry', 'done'])
+        run_chat.assert_called_once()
+
+    def test_failed_run_is_not_retried(self):
+        with mock.patch.object(tasks, 'get_agent_system'), \
+                mock.patch.object(tasks, 'run_chat', side_effect=RuntimeError('boom')) as run_chat, \
+                self.assertLogs('agentsapp.tasks', level='ERROR'):
+            state, events = self.run_task()
+
+        self.assertEqual(state['status'], tasks.TASK_FAILED)
+        self.assertEqual(state['result']['message'], 'Error processing message: boom')
+        self.assertEqual([event for event, _ in events], ['done'])
+        run_chat.assert_called_once()
+        # The apology is saved as the reply
+        self.assertEqual(
+            list(self.conversation.messages.values_list('role', 'content')),
+            [('assistant', tasks._ERROR_APOLOGY)]
+        )
+
+    def test_deleted_conversation_fails_task(self):
+        conversation_id = self.conversation.pk
+        self.conversation.delete()
+
+        with mock.patch.object(tasks, 'run_chat') as run_chat:
+            state, events = self.run_task(conversation_id)
+
+        self.assertEqual(state['status'], tasks.TASK_FAILED)
+        self.assertEqual(state['result']['message'], 'Conversation not found')
+        self.assertEqual([event for event, _ in events], ['done'])
+        run_chat.assert_not_called()
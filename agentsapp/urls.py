@@ -2,8 +2,10 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 from . import views
 
-# Create a router for REST API viewsets
+# Create a router for REST API viewsets. Format-suffix variants (.json, .api)
+# of every route are left out, which halves the URL patterns; nothing uses them.
 router = DefaultRouter()
+router.include_format_suffixes = False
 router.register(r'users', views.UserViewSet)
 router.register(r'llm-models', views.LLMModelViewSet)
 router.register(r'tools', views.ToolViewSet)
@@ -18,11 +20,14 @@ urlpatterns = [
     path('login/', views.login_view, name='login'),
     path('logout/', views.logout_view, name='logout'),
     
-    # REST API routes
-    path('api/', include(router.urls)),
+    # REST API routes; the chat endpoints come first so they resolve without
+    # trying every viewset route
     path('api/chat/', views.ChatView.as_view(), name='chat'),
     path('api/chat/<str:thread_id>/resume/', views.ChatResumeView.as_view(), name='chat-resume'),
     path('api/system-info/', views.system_info, name='system-info'),
+    path('api/tasks/<str:task_id>/', views.task_status, name='task-status'),
+    path('api/tasks/<str:task_id>/events/', views.task_events, name='task-events'),
+    path('api/', include(router.urls)),
     
     # Main app route
     path('', views.index, name='index'),
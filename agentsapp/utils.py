@@ -1,53 +1,119 @@
+import logging
 import os
+import re
+from functools import lru_cache
+import asyncio
 import uuid
+import threading
 import json
 import sqlite3
+import orjson
+from collections import defaultdict
 from typing import Dict, List, Optional, Any, TypedDict, Annotated
 from typing_extensions import TypedDict
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor
+
+from cachetools import LRUCache
 
 from django.conf import settings
 from django.core.cache import cache
+from django.db import connection as db_connection, transaction
+from django.db.models.expressions import RawSQL
 
-from langchain_community.llms import Ollama, GPT4All
-# Replace deprecated ChatOllama import
-from langchain_ollama import ChatOllama
+# Model providers, embeddings and SQLDatabase pull in large dependency trees, so
+# they are imported inside the functions that build them rather than here
 from langchain_core.messages import (
-    AIMessage, HumanMessage, SystemMessage, ToolMessage, AnyMessage
+    AIMessage, HumanMessage, SystemMessage, ToolMessage, AnyMessage, RemoveMessage
 )
 from langchain_core.tools import tool
 from langchain_core.runnables import RunnableConfig
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import Chroma
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.utilities.sql_database import SQLDatabase
+from sqlalchemy import event, text
 
 from langgraph.graph import StateGraph, START, END
-from langgraph.checkpoint.sqlite import SqliteSaver
-from langgraph.store.sqlite import SqliteStore
-from langgraph.prebuilt import create_react_agent, ToolNode
+from langgraph.checkpoint.serde.jsonplus import JsonPlusSerializer
 from langgraph.graph.message import add_messages
 from langgraph.managed.is_last_step import RemainingSteps
-from langgraph.types import interrupt
+from langgraph.types import Send
 
 from .models import LLMModel, AgentConfig, Database, Conversation, Message, UserProfile, UserPreference
 from django.utils import timezone
 
 
+logger = logging.getLogger(__name__)
+
+
 # Define the State class for the LangGraph
 class State(TypedDict):
     """Represents the state of our LangGraph agent."""
     customer_id: str
     messages: Annotated[list[AnyMessage], add_messages]
-    loaded_memory: str
     remaining_steps: RemainingSteps
+    # Number of messages create_memory has already scanned for preferences
+    scanned_upto: int
+    # Music genres found in the conversation so far
+    music_preferences: list[str]
+    # Agent domains picked for the current turn by classify_intent
+    selected_agents: list[str]
+
+
+# Keywords that route a query to each sub-agent domain
+AGENT_ROUTING_TERMS = {
+    "music": ("music", "song", "artist", "album", "track", "genre"),
+    "invoice": ("invoice", "purchase", "buy", "order", "payment"),
+}
+_DOMAIN_BY_TERM = {
+    term: domain for domain, terms in AGENT_ROUTING_TERMS.items() for term in terms
+}
+_ROUTING_TERM_RE = re.compile("|".join(map(re.escape, _DOMAIN_BY_TERM)), re.IGNORECASE)
+
+
+def select_agent_domains(user_input: str) -> List[str]:
+    """
+    Pick every agent domain the query touches
+    
+    Simple keyword-based routing; this avoids the 404 error when trying to access Ollama.
+    
+    Args:
+        user_input: The user's message
+        
+    Returns:
+        List of domains (keys of AGENT_ROUTING_TERMS), possibly empty
+    """
+    # One case-insensitive scan finds every routing term (substring match, like `in`)
+    found = set()
+    for match in _ROUTING_TERM_RE.finditer(user_input):
+        found.add(_DOMAIN_BY_TERM[match.group(0).lower()])
+        if len(found) == len(AGENT_ROUTING_TERMS):
+            break
+    return [domain for domain in AGENT_ROUTING_TERMS if domain in found]
+
+
+# Agent credited with a response, by the first routing domain its query touches
+AGENT_TYPE_BY_DOMAIN = {
+    "music": "music_catalog_subagent",
+    "invoice": "invoice_information_subagent",
+}
+
+
+def detect_agent_type(user_input: str) -> str:
+    """
+    Guess which agent handled a query from its routing terms
+    
+    Args:
+        user_input: The user's message
+        
+    Returns:
+        The sub-agent name, or "supervisor_agent" if no domain matched
+    """
+    domains = select_agent_domains(user_input)
+    return AGENT_TYPE_BY_DOMAIN[domains[0]] if domains else "supervisor_agent"
 
 
 def create_supervisor(
     llm,
     tools,
     name="supervisor",
-    system_prompt=None,
     state_schema=None,
     checkpointer=None,
     store=None,
@@ -55,11 +121,15 @@ def create_supervisor(
     """
     Create a supervisor agent that can route to other agents.
     
+    Each tool wraps a sub-agent and becomes its own node. The supervisor fans the
+    query out (via Send) to every agent whose domain it touches, so a query about
+    both music and invoices runs both agents concurrently; a join node then merges
+    their answers into a single response.
+    
     Args:
         llm: The language model to use
         tools: List of tools (including agent tools)
         name: Name of the supervisor agent
-        system_prompt: System prompt for the supervisor
         state_schema: Schema for the graph state
         checkpointer: Checkpointer for persistence
         store: Store for long-term memory
@@ -67,76 +137,101 @@ def create_supervisor(
     Returns:
         A compiled StateGraph for the supervisor
     """
-    # Default system prompt if none provided
-    if system_prompt is None:
-        system_prompt = """You are a supervisor agent that routes queries to specialized agents.
-        You have access to the following agents:
-        {tool_descriptions}
+    # Each domain routes to the first tool whose name mentions it
+    tool_by_domain = {}
+    for domain in AGENT_ROUTING_TERMS:
+        for tool in tools:
+            if domain in tool.name.lower():
+                tool_by_domain[domain] = tool
+                break
+    
+    # Default to first tool
+    default_tools = tuple(tools[:1])
+    
+    # There are only a handful of domain combinations, so each is resolved once
+    @lru_cache(maxsize=None)
+    def select_tools_for(domains):
+        selected_tools = tuple(tool_by_domain[domain] for domain in domains if domain in tool_by_domain)
+        return selected_tools or default_tools
+    
+    def select_tools(domains):
+        """Map agent domains to the tools whose name mentions them"""
+        return select_tools_for(tuple(domains))
+    
+    # Define the routing function that fans the query out to the selected agents
+    def route_to_agents(state):
+        # Get user input from state
+        if "messages" in state and state["messages"]:
+            user_input = state["messages"][-1].content
+        else:
+            user_input = "Hello"
+        logger.debug("Processing user input in supervisor: %.50s...", user_input)
         
-        Route the query to the most appropriate agent based on the content.
-        """
+        # Use the domains classified ahead of the supervisor when available
+        domains = state.get("selected_agents") or select_agent_domains(user_input)
+        selected_tools = select_tools(domains)
+        if not selected_tools:
+            return "join"
+        return [Send(tool.name, state) for tool in selected_tools]
     
-    # Format the system prompt with tool descriptions
-    tool_descriptions = "\n".join([f"- {tool.name}: {tool.description}" for tool in tools])
-    formatted_prompt = system_prompt.format(tool_descriptions=tool_descriptions)
-    
-    # Define the supervisor node function
-    def supervisor_node(state, config):
-        try:
-            # Get user input from state
-            if "messages" in state and state["messages"]:
-                user_input = state["messages"][-1].content
-            else:
-                user_input = "Hello"
+    # Define a node per agent that runs it and returns its answer
+    def make_agent_node(selected_tool):
+        async def agent_node(state, config):
+            try:
+                logger.debug("Using tool: %s", selected_tool.name)
+                if selected_tool.coroutine:
+                    tool_result = await selected_tool.coroutine({"messages": state["messages"]})
+                else:
+                    tool_result = await asyncio.to_thread(selected_tool.func, {"messages": state["messages"]})
                 
-            # Create a simple direct response without using the LLM for tool selection
-            # This avoids the 404 error when trying to access Ollama
-            print(f"Processing user input in supervisor: {user_input[:50]}...")
-            
-            # Simple keyword-based routing
-            if any(music_term in user_input.lower() for music_term in ["music", "song", "artist", "album", "track", "genre"]):
-                selected_tool = next((tool for tool in tools if "music" in tool.name.lower()), None)
-            elif any(invoice_term in user_input.lower() for invoice_term in ["invoice", "purchase", "buy", "order", "payment"]):
-                selected_tool = next((tool for tool in tools if "invoice" in tool.name.lower()), None)
-            else:
-                # Default to first tool
-                selected_tool = tools[0] if tools else None
-            
-            # Execute the selected tool if found
-            if selected_tool:
-                try:
-                    print(f"Using tool: {selected_tool.name}")
-                    tool_result = selected_tool.func({"messages": state["messages"]})
-                    
-                    # Extract the response from the tool result
-                    if isinstance(tool_result, dict) and "messages" in tool_result:
-                        for msg in reversed(tool_result["messages"]):
-                            if hasattr(msg, 'content'):
-                                response = msg.content
-                                break
-                        else:
-                            response = f"The {selected_tool.name} processed your request but didn't provide a specific answer."
+                # Extract the response from the tool result
+                if isinstance(tool_result, dict) and "messages" in tool_result:
+                    for msg in reversed(tool_result["messages"]):
+                        if hasattr(msg, 'content'):
+                            response = msg.content
+                            break
                     else:
-                        response = str(tool_result)
-                    
-                    # Return the response
-                    return {"messages": [AIMessage(content=response)]}
-                except Exception as tool_error:
-                    print(f"Error executing tool {selected_tool.name}: {str(tool_error)}")
-                    # Fall through to direct response
-            
-            # Direct response if tool execution failed or no tool was found
+                        response = f"The {selected_tool.name} processed your request but didn't provide a specific answer."
+                else:
+                    response = str(tool_result)
+                
+                return {"messages": [AIMessage(content=response)]}
+            except Exception:
+                logger.exception("Error executing tool %s", selected_tool.name)
+                return {"messages": [AIMessage(content="I'm sorry, I couldn't process your request through our specialized agents. Is there anything specific about our music catalog or your invoices that you'd like to know?")]}
+        return agent_node
+    
+    # Define the join node that merges the answers from concurrently run agents
+    def join_responses(state):
+        # Collect the agent answers produced since the latest user message
+        responses = []
+        for msg in reversed(state.get("messages", [])):
+            if isinstance(msg, HumanMessage):
+                break
+            if isinstance(msg, AIMessage):
+                responses.append(msg)
+        responses.reverse()
+        
+        # No agent answered
+        if not responses:
             return {"messages": [AIMessage(content="I'm sorry, I couldn't process your request through our specialized agents. Is there anything specific about our music catalog or your invoices that you'd like to know?")]}
-            
-        except Exception as e:
-            print(f"Error in supervisor_node: {str(e)}")
-            return {"messages": [AIMessage(content="I'm sorry, I'm having trouble processing your request right now. Please try again later.")]}
+        
+        # A single agent answered, keep its message as is
+        if len(responses) == 1:
+            return {}
+        
+        # Replace the separate answers with one combined message
+        combined = "\n\n".join(msg.content for msg in responses)
+        return {"messages": [RemoveMessage(id=msg.id) for msg in responses] + [AIMessage(content=combined)]}
     
     # Create the graph
     supervisor_graph = StateGraph(state_schema or State)
-    supervisor_graph.add_node("supervisor", supervisor_node)
-    supervisor_graph.add_edge(START, "supervisor")
-    supervisor_graph.add_edge("supervisor", END)
+    for agent_tool in tools:
+        supervisor_graph.add_node(agent_tool.name, make_agent_node(agent_tool))
+        supervisor_graph.add_edge(agent_tool.name, "join")
+    supervisor_graph.add_node("join", join_responses)
+    supervisor_graph.add_conditional_edges(START, route_to_agents, [tool.name for tool in tools] + ["join"])
+    supervisor_graph.add_edge("join", END)
     
     # Compile the graph
     return supervisor_graph.compile(
@@ -146,10 +241,123 @@ def create_supervisor(
     )
 
 
+# Cache key and lifetime (seconds) for the active LLM's configuration
+ACTIVE_LLM_CONFIG_CACHE_KEY = "active_llm_config"
+ACTIVE_LLM_CONFIG_TTL = 60
+
+# LLMModel fields that determine the instance _build_llm creates
+LLM_CONFIG_FIELDS = ("provider", "name", "temperature", "api_base", "max_tokens", "model_path")
+
+
+def _get_llm_config(model_name: Optional[str] = None):
+    """
+    Look up the configuration of an LLM model.
+    
+    Args:
+        model_name: Optional name of the model, otherwise the active one
+        
+    Returns:
+        A tuple of LLM_CONFIG_FIELDS values, or None if no model is configured
+    """
+    if model_name:
+        config = LLMModel.objects.filter(name=model_name).values_list(*LLM_CONFIG_FIELDS).first()
+        if config:
+            return config
+        # Default to first active model
+    
+    # The active model is read on every chat turn, so keep it in the Django cache
+    # (only once one exists, so a model added later is picked up right away)
+    config = cache.get(ACTIVE_LLM_CONFIG_CACHE_KEY)
+    if config is None:
+        config = LLMModel.objects.filter(is_active=True).values_list(*LLM_CONFIG_FIELDS).first()
+        if config is not None:
+            cache.set(ACTIVE_LLM_CONFIG_CACHE_KEY, config, ACTIVE_LLM_CONFIG_TTL)
+    return config
+
+
+def get_active_llm_info() -> Optional[Dict[str, Any]]:
+    """
+    Get the active LLM's name, provider and temperature.
+    
+    Reads the cached configuration get_llm uses, so no query runs while it is cached.
+    
+    Returns:
+        Dict of the model's name, provider and temperature, or None if no model is active
+    """
+    config = _get_llm_config()
+    if config is None:
+        return None
+    config = dict(zip(LLM_CONFIG_FIELDS, config))
+    return {
+        'name': config['name'],
+        'provider': config['provider'],
+        'temperature': config['temperature']
+    }
+
+
+def clear_active_llm_cache():
+    """Forget the cached active LLM so the next call looks it up again"""
+    cache.delete(ACTIVE_LLM_CONFIG_CACHE_KEY)
+
+
+@lru_cache(maxsize=1)
+def _default_llm():
+    """Get an Ollama model with default settings"""
+    from langchain_ollama import ChatOllama
+    return ChatOllama(model="llama2", temperature=0, base_url="http://localhost:11434")
+
+
+@lru_cache(maxsize=16)
+def _build_llm(provider, name, temperature, api_base, max_tokens, model_path):
+    """
+    Create a language model once per configuration.
+    
+    Args:
+        provider, name, temperature, api_base, max_tokens, model_path: LLMModel fields
+        
+    Returns:
+        A language model instance (Ollama, GPT4All, etc.)
+    """
+    # Initialize the appropriate model based on provider
+    if provider == 'ollama':
+        # Make sure we always have a base_url
+        base_url = api_base if api_base else "http://localhost:11434"
+        print(f"Creating Ollama model with base_url: {base_url}")
+        from langchain_ollama import ChatOllama
+        return ChatOllama(
+            model=name,
+            temperature=temperature,
+            base_url=base_url
+        )
+    elif provider == 'gpt4all':
+        from langchain_community.llms import GPT4All
+        return GPT4All(
+            model=model_path,
+            temperature=temperature,
+            max_tokens=max_tokens
+        )
+    elif provider == 'llama-cpp':
+        # Import here to avoid loading if not used
+        from langchain_community.llms import LlamaCpp
+        return LlamaCpp(
+            model_path=model_path,
+            temperature=temperature,
+            max_tokens=max_tokens,
+            n_ctx=2048,  # Context window
+            n_gpu_layers=-1  # Auto-detect GPU layers
+        )
+    else:
+        # Fallback to Ollama
+        print(f"Unknown provider {provider}, falling back to default Ollama")
+        return _default_llm()
+
+
 def get_llm(model_name: Optional[str] = None):
     """
     Get a language model instance based on configuration.
     
+    Instances are shared between calls with the same configuration.
+    
     Args:
         model_name: Optional name of the model to use, otherwise uses active model
         
@@ -158,57 +366,99 @@ def get_llm(model_name: Optional[str] = None):
     """
     try:
         # Get the active model from database or use specified model
-        if model_name:
-            try:
-                model = LLMModel.objects.get(name=model_name)
-            except LLMModel.DoesNotExist:
-                # Default to first active model or create basic Ollama config
-                model = LLMModel.objects.filter(is_active=True).first()
-                if not model:
-                    # Use Ollama with default settings if no models configured
-                    print("No model found, using default Ollama config")
-                    return ChatOllama(model="llama2", temperature=0, base_url="http://localhost:11434")
-        else:
-            model = LLMModel.objects.filter(is_active=True).first()
-            if not model:
-                # Use Ollama with default settings if no models configured
-                print("No active model found, using default Ollama config")
-                return ChatOllama(model="llama2", temperature=0, base_url="http://localhost:11434")
+        config = _get_llm_config(model_name)
+        if not config:
+            # Use Ollama with default settings if no models configured
+            print("No active model found, using default Ollama config")
+            return _default_llm()
         
-        # Initialize the appropriate model based on provider
-        if model.provider == 'ollama':
-            # Make sure we always have a base_url
-            base_url = model.api_base if model.api_base else "http://localhost:11434"
-            print(f"Creating Ollama model with base_url: {base_url}")
-            return ChatOllama(
-                model=model.name,
-                temperature=model.temperature,
-                base_url=base_url
-            )
-        elif model.provider == 'gpt4all':
-            return GPT4All(
-                model=model.model_path,
-                temperature=model.temperature,
-                max_tokens=model.max_tokens
-            )
-        elif model.provider == 'llama-cpp':
-            # Import here to avoid loading if not used
-            from langchain_community.llms import LlamaCpp
-            return LlamaCpp(
-                model_path=model.model_path,
-                temperature=model.temperature,
-                max_tokens=model.max_tokens,
-                n_ctx=2048,  # Context window
-                n_gpu_layers=-1  # Auto-detect GPU layers
-            )
-        else:
-            # Fallback to Ollama
-            print(f"Unknown provider {model.provider}, falling back to default Ollama")
-            return ChatOllama(model="llama2", temperature=0, base_url="http://localhost:11434")
+        return _build_llm(*config)
     except Exception as e:
         # If anything fails, use a safe default
         print(f"Error creating LLM: {str(e)}, using default Ollama config")
-        return ChatOllama(model="llama2", temperature=0, base_url="http://localhost:11434")
+        return _default_llm()
+
+
+# Cache key and lifetime (seconds) for the active database's connection string
+ACTIVE_DB_URI_CACHE_KEY = "active_db_uri"
+ACTIVE_DB_URI_TTL = 300
+
+
+def _get_db_uri(db_name: Optional[str] = None) -> Optional[str]:
+    """
+    Look up the connection string of a configured database.
+    
+    Args:
+        db_name: Optional name of the database, otherwise the active one
+        
+    Returns:
+        The connection string, or None if no matching database is configured
+    """
+    if db_name:
+        return Database.objects.filter(name=db_name).values_list("connection_string", flat=True).first()
+    
+    # The active database is read on every tool call, so keep it in the Django cache
+    # (only once one exists, so a database added later is picked up right away)
+    uri = cache.get(ACTIVE_DB_URI_CACHE_KEY)
+    if uri is None:
+        uri = Database.objects.filter(is_active=True).values_list("connection_string", flat=True).first()
+        if uri is not None:
+            cache.set(ACTIVE_DB_URI_CACHE_KEY, uri, ACTIVE_DB_URI_TTL)
+    return uri
+
+
+def clear_active_db_cache():
+    """Forget the cached active database so the next tool call looks it up again"""
+    cache.delete(ACTIVE_DB_URI_CACHE_KEY)
+
+
+# Per-connection SQLite settings: WAL lets tool reads proceed alongside writes,
+# and the larger page cache and memory map keep hot Chinook pages in memory
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",
+    "PRAGMA synchronous=NORMAL",
+    "PRAGMA temp_store=MEMORY",
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA cache_size=-64000",
+)
+
+
+def _apply_sqlite_pragmas(dbapi_connection, connection_record=None):
+    """Apply SQLITE_PRAGMAS to a raw sqlite3 connection (also usable as a SQLAlchemy connect listener)"""
+    cursor = dbapi_connection.cursor()
+    for pragma in SQLITE_PRAGMAS:
+        cursor.execute(pragma)
+    cursor.close()
+
+
+@lru_cache(maxsize=8)
+def _build_db(uri: Optional[str]):
+    """
+    Create a SQLDatabase once per connection string.
+    
+    SQLDatabase.from_uri creates an engine and reflects the schema, so reusing
+    the instance lets tool calls skip that setup.
+    
+    Args:
+        uri: Connection string, or None for an in-memory SQLite database
+        
+    Returns:
+        A SQLDatabase instance
+    """
+    from langchain_community.utilities.sql_database import SQLDatabase
+    
+    if uri is None:
+        # Default to SQLite in-memory database if not configured
+        connection = sqlite3.connect(":memory:", check_same_thread=False, isolation_level=None)
+        _apply_sqlite_pragmas(connection)
+        return SQLDatabase(connection)
+    
+    db = SQLDatabase.from_uri(uri)
+    if db.dialect == "sqlite":
+        event.listen(db._engine, "connect", _apply_sqlite_pragmas)
+        # Drop connections opened while reflecting the schema so every pooled one gets the pragmas
+        db._engine.dispose()
+    return db
 
 
 def get_db_connection(db_name: Optional[str] = None):
@@ -222,39 +472,133 @@ def get_db_connection(db_name: Optional[str] = None):
         A SQLDatabase instance
     """
     # Get the active database from Django models or use specified database
-    if db_name:
-        try:
-            db_config = Database.objects.get(name=db_name)
-        except Database.DoesNotExist:
-            # Default to SQLite in-memory database if not found
-            connection = sqlite3.connect(":memory:", check_same_thread=False)
-            return SQLDatabase(connection)
-    else:
-        db_config = Database.objects.filter(is_active=True).first()
-        if not db_config:
-            # Default to SQLite in-memory database if not configured
-            connection = sqlite3.connect(":memory:", check_same_thread=False)
-            return SQLDatabase(connection)
-    
-    # Connect to the configured database
-    return SQLDatabase.from_uri(db_config.connection_string)
+    return _build_db(_get_db_uri(db_name))
 
 
+@lru_cache(maxsize=1)
 def get_embeddings():
-    """Get embeddings model for vector search"""
+    """Get embeddings model for vector search (one per process)"""
+    from langchain_community.embeddings import OllamaEmbeddings
+    
     # Use Ollama embeddings for efficient local embedding
     return OllamaEmbeddings(model="nomic-embed-text")
 
 
-def get_checkpointer():
-    """Get a checkpointer for thread-level memory"""
-    # Use in-memory checkpointer for now to avoid SQLite issues
-    from langgraph.checkpoint.memory import MemorySaver
-    return MemorySaver()
+def clear_client_caches():
+    """Drop the cached LLM, embeddings and database clients so they are created again on next use"""
+    for cached in (_default_llm, _build_llm, _build_db, get_embeddings):
+        cached.cache_clear()
+
+
+def _is_json_native(value) -> bool:
+    """Check that value round-trips through JSON unchanged (no tuples, datetimes, models, ...)."""
+    value_type = type(value)
+    if value is None or value_type in (str, int, float, bool):
+        return True
+    if value_type is list:
+        return all(_is_json_native(item) for item in value)
+    if value_type is dict:
+        return all(type(key) is str and _is_json_native(item) for key, item in value.items())
+    return False
 
 
+class OrjsonSerializer(JsonPlusSerializer):
+    """
+    Checkpoint serializer that writes plain JSON values with orjson.
+    
+    Channel values made only of dicts, lists, strings, numbers, booleans and None
+    are encoded with orjson under the "json" type; everything else (messages,
+    tuples, datetimes, ...) goes through the default JsonPlusSerializer encoding.
+    """
+    
+    def dumps_typed(self, obj):
+        if _is_json_native(obj):
+            return "json", orjson.dumps(obj)
+        return super().dumps_typed(obj)
+    
+    def loads_typed(self, data):
+        type_, data_ = data
+        if type_ == "json":
+            return orjson.loads(data_)
+        return super().loads_typed(data)
+
+
+# Serializers selectable for the checkpointer; None keeps LangGraph's default.
+# JsonPlusSerializer encodes checkpoints with msgpack (ormsgpack), which is faster
+# than JSON on message lists and produces smaller payloads.
+CHECKPOINT_SERIALIZERS = {
+    "msgpack": JsonPlusSerializer,
+    "orjson": OrjsonSerializer,
+    None: None,
+}
+
+
+def _build_shared_sqlite_saver():
+    """Define the SQLite checkpointer class (langgraph-checkpoint-sqlite is imported on first use)"""
+    from langgraph.checkpoint.sqlite import SqliteSaver
+
+    class SharedSqliteSaver(SqliteSaver):
+        """
+        SQLite checkpointer usable from the async agent graphs.
+        
+        The async methods run the thread-safe sync ones in a worker thread, so one
+        saver serves every event loop asyncio.run creates in this process, unlike
+        AsyncSqliteSaver whose connection is bound to the loop that opened it.
+        """
+        
+        async def aget_tuple(self, config):
+            return await asyncio.to_thread(self.get_tuple, config)
+        
+        async def alist(self, config, **kwargs):
+            checkpoints = await asyncio.to_thread(lambda: list(self.list(config, **kwargs)))
+            for checkpoint in checkpoints:
+                yield checkpoint
+        
+        async def aput(self, config, checkpoint, metadata, new_versions):
+            return await asyncio.to_thread(self.put, config, checkpoint, metadata, new_versions)
+        
+        async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+            return await asyncio.to_thread(self.put_writes, config, writes, task_id, *args, **kwargs)
+        
+        async def adelete_thread(self, thread_id):
+            return await asyncio.to_thread(self.delete_thread, thread_id)
+    
+    return SharedSqliteSaver
+
+
+@lru_cache(maxsize=None)
+def get_checkpointer(serde="msgpack"):
+    """
+    Get a checkpointer for thread-level memory (one per process per serializer)
+    
+    Checkpoints are written to the SQLite file at settings.LANGGRAPH_CHECKPOINT_PATH,
+    shared by the web and Celery worker processes, so an interrupted run can be
+    resumed by any worker. With the setting empty they are kept in memory.
+    
+    Args:
+        serde: Name of the serializer to use, see CHECKPOINT_SERIALIZERS
+        
+    Returns:
+        The checkpointer
+    """
+    serializer_class = CHECKPOINT_SERIALIZERS[serde]
+    serializer = serializer_class() if serializer_class else None
+    
+    checkpoint_path = settings.LANGGRAPH_CHECKPOINT_PATH
+    if not checkpoint_path:
+        from langgraph.checkpoint.memory import MemorySaver
+        return MemorySaver(serde=serializer)
+    
+    conn = sqlite3.connect(str(checkpoint_path), check_same_thread=False)
+    # WAL lets workers read checkpoints while another process writes one
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA busy_timeout=5000")
+    return _build_shared_sqlite_saver()(conn, serde=serializer)
+
+
+@lru_cache(maxsize=1)
 def get_memory_store():
-    """Get a memory store for long-term memory"""
+    """Get a memory store for long-term memory (one per process)"""
     # Use in-memory store for now to avoid SQLite issues
     from langgraph.store.memory import InMemoryStore
     return InMemoryStore()
@@ -270,28 +614,54 @@ def load_user_memory(user_id: str) -> str:
     Returns:
         Formatted string of user preferences
     """
-    try:
-        profile = UserProfile.objects.get(user_id=user_id)
-        preferences = UserPreference.objects.filter(profile=profile)
-        
-        if not preferences:
-            return "None"
-        
-        # Format preferences by type
-        pref_by_type = {}
-        for pref in preferences:
-            if pref.preference_type not in pref_by_type:
-                pref_by_type[pref.preference_type] = []
-            pref_by_type[pref.preference_type].append(pref.value)
-        
-        # Build formatted string
-        result = []
-        for pref_type, values in pref_by_type.items():
-            result.append(f"{pref_type.title()} Preferences: {', '.join(values)}")
+    # Join through the profile and fetch plain tuples rather than model instances
+    preferences = UserPreference.objects.filter(
+        profile__user_id=user_id
+    ).order_by("pk").values_list("preference_type", "value")
+    
+    # Format preferences by type
+    pref_by_type = defaultdict(list)
+    for pref_type, value in preferences:
+        pref_by_type[pref_type].append(value)
+    
+    # Build formatted string
+    return "\n".join(
+        f"{pref_type.title()} Preferences: {', '.join(values)}"
+        for pref_type, values in pref_by_type.items()
+    ) or "None"
+
+
+# Memory loaded for each thread on the current turn. It is kept here rather than in
+# State so the checkpointer doesn't serialize the preference string after every node.
+_LOADED_MEMORY = LRUCache(maxsize=1024)
+_LOADED_MEMORY_LOCK = threading.Lock()
+
+
+def set_loaded_memory(thread_id: str, memory: str):
+    """
+    Remember the memory loaded for a thread
+    
+    Args:
+        thread_id: Conversation thread ID
+        memory: Formatted string of user preferences
+    """
+    with _LOADED_MEMORY_LOCK:
+        _LOADED_MEMORY[thread_id] = memory
+
+
+def get_loaded_memory(config: RunnableConfig) -> str:
+    """
+    Get the memory loaded for the thread in config
+    
+    Args:
+        config: Runnable config carrying the thread_id
         
-        return "\n".join(result)
-    except UserProfile.DoesNotExist:
-        return "None"
+    Returns:
+        Formatted string of user preferences, or "None" if nothing was loaded
+    """
+    thread_id = config.get("configurable", {}).get("thread_id")
+    with _LOADED_MEMORY_LOCK:
+        return _LOADED_MEMORY.get(thread_id, "None")
 
 
 def save_user_memory(user_id: str, customer_id: str, preferences: Dict[str, List[str]]):
@@ -309,21 +679,62 @@ def save_user_memory(user_id: str, customer_id: str, preferences: Dict[str, List
         defaults={'customer_id': customer_id}
     )
     
-    # Update preferences
-    for pref_type, values in preferences.items():
-        # Delete existing preferences of this type
+    # Replace the preferences of every given type with one DELETE and one INSERT
+    with transaction.atomic():
         UserPreference.objects.filter(
             profile=profile,
-            preference_type=pref_type
+            preference_type__in=list(preferences)
         ).delete()
         
-        # Create new preferences
-        for value in values:
-            UserPreference.objects.create(
-                profile=profile,
-                preference_type=pref_type,
-                value=value
-            )
+        # dict.fromkeys drops repeated values, which the unique constraint would reject
+        UserPreference.objects.bulk_create([
+            UserPreference(profile=profile, preference_type=pref_type, value=value)
+            for pref_type, values in preferences.items()
+            for value in dict.fromkeys(values)
+        ], batch_size=500)
+
+
+# Write-behind for user memory: callers hand preferences off and return immediately,
+# a single background worker does the DB writes. Pending writes are keyed by user_id,
+# so several turns queued before the worker gets to them collapse into one save.
+_MEMORY_WRITER = ThreadPoolExecutor(max_workers=1, thread_name_prefix="memory-writer")
+_PENDING_MEMORY = {}
+_PENDING_MEMORY_LOCK = threading.Lock()
+
+
+def _flush_user_memory(user_id: str):
+    """Write the latest queued preferences for a user to the database."""
+    with _PENDING_MEMORY_LOCK:
+        customer_id, preferences = _PENDING_MEMORY.pop(user_id)
+    try:
+        save_user_memory(user_id=user_id, customer_id=customer_id, preferences=preferences)
+        print(f"Saved memory for user {user_id}")
+    except Exception as e:
+        print(f"Error saving memory for user {user_id}: {str(e)}")
+
+
+def queue_user_memory(user_id: str, customer_id: str, preferences: Dict[str, List[str]]):
+    """
+    Queue user preferences to be saved in the background
+    
+    Args:
+        user_id: User ID to save preferences for
+        customer_id: Customer ID for the user
+        preferences: Dictionary of preference types and values
+    """
+    with _PENDING_MEMORY_LOCK:
+        already_queued = user_id in _PENDING_MEMORY
+        _PENDING_MEMORY[user_id] = (customer_id, preferences)
+    
+    # A flush is already scheduled for this user and will pick up the newer preferences
+    if not already_queued:
+        _MEMORY_WRITER.submit(_flush_user_memory, user_id)
+
+
+@lru_cache(maxsize=1024)
+def _get_conversation_pk(thread_id) -> int:
+    """Look up a conversation's primary key by thread ID (raises Conversation.DoesNotExist, which isn't cached)"""
+    return Conversation.objects.values_list("pk", flat=True).get(thread_id=thread_id)
 
 
 def save_conversation_message(conversation_id, role, content, **kwargs):
@@ -337,17 +748,58 @@ def save_conversation_message(conversation_id, role, content, **kwargs):
         **kwargs: Additional message attributes
     """
     try:
-        conversation = Conversation.objects.get(thread_id=conversation_id)
-        Message.objects.create(
-            conversation=conversation,
-            role=role,
-            content=content,
-            **kwargs
-        )
+        with transaction.atomic():
+            conversation_pk = _get_conversation_pk(conversation_id)
+            # The cached pk may belong to a conversation deleted since (by any process).
+            # Foreign keys are only checked at commit, too late to retry inside a
+            # caller's transaction, so confirm the row before inserting
+            if not Conversation.objects.filter(pk=conversation_pk, thread_id=conversation_id).exists():
+                _get_conversation_pk.cache_clear()
+                conversation_pk = _get_conversation_pk(conversation_id)
+            Message.objects.create(
+                conversation_id=conversation_pk,
+                role=role,
+                content=content,
+                **kwargs
+            )
     except Conversation.DoesNotExist:
         pass  # Conversation doesn't exist, can't save message
 
 
+# Build the LangChain message for a stored role from (content, tool_call_id, name)
+_MESSAGE_CONSTRUCTORS = {
+    "user": lambda content, tool_call_id, name: HumanMessage(content=content),
+    "assistant": lambda content, tool_call_id, name: AIMessage(content=content),
+    "system": lambda content, tool_call_id, name: SystemMessage(content=content),
+    "tool": lambda content, tool_call_id, name: ToolMessage(content=content, tool_call_id=tool_call_id, name=name),
+}
+
+
+def iter_conversation_messages(conversation_id):
+    """
+    Stream messages from a conversation
+    
+    Rows are fetched in chunks, so long threads never hold every message in
+    memory and the first message is available before the last row is read.
+    
+    Args:
+        conversation_id: Conversation ID
+        
+    Returns:
+        Iterator of messages in LangChain format
+    """
+    # Rows come back as plain tuples in the default created_at order;
+    # roles without a constructor are skipped
+    rows = Message.objects.filter(
+        conversation__thread_id=conversation_id
+    ).values_list("role", "content", "tool_call_id", "name").iterator(chunk_size=200)
+    
+    for role, content, tool_call_id, name in rows:
+        make_message = _MESSAGE_CONSTRUCTORS.get(role)
+        if make_message:
+            yield make_message(content, tool_call_id, name)
+
+
 def get_conversation_messages(conversation_id):
     """
     Get messages from a conversation
@@ -358,150 +810,164 @@ def get_conversation_messages(conversation_id):
     Returns:
         List of messages in LangChain format
     """
-    try:
-        conversation = Conversation.objects.get(thread_id=conversation_id)
-        messages = []
+    return list(iter_conversation_messages(conversation_id))
+
+
+# Music catalog tools
+# Tool queries are compiled once and take user input as bound parameters
+ALBUMS_BY_ARTIST_SQL = text("""
+    SELECT Album.Title, Artist.Name 
+    FROM Album 
+    JOIN Artist ON Album.ArtistId = Artist.ArtistId 
+    WHERE Artist.Name LIKE :pattern;
+""")
+
+TRACKS_BY_ARTIST_SQL = text("""
+    SELECT Track.Name as SongName, Artist.Name as ArtistName 
+    FROM Album 
+    LEFT JOIN Artist ON Album.ArtistId = Artist.ArtistId 
+    LEFT JOIN Track ON Track.AlbumId = Album.AlbumId 
+    WHERE Artist.Name LIKE :pattern;
+""")
+
+SONGS_BY_GENRE_SQL = text("""
+    SELECT Track.Name as Song, Artist.Name as Artist
+    FROM Track
+    LEFT JOIN Album ON Track.AlbumId = Album.AlbumId
+    LEFT JOIN Artist ON Album.ArtistId = Artist.ArtistId
+    WHERE Track.GenreId IN (SELECT GenreId FROM Genre WHERE Name LIKE :pattern)
+    GROUP BY Artist.Name
+    LIMIT 8;
+""")
+
+SONGS_BY_TITLE_SQL = text("SELECT * FROM Track WHERE Name LIKE :pattern;")
+
+# Most rows an invoice tool returns; answers only use the first few. A longer
+# result is cut to this many rows and says so (see _fetch_limited_columns)
+INVOICE_RESULT_LIMIT = 20
+
+INVOICES_BY_DATE_SQL = text(
+    "SELECT * FROM Invoice WHERE CustomerId = :customer_id ORDER BY InvoiceDate DESC LIMIT :limit;"
+)
+
+INVOICES_BY_UNIT_PRICE_SQL = text("""
+    SELECT Invoice.*, InvoiceLine.UnitPrice
+    FROM Invoice
+    JOIN InvoiceLine ON Invoice.InvoiceId = InvoiceLine.InvoiceId
+    WHERE Invoice.CustomerId = :customer_id
+    ORDER BY InvoiceLine.UnitPrice DESC
+    LIMIT :limit;
+""")
+
+EMPLOYEE_BY_INVOICE_SQL = text("""
+    SELECT Employee.FirstName, Employee.Title, Employee.Email
+    FROM Employee
+    JOIN Customer ON Customer.SupportRepId = Employee.EmployeeId
+    JOIN Invoice ON Invoice.CustomerId = Customer.CustomerId
+    WHERE Invoice.InvoiceId = :invoice_id AND Invoice.CustomerId = :customer_id;
+""")
+
+CUSTOMER_BY_PHONE_SQL = text("SELECT CustomerId FROM Customer WHERE Phone = :identifier;")
+CUSTOMER_BY_EMAIL_SQL = text("SELECT CustomerId FROM Customer WHERE Email = :identifier;")
+
+# Customer identifiers: all digits, a phone number starting with "+", or anything with an "@"
+_IDENTIFIER_RE = re.compile(r"(?P<customer_id>\d+)|(?P<phone>\+.*)|(?P<email>.*@.*)", re.DOTALL)
+
+
+def _fetch_columns(sql, parameters: Dict[str, Any]) -> Dict[str, list]:
+    """
+    Run a tool query and return its rows as columns
+    
+    Column names appear once instead of once per row, and the rows are
+    transposed in a single zip rather than built into a dict each.
+    
+    Args:
+        sql: The compiled query
+        parameters: Values for the query's bound parameters
         
-        for msg in conversation.messages.all():
-            if msg.role == 'user':
-                messages.append(HumanMessage(content=msg.content))
-            elif msg.role == 'assistant':
-                messages.append(AIMessage(content=msg.content))
-            elif msg.role == 'system':
-                messages.append(SystemMessage(content=msg.content))
-            elif msg.role == 'tool':
-                messages.append(ToolMessage(
-                    content=msg.content,
-                    tool_call_id=msg.tool_call_id,
-                    name=msg.name
-                ))
+    Returns:
+        Dict mapping each column name to its list of values, empty if no rows matched
+    """
+    result = get_db_connection().run(sql, fetch="cursor", parameters=parameters)
+    rows = result.fetchall()
+    if not rows:
+        return {}
+    return dict(zip(result.keys(), map(list, zip(*rows))))
+
+
+def _fetch_limited_columns(sql, parameters: Dict[str, Any], limit: int) -> Dict[str, Any]:
+    """
+    Run a tool query capped at limit rows, noting in the result when rows were left out
+    
+    One row past the limit is fetched to tell a full result from a truncated one.
+    
+    Args:
+        sql: The compiled query, taking a :limit parameter
+        parameters: Values for the query's other bound parameters
+        limit: Most rows to return
         
-        return messages
-    except Conversation.DoesNotExist:
-        return []
+    Returns:
+        Dict as from _fetch_columns, plus a "note" entry if the result was truncated
+    """
+    columns = _fetch_columns(sql, {**parameters, "limit": limit + 1})
+    if columns and len(next(iter(columns.values()))) > limit:
+        columns = {name: values[:limit] for name, values in columns.items()}
+        columns["note"] = f"Only the first {limit} results are shown; there are more."
+    return columns
 
 
-# Music catalog tools
 @tool
 def get_albums_by_artist(artist: str):
     """Get albums by an artist."""
-    db = get_db_connection()
-    return db.run(
-        f"""
-        SELECT Album.Title, Artist.Name 
-        FROM Album 
-        JOIN Artist ON Album.ArtistId = Artist.ArtistId 
-        WHERE Artist.Name LIKE '%{artist}%';
-        """,
-        include_columns=True
-    )
+    return _fetch_columns(ALBUMS_BY_ARTIST_SQL, {"pattern": f"%{artist}%"})
 
 
 @tool
 def get_tracks_by_artist(artist: str):
     """Get songs by an artist (or similar artists)."""
-    db = get_db_connection()
-    return db.run(
-        f"""
-        SELECT Track.Name as SongName, Artist.Name as ArtistName 
-        FROM Album 
-        LEFT JOIN Artist ON Album.ArtistId = Artist.ArtistId 
-        LEFT JOIN Track ON Track.AlbumId = Album.AlbumId 
-        WHERE Artist.Name LIKE '%{artist}%';
-        """,
-        include_columns=True
-    )
+    return _fetch_columns(TRACKS_BY_ARTIST_SQL, {"pattern": f"%{artist}%"})
 
 
 @tool
 def get_songs_by_genre(genre: str):
     """Fetch songs from the database that match a specific genre."""
-    db = get_db_connection()
-    # First, find the GenreId for the given genre name
-    genre_id_query = f"SELECT GenreId FROM Genre WHERE Name LIKE '%{genre}%'"
-    genre_ids = db.run(genre_id_query)
-    
-    # If no genre IDs are found, return an informative message
-    if not genre_ids:
-        return f"No songs found for the genre: {genre}"
-    
-    # Extract the GenreId values
-    import ast
-    genre_ids = ast.literal_eval(genre_ids)
-    genre_id_list = ", ".join(str(gid[0]) for gid in genre_ids)
-
-    # Get songs for the found genre IDs
-    songs_query = f"""
-        SELECT Track.Name as SongName, Artist.Name as ArtistName
-        FROM Track
-        LEFT JOIN Album ON Track.AlbumId = Album.AlbumId
-        LEFT JOIN Artist ON Album.ArtistId = Artist.ArtistId
-        WHERE Track.GenreId IN ({genre_id_list})
-        GROUP BY Artist.Name
-        LIMIT 8;
-    """
-    songs = db.run(songs_query, include_columns=True)
-    
-    # Format and return the results
+    # Look up the matching genres and their songs in one query
+    songs = _fetch_columns(SONGS_BY_GENRE_SQL, {"pattern": f"%{genre}%"})
     if not songs:
         return f"No songs found for the genre: {genre}"
-    
-    formatted_songs = ast.literal_eval(songs)
-    return [
-        {"Song": song["SongName"], "Artist": song["ArtistName"]}
-        for song in formatted_songs
-    ]
+    return songs
 
 
 @tool
 def check_for_songs(song_title):
     """Check if a song exists by its name."""
-    db = get_db_connection()
-    return db.run(
-        f"""
-        SELECT * FROM Track WHERE Name LIKE '%{song_title}%';
-        """,
-        include_columns=True
-    )
+    return _fetch_columns(SONGS_BY_TITLE_SQL, {"pattern": f"%{song_title}%"})
 
 
 # Invoice tools
 @tool 
 def get_invoices_by_customer_sorted_by_date(customer_id: str):
-    """Look up all invoices for a customer using their ID."""
-    db = get_db_connection()
-    return db.run(
-        f"SELECT * FROM Invoice WHERE CustomerId = {customer_id} ORDER BY InvoiceDate DESC;",
-        include_columns=True
+    """Look up a customer's most recent invoices (up to 20, newest first) using their ID."""
+    return _fetch_limited_columns(
+        INVOICES_BY_DATE_SQL, {"customer_id": int(customer_id)}, INVOICE_RESULT_LIMIT
     )
 
 
 @tool 
 def get_invoices_sorted_by_unit_price(customer_id: str):
-    """Look up all invoices for a customer, sorted by unit price."""
-    db = get_db_connection()
-    query = f"""
-        SELECT Invoice.*, InvoiceLine.UnitPrice
-        FROM Invoice
-        JOIN InvoiceLine ON Invoice.InvoiceId = InvoiceLine.InvoiceId
-        WHERE Invoice.CustomerId = {customer_id}
-        ORDER BY InvoiceLine.UnitPrice DESC;
-    """
-    return db.run(query, include_columns=True)
+    """Look up a customer's invoice lines with the highest unit price (up to 20, most expensive first)."""
+    return _fetch_limited_columns(
+        INVOICES_BY_UNIT_PRICE_SQL, {"customer_id": int(customer_id)}, INVOICE_RESULT_LIMIT
+    )
 
 
 @tool
 def get_employee_by_invoice_and_customer(invoice_id: str, customer_id: str):
     """Get employee information associated with an invoice and customer."""
-    db = get_db_connection()
-    query = f"""
-        SELECT Employee.FirstName, Employee.Title, Employee.Email
-        FROM Employee
-        JOIN Customer ON Customer.SupportRepId = Employee.EmployeeId
-        JOIN Invoice ON Invoice.CustomerId = Customer.CustomerId
-        WHERE Invoice.InvoiceId = ({invoice_id}) AND Invoice.CustomerId = ({customer_id});
-    """
-    employee_info = db.run(query, include_columns=True)
+    employee_info = _fetch_columns(
+        EMPLOYEE_BY_INVOICE_SQL,
+        {"invoice_id": int(invoice_id), "customer_id": int(customer_id)}
+    )
     
     if not employee_info:
         return f"No employee found for invoice ID {invoice_id} and customer identifier {customer_id}."
@@ -513,31 +979,51 @@ def get_customer_id_from_identifier(identifier: str) -> Optional[int]:
     """
     Retrieve Customer ID using an identifier (ID, email, or phone).
     """
-    db = get_db_connection()
-    
-    # Check if identifier is a customer ID
-    if identifier.isdigit():
+    # Classify the identifier as a customer ID, phone number or email in one match
+    match = _IDENTIFIER_RE.fullmatch(identifier)
+    if not match:
+        return None
+    if match.lastgroup == "customer_id":
         return int(identifier)
     
-    # Check if identifier is a phone number
-    elif identifier[0] == "+":
-        query = f"SELECT CustomerId FROM Customer WHERE Phone = '{identifier}';"
-        result = db.run(query)
-        import ast
-        formatted_result = ast.literal_eval(result)
-        if formatted_result:
-            return formatted_result[0][0]
-    
-    # Check if identifier is an email
-    elif "@" in identifier:
-        query = f"SELECT CustomerId FROM Customer WHERE Email = '{identifier}';"
-        result = db.run(query)
-        import ast
-        formatted_result = ast.literal_eval(result)
-        if formatted_result:
-            return formatted_result[0][0]
+    db = get_db_connection()
+    query = CUSTOMER_BY_PHONE_SQL if match.lastgroup == "phone" else CUSTOMER_BY_EMAIL_SQL
+    return db.run(query, fetch="cursor", parameters={"identifier": identifier}).scalar()
+
+
+# Append one JSON entry to metadata.agent_history in place, creating the list if missing
+_APPEND_AGENT_HISTORY_SQL = {
+    "sqlite": (
+        "json_insert(json_set(COALESCE(metadata, '{}'), '$.agent_history', "
+        "json(COALESCE(json_extract(metadata, '$.agent_history'), '[]'))), "
+        "'$.agent_history[#]', json(%s))"
+    ),
+    "postgresql": (
+        "jsonb_set(COALESCE(metadata, '{}'::jsonb), '{agent_history}', "
+        "COALESCE(metadata->'agent_history', '[]'::jsonb) || jsonb_build_array(%s::jsonb))"
+    ),
+}
+
+
+def _append_agent_history(conversation, entry):
+    """
+    Persist an agent history entry that was already appended to conversation.metadata
     
-    return None 
+    Args:
+        conversation: The conversation object
+        entry: The agent history entry
+    """
+    now = timezone.now()
+    sql = _APPEND_AGENT_HISTORY_SQL.get(db_connection.vendor)
+    if sql:
+        Conversation.objects.filter(pk=conversation.pk).update(
+            metadata=RawSQL(sql, [json.dumps(entry)]),
+            updated_at=now,
+        )
+        conversation.updated_at = now
+    else:
+        # No in-place JSON append on this backend, write the updated metadata
+        conversation.save(update_fields=["metadata", "updated_at"])
 
 
 def save_detailed_chat_history(conversation, message, agent_type=None, message_id=None):
@@ -553,12 +1039,7 @@ def save_detailed_chat_history(conversation, message, agent_type=None, message_i
     try:
         # If agent type not provided, try to detect it from the message
         if not agent_type:
-            if "music" in message.lower() or "song" in message.lower() or "artist" in message.lower():
-                agent_type = "music_catalog_subagent"
-            elif "invoice" in message.lower() or "purchase" in message.lower():
-                agent_type = "invoice_information_subagent"
-            else:
-                agent_type = "supervisor_agent"
+            agent_type = detect_agent_type(message)
                 
         # Add metadata to conversation if it doesn't exist
         if not hasattr(conversation, "metadata") or not conversation.metadata:
@@ -581,8 +1062,8 @@ def save_detailed_chat_history(conversation, message, agent_type=None, message_i
             
         conversation.metadata["agent_history"].append(entry)
         
-        # Save conversation with updated metadata
-        conversation.save()
+        # Append the entry in the database without rewriting the whole row
+        _append_agent_history(conversation, entry)
         
     except Exception as e:
         print(f"Error saving detailed chat history: {str(e)}") 
\ No newline at end of file
@@ -1,22 +1,36 @@
-import uuid
-import json
-from django.shortcuts import render, get_object_or_404, redirect
+import hashlib
+import platform
+import time
+from functools import lru_cache
+
+import orjson
+import psutil
+from django.shortcuts import render, get_object_or_404
+from django.urls import get_script_prefix, reverse
 from django.contrib.auth.models import User
 from django.conf import settings
-from django.http import JsonResponse
+from django.http import HttpResponse, HttpResponseRedirect, JsonResponse, StreamingHttpResponse
 from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_GET
+from django.views.decorators.cache import cache_control
+from django.views.decorators.vary import vary_on_cookie
+from django.utils.cache import get_conditional_response
+from django.utils.http import quote_etag
 from django.utils.decorators import method_decorator
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import authenticate, login, logout
 from django.contrib import messages
 from django.utils import timezone
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import BooleanField, Case, Count, Exists, Max, OuterRef, Prefetch, Q, Subquery, Value, When
+from django.db.models.functions import Substr
 
 from rest_framework import viewsets, status, permissions
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.decorators import api_view, permission_classes, action
-
-from langchain_core.messages import AIMessage
+from rest_framework.throttling import AnonRateThrottle, UserRateThrottle
 
 from .models import (
     LLMModel, Tool, AgentType, UserProfile, UserPreference, 
@@ -27,23 +41,62 @@ from .serializers import (
     UserProfileSerializer, UserPreferenceSerializer, ConversationSerializer,
     ConversationListSerializer, MessageSerializer, AgentConfigSerializer,
     DatabaseSerializer, ChatInputSerializer, ChatResponseSerializer,
-    ContinueChatSerializer
-)
-from .agent_builder import (
-    build_complete_agent_system, run_agent_with_input
+    ContinueChatSerializer, ConversationPreviewSerializer, PREVIEW_LENGTH,
+    CONVERSATION_LIST_VALUES, conversation_list_item
 )
-from .utils import save_detailed_chat_history
+from .tasks import queue_agent_task, get_task_state, iter_task_events, TASK_QUEUED
+from .utils import clear_active_db_cache, clear_active_llm_cache, get_active_llm_info
+
+
+# Cached conversation list per user, keyed by a fingerprint of the list's contents
+CONVERSATION_LIST_CACHE_KEY = "convlist:{user_id}:{updated}:{conversations}:{messages}:{last_message}"
+CONVERSATION_LIST_CACHE_TTL = 300
+
+# Conversation columns loaded when metadata (a potentially large JSON column) isn't needed
+THIN_CONVERSATION_FIELDS = ('id', 'thread_id', 'user_id', 'title', 'updated_at')
+
+# LLM details system_info reports when no model is active (the model get_llm falls back to);
+# shared by every response, so it must not be mutated
+DEFAULT_LLM_INFO = {
+    'name': 'Default Ollama',
+    'provider': 'ollama',
+    'temperature': 0.0
+}
+
+
+class ChatThrottle(UserRateThrottle):
+    """Per-user limit on messages sent to the agent, shared by every endpoint that queues a run"""
+    scope = 'chat'
+
 
+class SystemInfoThrottle(UserRateThrottle):
+    """Per-user limit on system information lookups"""
+    scope = 'system_info'
 
-# Cache for the agent system
-_AGENT_SYSTEM = None
 
-def get_agent_system():
-    """Get or create the agent system"""
-    global _AGENT_SYSTEM
-    if _AGENT_SYSTEM is None:
-        _AGENT_SYSTEM = build_complete_agent_system()
-    return _AGENT_SYSTEM
+class LoginThrottle(AnonRateThrottle):
+    """Per-IP limit on login attempts, each of which hashes the submitted password"""
+    scope = 'login'
+
+
+def activate_only(queryset, pk, **fields):
+    """
+    Mark one row active and every other active row inactive in a single UPDATE
+    
+    Readers never see zero or two active rows in between.
+    
+    Args:
+        queryset: Rows of a model with an is_active flag
+        pk: Primary key of the row to activate
+        **fields: Other fields to set on the changed rows
+        
+    Returns:
+        Number of rows updated
+    """
+    return queryset.filter(Q(is_active=True) | Q(pk=pk)).update(
+        is_active=Case(When(pk=pk, then=Value(True)), default=Value(False), output_field=BooleanField()),
+        **fields
+    )
 
 
 class UserViewSet(viewsets.ModelViewSet):
@@ -61,25 +114,13 @@ class UserViewSet(viewsets.ModelViewSet):
     @action(detail=False, methods=['post'])
     def bulk_delete(self, request):
         """Delete multiple users at once"""
-        user_ids = request.data.get('user_ids', [])
-        
         # Prevent deleting the current user
-        if request.user.id in user_ids:
-            user_ids.remove(request.user.id)
-        
-        # Prevent deleting superusers (optional security measure)
-        superuser_ids = list(User.objects.filter(
-            id__in=user_ids, 
-            is_superuser=True
-        ).values_list('id', flat=True))
-        
-        for superuser_id in superuser_ids:
-            user_ids.remove(superuser_id)
+        user_ids = set(request.data.get('user_ids', [])) - {request.user.id}
         
-        # Delete the users
+        # Delete the users, skipping superusers (optional security measure)
         deleted_count = 0
         if user_ids:
-            deleted_count = User.objects.filter(id__in=user_ids).delete()[0]
+            deleted_count = User.objects.filter(id__in=user_ids, is_superuser=False).delete()[0]
         
         return Response({
             'status': 'success',
@@ -94,13 +135,26 @@ class LLMModelViewSet(viewsets.ModelViewSet):
     serializer_class = LLMModelSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    # get_llm caches the active model's configuration
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        clear_active_llm_cache()
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        clear_active_llm_cache()
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        clear_active_llm_cache()
+    
     @action(detail=True, methods=['post'])
     def set_active(self, request, pk=None):
         """Set this model as active and deactivate others"""
         model = self.get_object()
-        LLMModel.objects.all().update(is_active=False)
-        model.is_active = True
-        model.save()
+        # update() bypasses auto_now, so stamp updated_at on the rows it changes
+        activate_only(LLMModel.objects.all(), model.pk, updated_at=timezone.now())
+        clear_active_llm_cache()
         return Response({'status': 'model activated'})
 
 
@@ -120,7 +174,8 @@ class AgentTypeViewSet(viewsets.ModelViewSet):
 
 class UserProfileViewSet(viewsets.ModelViewSet):
     """API endpoint for user profiles"""
-    queryset = UserProfile.objects.all()
+    # Load the nested user and preferences with the profiles instead of per row
+    queryset = UserProfile.objects.select_related('user').prefetch_related('preferences')
     serializer_class = UserProfileSerializer
     permission_classes = [permissions.IsAuthenticated]
 
@@ -134,13 +189,79 @@ class ConversationViewSet(viewsets.ModelViewSet):
     def get_queryset(self):
         """Filter conversations by user"""
         user = self.request.user
-        return Conversation.objects.filter(user=user)
+        queryset = Conversation.objects.filter(user=user)
+        
+        # Load the user and all messages up front for the nested ConversationSerializer.
+        # Only for retrieve: other actions either don't serialize messages or change them
+        # after fetching the conversation, which would leave the prefetch stale.
+        if self.action == 'retrieve':
+            if self.wants_preview():
+                # Leave the full bodies in the database and fetch just the preview
+                messages = Message.objects.only(
+                    'id', 'role', 'tool_call_id', 'name', 'created_at', 'conversation_id'
+                ).annotate(content_preview=Substr('content', 1, PREVIEW_LENGTH + 1))
+            else:
+                messages = Message.objects.only(
+                    'id', 'role', 'content', 'tool_call_id', 'name', 'created_at', 'conversation_id'
+                )
+            queryset = queryset.select_related('user').prefetch_related(
+                Prefetch('messages', queryset=messages)
+            )
+        return queryset
+    
+    def get_thin_conversation(self, thread_id, queryset=None):
+        """Get one of the user's conversations without its metadata, for actions that don't read it"""
+        queryset = self.get_queryset() if queryset is None else queryset
+        return get_object_or_404(queryset.only(*THIN_CONVERSATION_FIELDS), thread_id=thread_id)
+    
+    def wants_preview(self):
+        """Whether the request asked for message previews (?preview=1)"""
+        return self.request.query_params.get('preview') in ('1', 'true')
+    
+    def get_serializer_class(self):
+        if self.action == 'retrieve' and self.wants_preview():
+            return ConversationPreviewSerializer
+        return super().get_serializer_class()
+    
+    def annotate_for_list(self, queryset):
+        """Annotate what ConversationListSerializer needs so it runs no query per row"""
+        last_message = Message.objects.filter(
+            conversation=OuterRef('pk')
+        ).order_by('-created_at', '-id')[:1]
+        return queryset.annotate(
+            message_count=Count('messages'),
+            last_message_role=Subquery(last_message.values('role')),
+            # One character past the preview length is enough to know whether to add '...'
+            last_message_content=Subquery(last_message.values(preview=Substr('content', 1, PREVIEW_LENGTH + 1))),
+            last_message_created_at=Subquery(last_message.values('created_at')),
+        )
     
     def list(self, request):
         """Use lightweight serializer for list view"""
-        queryset = self.get_queryset().order_by('-updated_at')
-        serializer = ConversationListSerializer(queryset, many=True)
-        return Response(serializer.data)
+        # Any write to the user's conversations or their messages changes the key,
+        # so repeated polls between writes skip the list query and serialization
+        state = self.get_queryset().aggregate(
+            updated=Max('updated_at'),
+            conversations=Count('id', distinct=True),
+            message_count=Count('messages'),
+            last_message_id=Max('messages__id'),
+        )
+        key = CONVERSATION_LIST_CACHE_KEY.format(
+            user_id=request.user.id,
+            updated=state['updated'].timestamp() if state['updated'] else 0,
+            conversations=state['conversations'],
+            messages=state['message_count'],
+            last_message=state['last_message_id'] or 0,
+        )
+        data = cache.get(key)
+        if data is None:
+            # Same output as ConversationListSerializer, built straight from value rows
+            rows = self.annotate_for_list(self.get_queryset()).order_by('-updated_at').values(
+                *CONVERSATION_LIST_VALUES
+            )
+            data = [conversation_list_item(row) for row in rows]
+            cache.set(key, data, CONVERSATION_LIST_CACHE_TTL)
+        return Response(data)
     
     def retrieve(self, request, thread_id=None):
         """Get a single conversation by thread_id"""
@@ -150,10 +271,9 @@ class ConversationViewSet(viewsets.ModelViewSet):
     
     def create(self, request):
         """Create a new conversation"""
-        thread_id = str(uuid.uuid4())
+        # thread_id defaults to a new uuid7, kept as a UUID instead of formatted and re-parsed
         conversation = Conversation.objects.create(
             user=request.user,
-            thread_id=thread_id,
             title=request.data.get('title', 'New Conversation')
         )
         serializer = ConversationListSerializer(conversation)
@@ -166,140 +286,70 @@ class ConversationViewSet(viewsets.ModelViewSet):
         # Only title can be updated
         if 'title' in request.data:
             conversation.title = request.data['title']
-            conversation.save()
+            conversation.save(update_fields=['title', 'updated_at'])
             
         serializer = ConversationListSerializer(conversation)
         return Response(serializer.data)
         
     def destroy(self, request, thread_id=None):
         """Delete a conversation"""
-        conversation = get_object_or_404(self.get_queryset(), thread_id=thread_id)
+        conversation = self.get_thin_conversation(thread_id)
         conversation.delete()
         return Response(status=status.HTTP_204_NO_CONTENT)
     
-    @action(detail=True, methods=['post'])
+    @action(detail=True, methods=['post'], throttle_classes=[ChatThrottle])
     def continue_from_message(self, request, thread_id=None):
         """Continue a conversation from a specific message"""
         serializer = ContinueChatSerializer(data=request.data)
         if not serializer.is_valid():
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
         
-        conversation = get_object_or_404(self.get_queryset(), thread_id=thread_id)
         message_id = serializer.validated_data.get('continue_from_message_id')
         user_input = serializer.validated_data['message']
         
-        # Get all messages up to the specified message
-        if message_id:
-            # Get the message to continue from
-            try:
-                continue_from = Message.objects.get(id=message_id, conversation=conversation)
-                # Delete all messages after this one
+        # Rewind and add the new message in one transaction, holding the conversation
+        # row so concurrent continues on the same thread can't interleave
+        with transaction.atomic():
+            conversation = self.get_thin_conversation(thread_id, self.get_queryset().select_for_update())
+            
+            # Delete all messages after the specified one, in a single DELETE that
+            # only matches when that message belongs to this conversation (if it
+            # doesn't, just add to the end). Ids increase with insertion order,
+            # unlike created_at, which messages saved together can share
+            if message_id:
                 Message.objects.filter(
+                    Exists(Message.objects.filter(id=message_id, conversation=conversation)),
                     conversation=conversation,
-                    created_at__gt=continue_from.created_at
+                    id__gt=message_id
                 ).delete()
-            except Message.DoesNotExist:
-                pass  # If message doesn't exist, just add to the end
-        
-        # Add new user message
-        user_message = Message.objects.create(
-            conversation=conversation,
-            role='user',
-            content=user_input
-        )
-        
-        # Process with the agent
-        agent_system = get_agent_system()
-        try:
-            result = run_agent_with_input(
-                agent_system,
-                user_input,
-                thread_id=conversation.thread_id,
-                user_id=str(request.user.id)
-            )
-            
-            # Process the result
-            if result['status'] == 'complete':
-                # Extract final assistant message
-                final_messages = result['result']['messages']
-                final_message = None
-                
-                # Look for the last AI message
-                for msg in reversed(final_messages):
-                    if hasattr(msg, 'type') and msg.type == 'ai':
-                        final_message = msg
-                        break
-                    elif isinstance(msg, dict) and msg.get('type') == 'ai':
-                        final_message = msg
-                        break
-                    elif hasattr(msg, 'role') and msg.role == 'assistant':
-                        final_message = msg
-                        break
-                    elif isinstance(msg, AIMessage):
-                        final_message = msg
-                        break
-                
-                if final_message:
-                    # Get content
-                    content = ""
-                    if hasattr(final_message, 'content'):
-                        content = final_message.content
-                    elif isinstance(final_message, dict) and 'content' in final_message:
-                        content = final_message['content']
-                    
-                    # Determine agent type
-                    agent_type = "unknown_agent"
-                    if "music" in user_input.lower() or "song" in user_input.lower():
-                        agent_type = "music_catalog_subagent"
-                    elif "invoice" in user_input.lower():
-                        agent_type = "invoice_information_subagent"
-                    else:
-                        agent_type = "supervisor_agent"
-                    
-                    # Save assistant message
-                    assistant_message = Message.objects.create(
-                        conversation=conversation,
-                        role='assistant',
-                        content=content
-                    )
-                    
-                    # Save detailed chat history with agent info
-                    save_detailed_chat_history(
-                        conversation, 
-                        content, 
-                        agent_type,
-                        assistant_message.id
-                    )
-                    
-                    # Update conversation timestamp
-                    conversation.updated_at = timezone.now()
-                    conversation.save()
-                    
-                    # Return updated conversation
-                    serializer = self.get_serializer(conversation)
-                    return Response(serializer.data)
             
-            # Handle error or interrupted status
-            return Response({
-                'status': result['status'],
-                'message': result.get('message', 'Error processing request')
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-        except Exception as e:
-            return Response({
-                'status': 'error',
-                'message': str(e)
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+            # Add new user message
+            Message.objects.create(
+                conversation=conversation,
+                role='user',
+                content=user_input
+            )
+        
+        # Process with the agent in a worker; the client polls the task for the reply
+        task_id = queue_agent_task(conversation, str(request.user.id), user_input=user_input)
+        return Response({
+            'status': TASK_QUEUED,
+            'task_id': task_id,
+            'thread_id': conversation.thread_id
+        }, status=status.HTTP_202_ACCEPTED)
     
     @action(detail=True, methods=['delete'])
     def clear_history(self, request, thread_id=None):
         """Clear conversation history but keep the conversation"""
-        conversation = get_object_or_404(self.get_queryset(), thread_id=thread_id)
-        Message.objects.filter(conversation=conversation).delete()
-        
-        # Reset metadata
-        conversation.metadata = {'agent_history': []}
-        conversation.save()
+        conversation = self.get_thin_conversation(thread_id)
+        with transaction.atomic():
+            Message.objects.filter(conversation=conversation).delete()
+            
+            # Reset metadata with a narrow UPDATE instead of rewriting the whole row
+            Conversation.objects.filter(pk=conversation.pk).update(
+                metadata={'agent_history': []},
+                updated_at=timezone.now()
+            )
         
         return Response({'status': 'history cleared'})
 
@@ -314,9 +364,7 @@ class AgentConfigViewSet(viewsets.ModelViewSet):
     def set_active(self, request, pk=None):
         """Set this config as active and deactivate others"""
         config = self.get_object()
-        AgentConfig.objects.all().update(is_active=False)
-        config.is_active = True
-        config.save()
+        activate_only(AgentConfig.objects.all(), config.pk)
         return Response({'status': 'config activated'})
 
 
@@ -326,13 +374,25 @@ class DatabaseViewSet(viewsets.ModelViewSet):
     serializer_class = DatabaseSerializer
     permission_classes = [permissions.IsAuthenticated]
     
+    # The agent tools cache the active database's connection string
+    def perform_create(self, serializer):
+        super().perform_create(serializer)
+        clear_active_db_cache()
+    
+    def perform_update(self, serializer):
+        super().perform_update(serializer)
+        clear_active_db_cache()
+    
+    def perform_destroy(self, instance):
+        super().perform_destroy(instance)
+        clear_active_db_cache()
+    
     @action(detail=True, methods=['post'])
     def set_active(self, request, pk=None):
         """Set this database as active and deactivate others"""
         db = self.get_object()
-        Database.objects.all().update(is_active=False)
-        db.is_active = True
-        db.save()
+        activate_only(Database.objects.all(), db.pk)
+        clear_active_db_cache()
         return Response({'status': 'database activated'})
 
 
@@ -340,6 +400,7 @@ class DatabaseViewSet(viewsets.ModelViewSet):
 class ChatView(APIView):
     """API endpoint for chat interactions"""
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ChatThrottle]
     
     def post(self, request):
         """Process a chat message"""
@@ -352,222 +413,41 @@ class ChatView(APIView):
         thread_id = serializer.validated_data.get('thread_id', '')
         user_id = str(request.user.id)
         
-        # Get or create conversation
-        if thread_id:
-            conversation = get_object_or_404(
-                Conversation, thread_id=thread_id, user=request.user
-            )
-        else:
-            conversation = Conversation.objects.create(
-                user=request.user,
-                thread_id=str(uuid.uuid4()),
-                title=message[:50]  # Use first 50 chars as title
-            )
-            thread_id = conversation.thread_id
-        
-        # Save user message
-        user_message = Message.objects.create(
-            conversation=conversation,
-            role='user',
-            content=message
-        )
-        
-        # Get agent system
-        agent_system = get_agent_system()
-        
-        try:
-            # Process message with agent
-            result = run_agent_with_input(
-                agent_system, 
-                message, 
-                thread_id=thread_id,
-                user_id=user_id
-            )
-            
-            # Check if interrupted (needs user input)
-            if result['status'] == 'interrupted':
-                # Save system message requesting input
-                assistant_message = Message.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content=result['message']
-                )
-                
-                # Save detailed chat history with agent info
-                save_detailed_chat_history(
-                    conversation, 
-                    result['message'], 
-                    "supervisor_agent",
-                    assistant_message.id
-                )
-                
-                return Response({
-                    'status': 'interrupted',
-                    'thread_id': thread_id,
-                    'message': result['message'],
-                    'requires_input': True
-                })
-            
-            # Check for error
-            elif result['status'] == 'error':
-                error_message = f"Error processing message: {result['message']}"
-                if 'error_details' in result:
-                    print(f"Detailed error: {result['error_details']}")
-                
-                # Save error message
-                assistant_message = Message.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content="I'm sorry, I encountered an error processing your request. Let me try a different approach."
+        # Get or create the conversation and save the user message in one transaction
+        with transaction.atomic():
+            if thread_id:
+                conversation = get_object_or_404(
+                    Conversation.objects.select_for_update().only(*THIN_CONVERSATION_FIELDS),
+                    thread_id=thread_id, user=request.user
                 )
-                
-                # Save detailed chat history with agent info
-                save_detailed_chat_history(
-                    conversation, 
-                    "Error processing request", 
-                    "error_handler",
-                    assistant_message.id
-                )
-                
-                # Try a simplified approach - just use a default response
-                assistant_message2 = Message.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content="I'm having trouble with our AI system at the moment. Please try again later or contact customer support for immediate assistance."
-                )
-                
-                # Save detailed chat history
-                save_detailed_chat_history(
-                    conversation, 
-                    assistant_message2.content, 
-                    "fallback_handler",
-                    assistant_message2.id
-                )
-                
-                return Response({
-                    'status': 'error',
-                    'thread_id': thread_id,
-                    'message': error_message,
-                    'response': "I'm having trouble with our AI system at the moment. Please try again later or contact customer support for immediate assistance."
-                })
-            
-            # Process successful response
             else:
-                # Extract final assistant message
-                final_messages = result['result']['messages']
-                final_message = None
-                
-                # Look for the last AI message in the list
-                for msg in reversed(final_messages):
-                    # Check for different message type formats
-                    if hasattr(msg, 'type') and msg.type == 'ai':
-                        final_message = msg
-                        break
-                    elif isinstance(msg, dict) and msg.get('type') == 'ai':
-                        final_message = msg
-                        break
-                    elif hasattr(msg, 'role') and msg.role == 'assistant':
-                        final_message = msg
-                        break
-                    elif isinstance(msg, AIMessage):
-                        final_message = msg
-                        break
-                
-                if final_message:
-                    # Get content based on message format
-                    content = ""
-                    if hasattr(final_message, 'content'):
-                        content = final_message.content
-                    elif isinstance(final_message, dict) and 'content' in final_message:
-                        content = final_message['content']
-                    
-                    # Determine which agent handled the request
-                    agent_type = "unknown_agent"
-                    if "music" in message.lower() or "song" in message.lower() or "artist" in message.lower():
-                        agent_type = "music_catalog_subagent"
-                    elif "invoice" in message.lower() or "purchase" in message.lower():
-                        agent_type = "invoice_information_subagent"
-                    else:
-                        agent_type = "supervisor_agent"
-                    
-                    # Save assistant message
-                    assistant_message = Message.objects.create(
-                        conversation=conversation,
-                        role='assistant',
-                        content=content
-                    )
-                    
-                    # Save detailed chat history with agent info
-                    save_detailed_chat_history(
-                        conversation, 
-                        content, 
-                        agent_type,
-                        assistant_message.id
-                    )
-                    
-                    return Response({
-                        'status': 'complete',
-                        'thread_id': thread_id,
-                        'response': content,
-                        'agent_type': agent_type
-                    })
-                else:
-                    # No assistant message found, provide a fallback
-                    fallback_message = "I processed your request but couldn't generate a proper response. Please try again."
-                    
-                    # Save fallback message
-                    assistant_message = Message.objects.create(
-                        conversation=conversation,
-                        role='assistant',
-                        content=fallback_message
-                    )
-                    
-                    # Save detailed chat history
-                    save_detailed_chat_history(
-                        conversation, 
-                        fallback_message, 
-                        "fallback_handler",
-                        assistant_message.id
-                    )
-                    
-                    return Response({
-                        'status': 'complete',
-                        'thread_id': thread_id,
-                        'response': fallback_message,
-                        'agent_type': 'fallback_handler'
-                    })
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"Error in ChatView: {error_details}")
+                conversation = Conversation.objects.create(
+                    user=request.user,
+                    title=message[:50]  # Use first 50 chars as title
+                )
+                thread_id = conversation.thread_id
             
-            # Save error message
-            assistant_message = Message.objects.create(
+            # Save user message
+            Message.objects.create(
                 conversation=conversation,
-                role='assistant',
-                content="I'm sorry, I encountered an unexpected error. Please try again."
+                role='user',
+                content=message
             )
-            
-            # Save detailed chat history
-            save_detailed_chat_history(
-                conversation,
-                assistant_message.content,
-                "error_handler",
-                assistant_message.id
-            )
-            
-            return Response({
-                'status': 'error',
-                'thread_id': thread_id,
-                'message': f"Error processing message: {str(e)}",
-                'response': "I'm sorry, I encountered an unexpected error. Please try again."
-            })
+        
+        # Process message with agent in a worker; the client polls the task for the reply
+        task_id = queue_agent_task(conversation, user_id, user_input=message)
+        return Response({
+            'status': TASK_QUEUED,
+            'task_id': task_id,
+            'thread_id': thread_id
+        }, status=status.HTTP_202_ACCEPTED)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
 class ChatResumeView(APIView):
     """API endpoint for resuming interrupted chats"""
     permission_classes = [permissions.IsAuthenticated]
+    throttle_classes = [ChatThrottle]
     
     def post(self, request, thread_id):
         """Resume a chat after an interrupt"""
@@ -580,7 +460,7 @@ class ChatResumeView(APIView):
         
         # Get conversation
         conversation = get_object_or_404(
-            Conversation, thread_id=thread_id, user=request.user
+            Conversation.objects.only(*THIN_CONVERSATION_FIELDS), thread_id=thread_id, user=request.user
         )
         
         # Extract data
@@ -594,222 +474,163 @@ class ChatResumeView(APIView):
             content=message
         )
         
-        # Get agent system
-        agent_system = get_agent_system()
-        
-        try:
-            # Resume with user input
-            result = run_agent_with_input(
-                agent_system,
-                None,  # No initial message when resuming
-                thread_id=thread_id,
-                user_id=user_id,
-                resume_input=message
-            )
-            
-            # Check if interrupted again (needs more user input)
-            if result['status'] == 'interrupted':
-                # Save system message requesting input
-                Message.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content=result['message']
-                )
-                
-                return Response({
-                    'status': 'interrupted',
-                    'thread_id': thread_id,
-                    'message': result['message'],
-                    'requires_input': True
-                })
-            
-            # Check for error
-            elif result['status'] == 'error':
-                error_message = f"Error processing message: {result['message']}"
-                if 'error_details' in result:
-                    print(f"Detailed error: {result['error_details']}")
-                
-                # Save error message
-                Message.objects.create(
-                    conversation=conversation,
-                    role='assistant',
-                    content="I'm sorry, I encountered an error processing your request. Let me try again."
-                )
-                
-                # Try again with a fresh conversation
-                fresh_result = run_agent_with_input(
-                    agent_system,
-                    message,  # Use the message as a fresh input
-                    thread_id=thread_id,
-                    user_id=user_id
-                )
-                
-                # Process the fresh result
-                if fresh_result['status'] == 'complete':
-                    # Extract final assistant message
-                    final_messages = fresh_result['result']['messages']
-                    final_message = None
-                    
-                    # Look for the last AI message in the list
-                    for msg in reversed(final_messages):
-                        # Check for different message type formats
-                        if hasattr(msg, 'type') and msg.type == 'ai':
-                            final_message = msg
-                            break
-                        elif isinstance(msg, dict) and msg.get('type') == 'ai':
-                            final_message = msg
-                            break
-                        elif hasattr(msg, 'role') and msg.role == 'assistant':
-                            final_message = msg
-                            break
-                        elif isinstance(msg, AIMessage):
-                            final_message = msg
-                            break
-                    
-                    if final_message:
-                        # Get content based on message format
-                        content = ""
-                        if hasattr(final_message, 'content'):
-                            content = final_message.content
-                        elif isinstance(final_message, dict) and 'content' in final_message:
-                            content = final_message['content']
-                        
-                        # Save assistant message
-                        Message.objects.create(
-                            conversation=conversation,
-                            role='assistant',
-                            content=content
-                        )
-                        
-                        return Response({
-                            'status': 'complete',
-                            'thread_id': thread_id,
-                            'response': content
-                        })
-                
-                # If fresh attempt also failed, return error
-                return Response({
-                    'status': 'error',
-                    'thread_id': thread_id,
-                    'message': error_message
-                }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-            
-            # Process successful response
-            else:
-                # Extract final assistant message
-                final_messages = result['result']['messages']
-                final_message = None
-                
-                # Look for the last AI message in the list
-                for msg in reversed(final_messages):
-                    # Check for different message type formats
-                    if hasattr(msg, 'type') and msg.type == 'ai':
-                        final_message = msg
-                        break
-                    elif isinstance(msg, dict) and msg.get('type') == 'ai':
-                        final_message = msg
-                        break
-                    elif hasattr(msg, 'role') and msg.role == 'assistant':
-                        final_message = msg
-                        break
-                    elif isinstance(msg, AIMessage):
-                        final_message = msg
-                        break
-                
-                if final_message:
-                    # Get content based on message format
-                    content = ""
-                    if hasattr(final_message, 'content'):
-                        content = final_message.content
-                    elif isinstance(final_message, dict) and 'content' in final_message:
-                        content = final_message['content']
-                    
-                    # Save assistant message
-                    Message.objects.create(
-                        conversation=conversation,
-                        role='assistant',
-                        content=content
-                    )
-                    
-                    return Response({
-                        'status': 'complete',
-                        'thread_id': thread_id,
-                        'response': content
-                    })
-                else:
-                    return Response({
-                        'status': 'error',
-                        'thread_id': thread_id,
-                        'message': "No assistant response found"
-                    }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
-        except Exception as e:
-            import traceback
-            error_details = traceback.format_exc()
-            print(f"Error in ChatResumeView: {error_details}")
-            
-            # Save error message
-            Message.objects.create(
-                conversation=conversation,
-                role='assistant',
-                content="I'm sorry, I encountered an unexpected error. Let's start fresh."
-            )
-            
-            return Response({
-                'status': 'error',
-                'thread_id': thread_id,
-                'message': f"Error processing message: {str(e)}"
-            }, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+        # Resume with user input in a worker; the client polls the task for the reply
+        task_id = queue_agent_task(conversation, user_id, resume_input=message)
+        return Response({
+            'status': TASK_QUEUED,
+            'task_id': task_id,
+            'thread_id': thread_id
+        }, status=status.HTTP_202_ACCEPTED)
 
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
-def system_info(request):
-    """Get system information"""
-    import platform
-    import psutil
+def task_status(request, task_id):
+    """Get the status of a queued agent run, and its reply once finished"""
+    task = get_task_state(task_id)
+    # Tasks are only visible to the user who queued them
+    if task is None or task.get('user_id') != str(request.user.id):
+        return Response({'error': 'Task not found'}, status=status.HTTP_404_NOT_FOUND)
     
-    # Get system info
-    system_info = {
+    return Response({
+        'task_id': task_id,
+        'status': task['status'],
+        'thread_id': task.get('thread_id'),
+        'result': task.get('result')
+    })
+
+
+@require_GET
+def task_events(request, task_id):
+    """Stream a queued agent run's reply as Server-Sent Events while it is generated"""
+    # A plain Django view: DRF's content negotiation would reject Accept: text/event-stream
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+    
+    task = get_task_state(task_id)
+    # Tasks are only visible to the user who queued them
+    if task is None or task.get('user_id') != str(request.user.id):
+        return JsonResponse({'error': 'Task not found'}, status=404)
+    
+    def events():
+        for event, data in iter_task_events(task_id):
+            if event is None:
+                # A comment line keeps proxies from closing an idle stream
+                yield ": keep-alive\n\n"
+            else:
+                yield f"event: {event}\ndata: {data}\n\n"
+    
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+@lru_cache(maxsize=1)
+def static_system_info():
+    """Get the platform details that stay the same for the life of the process"""
+    return {
         'os': platform.system(),
         'os_version': platform.version(),
         'architecture': platform.machine(),
+        # platform.processor() runs a subprocess on some systems
         'processor': platform.processor(),
         'cpu_count': psutil.cpu_count(),
-        'memory_total': psutil.virtual_memory().total,
-        'memory_available': psutil.virtual_memory().available,
+    }
+
+
+# How long (seconds) system_info reuses a memory reading
+MEMORY_STATS_TTL = 1.0
+# Last memory reading and the monotonic time it was taken
+_memory_stats = (None, float('-inf'))
+
+
+def memory_stats():
+    """
+    Get the current virtual memory statistics, read at most once per MEMORY_STATS_TTL
+    
+    Returns:
+        psutil's virtual_memory() result
+    """
+    global _memory_stats
+    stats, read_at = _memory_stats
+    now = time.monotonic()
+    if now - read_at >= MEMORY_STATS_TTL:
+        # Replace the tuple in one assignment so concurrent readers see a consistent pair
+        stats = psutil.virtual_memory()
+        _memory_stats = (stats, now)
+    return stats
+
+
+@require_GET
+def system_info(request):
+    """Get system information"""
+    # A plain Django view: the payload needs none of DRF's negotiation or rendering
+    if not request.user.is_authenticated:
+        return JsonResponse({'error': 'Authentication required'}, status=403)
+    
+    throttle = SystemInfoThrottle()
+    if not throttle.allow_request(request, None):
+        response = JsonResponse({'error': 'Request was throttled'}, status=429)
+        response['Retry-After'] = '%d' % (throttle.wait() or 0)
+        return response
+    
+    # Get system info; only the memory figures change while the process runs
+    memory = memory_stats()
+    system_info = {
+        **static_system_info(),
+        'memory_total': memory.total,
+        'memory_available': memory.available,
     }
     
-    # Get LLM info
-    active_model = LLMModel.objects.filter(is_active=True).first()
-    if active_model:
-        llm_info = {
-            'name': active_model.name,
-            'provider': active_model.provider,
-            'temperature': active_model.temperature
-        }
-    else:
-        llm_info = {
-            'name': 'Default Ollama',
-            'provider': 'ollama',
-            'temperature': 0.0
-        }
+    # Get LLM info (from the active model configuration cached for get_llm)
+    llm_info = get_active_llm_info() or DEFAULT_LLM_INFO
     
-    return Response({
-        'system': system_info,
-        'llm': llm_info
-    })
+    # Tag the payload by its values so a client polling with If-None-Match gets a
+    # bodiless 304 until the memory figures or the active model change
+    # (a digest of the values' repr, unlike hash(), is the same in every worker process)
+    etag = quote_etag(hashlib.blake2b(
+        repr((tuple(system_info.values()), tuple(llm_info.values()))).encode(), digest_size=8
+    ).hexdigest())
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        # orjson encodes the payload several times faster than JsonResponse's json.dumps
+        response = HttpResponse(orjson.dumps({
+            'system': system_info,
+            'llm': llm_info
+        }), content_type='application/json')
+    response['ETag'] = etag
+    return response
+
+
+@lru_cache(maxsize=None)
+def _url_path(name):
+    """Reverse a URL name once per process, without the script prefix"""
+    return reverse(name)[len(get_script_prefix()):]
+
+
+def url_for(name):
+    """Resolve a URL name under the current request's script prefix; the login and logout redirects reuse it"""
+    return get_script_prefix() + _url_path(name)
 
 
 def login_view(request):
     """Login view"""
     if request.method == 'POST':
+        # Refuse attempts over the rate before paying for the password hash
+        throttle = LoginThrottle()
+        if not throttle.allow_request(request, None):
+            messages.error(request, 'Too many login attempts. Please try again later.')
+            return render(request, 'agentsapp/login.html', status=429)
+        
         username = request.POST.get('username')
         password = request.POST.get('password')
         user = authenticate(request, username=username, password=password)
         
         if user is not None:
             login(request, user)
-            return redirect('index')
+            return HttpResponseRedirect(url_for('index'))
         else:
             messages.error(request, 'Invalid username or password')
     
@@ -818,8 +639,12 @@ def login_view(request):
 def logout_view(request):
     """Logout view"""
     logout(request)
-    return redirect('login')
+    return HttpResponseRedirect(url_for('login'))
 
+# The page is the same for every user (it loads their data from the API), so the
+# browser may reuse it briefly; Vary: Cookie keeps it from outliving a login or logout
+@cache_control(private=True, max_age=60)
+@vary_on_cookie
 @login_required
 def index(request):
     """Render the main chat interface"""